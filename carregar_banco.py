@@ -1,10 +1,11 @@
 import os
 import argparse
 import pandas as pd
-import geopandas as gpd
 from sqlalchemy import create_engine
 from tqdm import tqdm
 from dotenv import load_dotenv
+from db_builder.profiling import TableProfiler, save_profiles
+from db_builder.staging import staging_name, swap_tables, write_geo_table
 
 load_dotenv()
 
@@ -14,6 +15,18 @@ PG_DB = os.getenv("PG_DB")
 PG_USER = os.getenv("PG_USER")
 PG_PASSWORD = os.getenv("PG_PASSWORD")
 
+def publicar_tabela(engine, table_name):
+    """Troca a tabela publicada pela versão de staging em uma transação (leituras nunca veem a carga pela metade)"""
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"ANALYZE public.{staging_name(table_name)}")
+        conn.commit()
+        cur.close()
+        swap_tables(conn, "public", [table_name])
+    finally:
+        conn.close()
+
 def get_postgis_engine():
     user = PG_USER
     password = PG_PASSWORD
@@ -68,6 +81,8 @@ def carregar_csv(csv_path, engine, chunksize=10000):
     # 🔹 3. Lê em batches (chunks) e envia para o banco
     try:
         first_chunk = True
+        # Perfil de qualidade coletado sobre os mesmos chunks enviados ao banco
+        profiler = TableProfiler(table_name)
         with tqdm(total=total_linhas, unit="linhas", desc=f"→ {table_name}", ncols=100) as pbar:
             for chunk in pd.read_csv(
                 csv_path,
@@ -79,9 +94,11 @@ def carregar_csv(csv_path, engine, chunksize=10000):
             ):
                 if chunk.empty or len(chunk.columns) == 0:
                     continue
+                profiler.update(chunk)
 
+                # Carga em staging; a tabela publicada só é trocada no final
                 chunk.to_sql(
-                    table_name,
+                    staging_name(table_name),
                     engine,
                     if_exists="replace" if first_chunk else "append",
                     index=False,
@@ -91,7 +108,17 @@ def carregar_csv(csv_path, engine, chunksize=10000):
                 first_chunk = False
                 pbar.update(len(chunk))
 
-        print(f"✅ Tabela '{table_name}' criada no banco com sucesso!\n")
+        if first_chunk:
+            print(f"❌ Nenhuma linha lida de {csv_path}.\n")
+            return False
+        publicar_tabela(engine, table_name)
+        print(f"✅ Tabela '{table_name}' criada no banco com sucesso!")
+
+        try:
+            save_profiles(engine, "public", [profiler])
+            print("   📊 Perfil salvo em 'perfil_dados'.\n")
+        except Exception as e:
+            print(f"   ⚠️ Não foi possível salvar o perfil de '{table_name}': {e}\n")
         return True
 
     except Exception as e:
@@ -106,9 +133,11 @@ def carregar_shapefile(shp_path, engine):
     print(f"🗺️ Carregando Shapefile: {shp_path}")
     table_name = os.path.splitext(os.path.basename(shp_path))[0].lower()
 
+    import geopandas as gpd  # só quem carrega shapefiles paga a importação
     try:
         gdf = gpd.read_file(shp_path)
-        gdf.to_postgis(table_name, engine, if_exists='replace', index=False)
+        write_geo_table(gdf, staging_name(table_name), engine)
+        publicar_tabela(engine, table_name)
         print(f"✅ Tabela '{table_name}' criada no banco (PostGIS).")
         return True
     except Exception as e:
@@ -143,12 +172,11 @@ def processar_pasta_shp(shp_dir, engine):
 # ==========================
 # Função principal
 # ==========================
-def main():
-    parser = argparse.ArgumentParser(description="Carrega CSVs e Shapefiles em um banco PostGIS.")
+def add_arguments(parser):
     parser.add_argument("--csv_dir", type=str, help="Caminho da pasta com arquivos CSV.")
     parser.add_argument("--shp_dir", type=str, help="Caminho da pasta com shapefiles.")
-    args = parser.parse_args()
 
+def run(args):
     engine = get_postgis_engine()
 
     if args.csv_dir:
@@ -162,6 +190,11 @@ def main():
     if not args.csv_dir and not args.shp_dir:
         print("⚠️ Nenhum diretório informado. Use --csv_dir e/ou --shp_dir.")
 
+def main():
+    parser = argparse.ArgumentParser(description="Carrega CSVs e Shapefiles em um banco PostGIS.")
+    add_arguments(parser)
+    run(parser.parse_args())
+
 
 if __name__ == "__main__":
     main()
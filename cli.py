@@ -0,0 +1,146 @@
+"""
+Ponto de entrada único do projeto.
+
+Uso:
+    python cli.py load [--csv_dir PASTA] [--shp_dir PASTA]   # carga (pipeline do db_builder ou pastas avulsas)
+    python cli.py process                                  # processamento dos arquivos brutos
+    python cli.py analyze [--metrics]                      # mapas e gráficos (e métricas espaciais)
+    python cli.py gwr                                      # regressão geograficamente ponderada
+    python cli.py hotspots                                 # Gi* de todos os candidatos (tabela hotspots)
+    python cli.py refresh --file CSV [--ano 2022 --uf PR]  # atualização incremental da votação por seção
+    python cli.py bench suite --scale 0.05                 # benchmarks (ver db_builder/benchmark.py)
+
+Aqui só entram argparse e a biblioteca padrão: cada subcomando importa seus módulos
+(pandas, geopandas, matplotlib, libpysal/esda/mgwr...) ao ser executado, então
+`--help` e `load --csv_dir` não pagam a importação das pilhas de gráficos e estatística espacial.
+"""
+import argparse
+import os
+import sys
+
+# Os módulos do db_builder usam imports planos (from config import ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "db_builder"))
+
+
+def cmd_load(args):
+    if args.csv_dir or args.shp_dir:
+        import carregar_banco
+        carregar_banco.run(args)
+        return
+    from instrumentation import tracer
+    from config import TRACE_FILE, TRACE_EXPLAIN_SAMPLE
+    import main as pipeline
+    tracer.configure(output=TRACE_FILE, explain_sample=TRACE_EXPLAIN_SAMPLE)
+    try:
+        pipeline.load()
+    finally:
+        tracer.finish()
+
+
+def cmd_process(args):
+    from instrumentation import tracer
+    from config import TRACE_FILE, TRACE_EXPLAIN_SAMPLE
+    import main as pipeline
+    tracer.configure(output=TRACE_FILE, explain_sample=TRACE_EXPLAIN_SAMPLE)
+    try:
+        pipeline.process()
+    finally:
+        tracer.finish()
+
+
+def cmd_analyze(args):
+    import analysis
+    analysis.main()
+    if args.metrics:
+        from metrics_analysis import SpatialMetricsAnalysis
+        SpatialMetricsAnalysis().run_all()
+
+
+def cmd_gwr(args):
+    import extra_analysis
+    from db_manager import open_analysis_db
+    db = open_analysis_db()
+    try:
+        extra_analysis.main(db)
+    finally:
+        db.close()
+
+
+def cmd_hotspots(args):
+    from instrumentation import tracer
+    from config import TRACE_FILE, TRACE_EXPLAIN_SAMPLE
+    import hotspots
+    tracer.configure(output=TRACE_FILE, explain_sample=TRACE_EXPLAIN_SAMPLE)
+    try:
+        hotspots.main()
+    finally:
+        tracer.finish()
+
+
+def cmd_refresh(args):
+    from instrumentation import tracer
+    from config import TRACE_FILE, TRACE_EXPLAIN_SAMPLE, ANO, UF
+    from db_manager import DatabaseManager
+    tracer.configure(output=TRACE_FILE, explain_sample=TRACE_EXPLAIN_SAMPLE)
+    db = DatabaseManager()
+    try:
+        if db.refresh_resultados_secao(args.file, (args.ano or ANO, (args.uf or UF).upper())) is None:
+            sys.exit(1)
+    finally:
+        db.close()
+        tracer.finish()
+
+
+def cmd_bench(args):
+    import benchmark
+    benchmark.main(args.bench_args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Eleições 2022 (PR): carga, processamento e análises.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p_load = subparsers.add_parser("load", help="Carrega os dados no Postgres/PostGIS.")
+    p_load.add_argument("--csv_dir", type=str, help="Carrega os CSVs da pasta (como carregar_banco.py).")
+    p_load.add_argument("--shp_dir", type=str, help="Carrega os shapefiles da pasta (como carregar_banco.py).")
+    p_load.set_defaults(func=cmd_load)
+
+    p_process = subparsers.add_parser("process", help="Processa os arquivos brutos para processed_data/.")
+    p_process.set_defaults(func=cmd_process)
+
+    p_analyze = subparsers.add_parser("analyze", help="Gera os mapas e gráficos das análises.")
+    p_analyze.add_argument("--metrics", action="store_true", help="Também calcula as métricas espaciais (Moran, LISA).")
+    p_analyze.set_defaults(func=cmd_analyze)
+
+    p_gwr = subparsers.add_parser("gwr", help="Executa a análise GWR.")
+    p_gwr.set_defaults(func=cmd_gwr)
+
+    p_hotspots = subparsers.add_parser("hotspots", help="Calcula os hotspots (Gi*) de todos os candidatos.")
+    p_hotspots.set_defaults(func=cmd_hotspots)
+
+    p_refresh = subparsers.add_parser("refresh", help="Aplica um arquivo do TSE parcial/corrigido à resultados_secao.")
+    p_refresh.add_argument("--file", type=str, help="CSV do TSE (padrão: o arquivo da eleição em dados_info/).")
+    p_refresh.add_argument("--ano", type=int, help="Ano da eleição (padrão: DB_BUILDER_ANO).")
+    p_refresh.add_argument("--uf", type=str, help="UF da eleição (padrão: DB_BUILDER_UF).")
+    p_refresh.set_defaults(func=cmd_refresh)
+
+    p_bench = subparsers.add_parser("bench", help="Benchmarks (argumentos repassados ao benchmark.py).",
+                                    add_help=False)
+    p_bench.add_argument("bench_args", nargs=argparse.REMAINDER)
+    p_bench.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    # Opções desconhecidas (ex.: bench --help, bench suite --scale) seguem para o benchmark.py
+    args, extra = parser.parse_known_args(argv)
+    if extra:
+        if args.command != "bench":
+            parser.error(f"argumentos não reconhecidos: {' '.join(extra)}")
+        args.bench_args = extra + args.bench_args
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
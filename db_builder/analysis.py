@@ -1,10 +1,9 @@
-import pandas as pd
-import geopandas as gpd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sqlalchemy import text
-from db_manager import DatabaseManager
-from config import DB_CONFIG
+from db_manager import open_analysis_db
+from queries import secao_table, atributos_municipais, read_streamed
+from config import TRACE_FILE, TRACE_EXPLAIN_SAMPLE
+from instrumentation import tracer
 
 # Configuração de estilo visual
 sns.set_theme(style="whitegrid")
@@ -19,7 +18,7 @@ def get_winning_candidates_map(db):
     query = f"""
     WITH votos AS (
         SELECT cd_municipio, nm_votavel, SUM(qt_votos) as votos
-        FROM {db.schema}.resultados_secao
+        FROM {secao_table(db.schema)}
         GROUP BY 1, 2
     ),
     rank AS (
@@ -38,7 +37,7 @@ def get_winning_candidates_map(db):
     """
     
     try:
-        gdf = gpd.read_postgis(query, db.engine, geom_col='geometry')
+        gdf = read_streamed(db, query, geom_col='geometry')
         
         if gdf.empty:
             print("AVISO: DataFrame vazio no mapa de vencedores.")
@@ -65,66 +64,41 @@ def get_winning_candidates_map(db):
 def analyze_correlations(db):
     """
     Analisa correlação entre votos e indicadores socioeconômicos.
-    Correção: Usa conn.exec_driver_sql para evitar erro de dicionário imutável.
+    Correção: o nome do candidato vai como parâmetro da consulta, sem parsear o SQL.
     """
     print("2. Analisando correlações (Renda, Idade, Conectividade)...")
     
     # Descobrir o candidato mais votado do estado
     top_cand_query = f"""
-    SELECT nm_votavel FROM {db.schema}.resultados_secao 
+    SELECT nm_votavel FROM {secao_table(db.schema)} 
     GROUP BY nm_votavel ORDER BY SUM(qt_votos) DESC LIMIT 1
     """
     
     try:
-        with db.engine.connect() as conn:
-            # CORREÇÃO CRÍTICA: exec_driver_sql não tenta parsear parâmetros
-            top_candidate = conn.exec_driver_sql(top_cand_query).scalar()
+        top_candidate = db.scalar(top_cand_query)
         
         print(f"   Candidato foco da análise: {top_candidate}")
         
-        # Query usando a tabela geo_mun como tradutor (IBGE <-> TSE)
+        # Votos por município (código TSE); os atributos vêm da atributos_mun, que já traz o código TSE
         query = f"""
-        WITH votos_agregados AS (
-            SELECT 
-                cd_municipio as cod_tse, 
-                SUM(qt_votos) as total_validos,
-                SUM(CASE WHEN nm_votavel = '{top_candidate}' THEN qt_votos ELSE 0 END) as votos_cand
-            FROM {db.schema}.resultados_secao
-            GROUP BY 1
-        ),
-        tradutor AS (
-            SELECT DISTINCT "CD_MUN_IBG", "CD_MUN_TSE"
-            FROM {db.schema}.geo_mun
-        )
         SELECT 
-            c.id_municipio,
-            c.taxa_alfabetizacao, 
-            c.idade_mediana,
-            e.cobertura_pop_4g5g,
-            r.renda_media,
-            CASE WHEN v.total_validos > 0 
-                 THEN (v.votos_cand * 100.0 / v.total_validos) 
-                 ELSE 0 
-            END as pct_votos
-        FROM {db.schema}.censo_mun c
-        JOIN tradutor t ON c.id_municipio = CAST(t."CD_MUN_IBG" AS INTEGER)
-        LEFT JOIN votos_agregados v ON CAST(t."CD_MUN_TSE" AS INTEGER) = v.cod_tse
-        LEFT JOIN {db.schema}.extra e ON c.id_municipio = e.id_municipio
-        LEFT JOIN (
-            SELECT id_municipio, AVG(valor_remuneracao_media_sm) as renda_media 
-            FROM {db.schema}.rais 
-            GROUP BY id_municipio
-        ) r ON c.id_municipio = r.id_municipio
+            cd_municipio as cd_mun_tse, 
+            SUM(qt_votos) as total_validos,
+            SUM(CASE WHEN nm_votavel = %(candidato)s THEN qt_votos ELSE 0 END) as votos_cand
+        FROM {secao_table(db.schema)}
+        GROUP BY 1
         """
         
-        df = pd.read_sql(query, db.engine)
+        votos = read_streamed(db, query, {'candidato': top_candidate})
+        df = atributos_municipais(db).dropna(subset=['cd_mun_tse']).merge(votos, on='cd_mun_tse', how='left')
+        df['pct_votos'] = (df['votos_cand'] * 100.0 / df['total_validos'].where(df['total_validos'] > 0)).fillna(0)
         
         if df.empty:
             print("AVISO: DataFrame de correlação vazio.")
             return
 
         # Plotagem
-        vars_analise = ['renda_media', 'cobertura_pop_4g5g', 'taxa_alfabetizacao', 'idade_mediana']
+        vars_analise = ['remuneracao_media', 'cobertura_pop_4g5g', 'taxa_alfabetizacao', 'idade_mediana']
         titles = ['Renda Média (Salários Mínimos)', 'Cobertura 4G/5G (%)', 'Taxa de Alfabetização', 'Idade Mediana']
         
         fig, axes = plt.subplots(2, 2, figsize=(14, 10))
@@ -163,15 +137,12 @@ def analyze_regional_performance(db):
     # 1. Pegar os Top 5 candidatos do estado geral
     top5_query = f"""
     SELECT nm_votavel 
-    FROM {db.schema}.resultados_secao 
+    FROM {secao_table(db.schema)} 
     GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT 5
     """
     
     try:
-        with db.engine.connect() as conn:
-            top5 = [row[0] for row in conn.exec_driver_sql(top5_query).fetchall()]
-        
-        candidates_str = "', '".join(top5)
+        top5 = db.read_sql(top5_query)['nm_votavel'].tolist()
         
         # 2. Query agregando por Região Intermediária (presente na geo_mun como NM_RGINT)
         query = f"""
@@ -179,14 +150,14 @@ def analyze_regional_performance(db):
             g."NM_RGINT" as regiao,
             r.nm_votavel,
             SUM(r.qt_votos) as votos
-        FROM {db.schema}.resultados_secao r
+        FROM {secao_table(db.schema)} r
         JOIN {db.schema}.geo_mun g ON r.cd_municipio = CAST(g."CD_MUN_TSE" AS INTEGER)
-        WHERE r.nm_votavel IN ('{candidates_str}')
+        WHERE r.nm_votavel = ANY(%(candidatos)s)
         GROUP BY 1, 2
         ORDER BY 1, 3 DESC
         """
         
-        df = pd.read_sql(query, db.engine)
+        df = read_streamed(db, query, {'candidatos': top5})
         
         if df.empty:
             print("AVISO: DataFrame regional vazio.")
@@ -211,52 +182,61 @@ def analyze_regional_performance(db):
     except Exception as e:
         print(f"Erro na análise regional: {e}")
 
-def plot_top5_performance(db):
+def plot_top5_performance(db, n=5):
     """
-    Gera mapas individuais (Total e %) para cada um dos 5 candidatos mais votados.
+    Gera mapas individuais (Total e %) para cada um dos N (padrão: 5) candidatos mais votados.
     Salva um arquivo PNG separado para cada mapa, com estilo visual unificado (cores e contorno).
+    O pivot é feito em Python sobre o formato longo; o custo da consulta não cresce com N.
     """
-    print("4. Gerando mapas detalhados dos Top 5 Candidatos (Individualmente, com estilo unificado)...")
+    print(f"4. Gerando mapas detalhados dos Top {n} Candidatos (Individualmente, com estilo unificado)...")
 
-    # 1. Descobrir quem são os Top 5
-    top5_query = f"""
+    # 1. Descobrir quem são os Top N (a partir do agregado municipal)
+    top_query = f"""
     SELECT nm_votavel 
-    FROM {db.schema}.resultados_secao 
-    GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT 5
+    FROM {db.schema}.votos_mun 
+    GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT %(n)s
     """
     
     try:
-        with db.engine.connect() as conn:
-            top5_candidates = [row[0] for row in conn.exec_driver_sql(top5_query).fetchall()]
-        
-        print(f"   Top 5: {', '.join(top5_candidates)}")
+        top5_candidates = db.read_sql(top_query, {'n': n})['nm_votavel'].tolist()
         
-        # 2. Query Principal (Mantendo a correção das aspas para Case Sensitivity)
-        pivot_columns = []
-        for cand in top5_candidates:
-            safe_name = "".join(x for x in cand if x.isalnum())
-            pivot_columns.append(f"SUM(CASE WHEN r.nm_votavel = '{cand}' THEN r.qt_votos ELSE 0 END) as \"votes_{safe_name}\"")
-        
-        pivot_sql = ",\n".join(pivot_columns)
+        print(f"   Top {n}: {', '.join(top5_candidates)}")
         
+        # 2. Uma única agregação em formato longo (município, candidato, votos) sobre votos_mun
         query = f"""
+        SELECT cd_municipio, nm_votavel, SUM(qt_votos) as votos
+        FROM {db.schema}.votos_mun
+        WHERE nm_votavel = ANY(%(candidatos)s)
+        GROUP BY 1, 2
+        """
+        df_long = read_streamed(db, query, {'candidatos': top5_candidates})
+        
+        # Geometrias e totais por município (independem de N)
+        geo_query = f"""
         SELECT 
-            g."CD_MUN_TSE",
+            CAST(g."CD_MUN_TSE" AS INTEGER) as cd_municipio,
             g.geometry,
             g."NM_MUN",
-            SUM(r.qt_votos) as total_valid_votes,
-            {pivot_sql}
-        FROM {db.schema}.resultados_secao r
-        JOIN {db.schema}.geo_mun g ON r.cd_municipio = CAST(g."CD_MUN_TSE" AS INTEGER)
-        GROUP BY g."CD_MUN_TSE", g.geometry, g."NM_MUN"
+            t.total_votos as total_valid_votes
+        FROM {db.schema}.geo_mun g
+        JOIN {db.schema}.total_votos_mun t ON t.cd_municipio = CAST(g."CD_MUN_TSE" AS INTEGER)
         """
-        
-        gdf = gpd.read_postgis(query, db.engine, geom_col='geometry')
+        gdf = read_streamed(db, geo_query, geom_col='geometry')
         
         if gdf.empty:
-            print("AVISO: DataFrame vazio para Top 5.")
+            print(f"AVISO: DataFrame vazio para Top {n}.")
             return
 
+        # 3. Pivot vetorizado: municípios nas linhas, "votes_<nome>" nas colunas
+        safe_names = {cand: "".join(x for x in cand if x.isalnum()) for cand in top5_candidates}
+        df_pivot = df_long.pivot(index='cd_municipio', columns='nm_votavel', values='votos')
+        df_pivot = df_pivot.reindex(columns=top5_candidates)
+        df_pivot.columns = [f"votes_{safe_names[c]}" for c in df_pivot.columns]
+        
+        gdf = gdf.merge(df_pivot, left_on='cd_municipio', right_index=True, how='left')
+        vote_cols = list(df_pivot.columns)
+        gdf[vote_cols] = gdf[vote_cols].fillna(0)
+
         # --- AJUSTES DE ESTILO ---
         common_cmap = 'Reds' # Colormap único para todos
         common_edgecolor = 'black' # Contorno preto
@@ -292,15 +272,9 @@ def plot_top5_performance(db):
         # --- LOOP 2: MAPAS DE PERCENTUAL DE VOTOS (Salvar 1 por 1) ---
         print("   -> Salvando mapas de PERCENTUAL (%) de votos...")
         
-        # Calcular percentuais
-        for cand in top5_candidates:
-            safe_name = "".join(x for x in cand if x.isalnum())
-            vote_col = f"votes_{safe_name}"
-            pct_col = f"pct_{safe_name}"
-            
-            if vote_col in gdf.columns:
-                gdf[pct_col] = (gdf[vote_col] / gdf['total_valid_votes']) * 100
-                gdf[pct_col] = gdf[pct_col].fillna(0)
+        # Calcular percentuais (todas as colunas de uma vez)
+        pct_cols = [c.replace("votes_", "pct_", 1) for c in vote_cols]
+        gdf[pct_cols] = (gdf[vote_cols].div(gdf['total_valid_votes'], axis=0) * 100).fillna(0).values
 
         for i, cand in enumerate(top5_candidates):
             safe_name = "".join(x for x in cand if x.isalnum())
@@ -327,18 +301,66 @@ def plot_top5_performance(db):
                 print(f"      Salvo: {filename}")
 
     except Exception as e:
-        print(f"Erro nos mapas Top 5: {e}")
+        print(f"Erro nos mapas Top {n}: {e}")
+
+def plot_vote_distributions(db):
+    """
+    Distribuição de votos por município, zona e seção (antes feita no database.ipynb).
+    Lê a resultados_secao em blocos (DatabaseManager.stream_query) e acumula as somas
+    parciais de cada bloco; a memória depende do número de seções, não do de linhas.
+    """
+    print("5. Analisando distribuição de votos por município/zona/seção...")
+
+    query = f"""
+    SELECT cd_municipio, nr_zona, nr_secao, qt_votos
+    FROM {secao_table(db.schema)}
+    """
+    levels = {
+        'City': ['cd_municipio'],
+        'Zone': ['nr_zona'],
+        'Section': ['nr_zona', 'nr_secao'],
+    }
+
+    try:
+        totals = {label: None for label in levels}
+        for chunk in db.stream_query(query):
+            for label, keys in levels.items():
+                partial = chunk.groupby(keys)['qt_votos'].sum()
+                totals[label] = partial if totals[label] is None else totals[label].add(partial, fill_value=0)
+
+        if totals['City'] is None:
+            print("AVISO: resultados_secao vazia.")
+            return
+
+        fig, ax = plt.subplots(1, 3)
+        fig.set_size_inches(24, 6)
+        for i, (label, votes) in enumerate(totals.items()):
+            ax[i].hist(votes.values)
+            ax[i].grid(alpha=0.25)
+            ax[i].set_title(f"Distribution of Votes per {label}")
+            ax[i].set_xlabel("Votes")
+            ax[i].set_ylabel("Quantity")
+
+        plt.tight_layout()
+        plt.savefig("distribuicao_votos.png")
+        plt.close(fig)
+        print("-> Salvo: distribuicao_votos.png")
+
+    except Exception as e:
+        print(f"Erro na distribuição de votos: {e}")
 
 def main():
-    db = DatabaseManager()
+    tracer.configure(output=TRACE_FILE, explain_sample=TRACE_EXPLAIN_SAMPLE)
+    db = open_analysis_db()
     try:
-        get_winning_candidates_map(db)
-        analyze_correlations(db)
-        analyze_regional_performance(db)
-        plot_top5_performance(db)
+        for step in (get_winning_candidates_map, analyze_correlations,
+                     analyze_regional_performance, plot_top5_performance, plot_vote_distributions):
+            with tracer.stage(f"analysis.{step.__name__}"):
+                step(db)
         print("\n--- Todas as análises concluídas! ---")
     finally:
         db.close()
+        tracer.finish()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
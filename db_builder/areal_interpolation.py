@@ -0,0 +1,114 @@
+"""
+Interpolação areal: leva contagens dos setores censitários para outras geometrias
+(municípios, zonas de influência de locais de votação, grades...).
+
+As geometrias de destino vão para um STRtree (shapely 2) e cada bloco de setores consulta
+a árvore de uma vez; as áreas das interseções saem vetorizadas, e setores inteiramente
+dentro de um destino (o caso comum) nem chegam a ser recortados. Os blocos rodam em threads
+(o shapely libera o GIL). O resultado é uma matriz esparsa fontes x destinos com as áreas
+das interseções, da qual saem as variáveis extensivas (repartidas pela fração da área de
+cada setor, como tobler.area_interpolate) e as intensivas (médias ponderadas pela área).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+
+from config import METRIC_CRS, INTERP_WORKERS, INTERP_CHUNK, CENSO_SEC_SRID
+
+
+def _metric(gdf, crs=None):
+    """gdf no CRS `crs` (ou em METRIC_CRS, se estiver em coordenadas geográficas)"""
+    if crs is not None:
+        return gdf.to_crs(crs)
+    if gdf.crs is not None and gdf.crs.is_geographic:
+        return gdf.to_crs(METRIC_CRS)
+    return gdf
+
+
+def intersection_areas(source, target, workers=INTERP_WORKERS, chunk_size=INTERP_CHUNK):
+    """
+    Matriz CSR (fontes x destinos) com a área da interseção de cada par, na unidade do CRS de `source`
+    (`target` é reprojetado para ele). As linhas seguem a ordem de source e as colunas a de target.
+    """
+    if target.crs != source.crs and source.crs is not None:
+        target = target.to_crs(source.crs)
+    src = np.asarray(source.geometry.values)
+    tgt = np.asarray(target.geometry.values)
+    src_area = shapely.area(src)
+    tree = shapely.STRtree(tgt)
+    shapely.prepare(tgt)
+
+    def overlay(start, stop):
+        i, j = tree.query(src[start:stop], predicate="intersects")
+        i = i + start
+        area = src_area[i].copy()
+        # Setor inteiramente dentro do destino: a interseção é o próprio setor
+        cut = ~shapely.contains_properly(tgt[j], src[i])
+        area[cut] = shapely.area(shapely.intersection(src[i[cut]], tgt[j[cut]]))
+        keep = area > 0
+        return i[keep], j[keep], area[keep]
+
+    chunks = [(start, min(start + chunk_size, len(src))) for start in range(0, len(src), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        parts = [overlay(*c) for c in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(lambda c: overlay(*c), chunks))
+    if not parts:
+        return sparse.csr_matrix((len(src), len(tgt)))
+    rows, cols, area = (np.concatenate(p) for p in zip(*parts))
+    return sparse.csr_matrix((area, (rows, cols)), shape=(len(src), len(tgt)))
+
+
+def area_interpolate(source, target, extensive=(), intensive=(), crs=None,
+                     workers=INTERP_WORKERS, chunk_size=INTERP_CHUNK):
+    """
+    Estima as colunas de `source` nas geometrias de `target` pela sobreposição das áreas.
+    extensive: contagens (pessoas, domicílios...), repartidas pela fração da área de cada fonte
+    em cada destino; intensive: taxas e médias, ponderadas pela área da interseção.
+    As áreas são calculadas em `crs` (padrão: METRIC_CRS para dados em graus).
+    Retorna um DataFrame com o índice de target e a coluna area_sobreposta (área coberta pelas fontes).
+    """
+    extensive, intensive = list(extensive), list(intensive)
+    source = _metric(source, crs)
+    A = intersection_areas(source, target, workers, chunk_size)
+    result = pd.DataFrame(index=target.index)
+
+    if extensive:
+        src_area = np.asarray(shapely.area(np.asarray(source.geometry.values)))
+        share = sparse.diags(np.divide(1.0, src_area, out=np.zeros_like(src_area), where=src_area > 0)) @ A
+        values = source[extensive].astype("float64").fillna(0).to_numpy()
+        result[extensive] = share.T @ values
+
+    covered = np.asarray(A.sum(axis=0)).ravel()
+    if intensive:
+        values = source[intensive].astype("float64").to_numpy()
+        present = ~np.isnan(values)
+        weighted = A.T @ np.where(present, values, 0)
+        weights = A.T @ present.astype("float64")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[intensive] = weighted / weights
+    result["area_sobreposta"] = covered
+    return result
+
+
+def sectors_to_zones(db, zones, extensive=("pessoas", "domicilios"), intensive=("media_moradores_domicilios",)):
+    """
+    Interpola os setores da censo_sec (Postgres ou DuckDB) para as geometrias de `zones`
+    (GeoDataFrame com CRS definido). Só os setores que tocam a extensão das zonas são lidos.
+    """
+    columns = ", ".join(list(extensive) + list(intensive))
+    bounds = zones.to_crs(epsg=CENSO_SEC_SRID).total_bounds
+    params = dict(zip(("xmin", "ymin", "xmax", "ymax"), map(float, bounds)))
+    if db.backend == "postgres":
+        where = "s.geometria && ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, " + str(CENSO_SEC_SRID) + ")"
+        sectors = db.read_geo(f"SELECT {columns}, s.geometria FROM {db.schema}.censo_sec s WHERE {where}",
+                              params, geom_col="geometria")
+    else:
+        sectors = db.read_geo(f"SELECT {columns}, s.geometria FROM {db.schema}.censo_sec s", geom_col="geometria")
+        sectors = sectors.set_crs(epsg=CENSO_SEC_SRID, allow_override=True)
+        sectors = sectors.cx[params["xmin"]:params["xmax"], params["ymin"]:params["ymax"]]
+    return area_interpolate(sectors, zones, extensive, intensive)
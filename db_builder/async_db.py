@@ -0,0 +1,89 @@
+"""
+Acesso assíncrono ao banco para laços por candidato/partido.
+
+Com asyncpg (opcional), as consultas de cada entidade saem em paralelo por um pool
+pequeno de conexões; cada resultado é entregue a um único worker assim que chega,
+então o cálculo estatístico (Moran) de um candidato roda enquanto o banco ainda
+responde aos demais. Sem asyncpg, fan_out executa as consultas em sequência.
+
+fan_out é síncrona e pode ser chamada também de dentro de um event loop já em
+execução (Jupyter); quem já está em código assíncrono pode aguardar fan_out_async.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+
+def _records_to_df(records, columns):
+    return pd.DataFrame.from_records([tuple(r) for r in records], columns=columns, coerce_float=True)
+
+
+async def _fan_out(db_config, sql, args_by_key, handle, pool_size):
+    pool = await asyncpg.create_pool(
+        user=db_config["user"], password=db_config["password"],
+        host=db_config["host"], port=int(db_config["port"]), database=db_config["dbname"],
+        min_size=1, max_size=pool_size,
+        server_settings={"search_path": f"{db_config['schema']},public"},
+    )
+    loop = asyncio.get_running_loop()
+    # Um único worker: os cálculos não disputam a CPU entre si e as saídas não se misturam
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def fetch(key, args):
+        # O asyncpg prepara a consulta na conexão e reaproveita o plano (cache de statements)
+        async with pool.acquire() as conn:
+            stmt = await conn.prepare(sql)
+            columns = [attr.name for attr in stmt.get_attributes()]
+            return key, _records_to_df(await stmt.fetch(*args), columns)
+
+    try:
+        pending = []
+        for task in asyncio.as_completed([fetch(k, a) for k, a in args_by_key.items()]):
+            key, df = await task
+            pending.append((key, loop.run_in_executor(executor, handle, key, df)))
+        return {key: await future for key, future in pending}
+    finally:
+        executor.shutdown(wait=True)
+        await pool.close()
+
+
+async def fan_out_async(db, sql, args_by_key, handle, pool_size=4):
+    """Versão coroutine de fan_out (sempre via asyncpg), para quem já roda em um event loop"""
+    if asyncpg is None:
+        raise ImportError("fan_out_async requer o asyncpg (pip install asyncpg)")
+    if not args_by_key:
+        return {}
+    return await _fan_out(db.db_config, sql, args_by_key, handle, pool_size)
+
+
+def _run(coro):
+    """asyncio.run, ou, se esta thread já tem um loop rodando (Jupyter), asyncio.run em outra thread"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def fan_out(db, name, sql, arg_types, args_by_key, handle, pool_size=4, use_async=True):
+    """
+    Executa `sql` (placeholders $1, $2, ...) uma vez para cada chave de `args_by_key`
+    ({chave: (args...)}) e chama handle(chave, DataFrame) à medida que os resultados chegam.
+    Retorna {chave: retorno de handle}, na ordem de chegada.
+    Dentro de um event loop em execução, o fan-out roda em uma thread à parte.
+    Sem asyncpg (ou com use_async=False, ou fora do Postgres), usa a consulta preparada `name`
+    do banco, uma chave por vez.
+    """
+    if not args_by_key:
+        return {}
+    if asyncpg is None or not use_async or db.backend != "postgres":
+        stmt = db.prepare(name, sql, arg_types)
+        return {key: handle(key, stmt.execute(*args)) for key, args in args_by_key.items()}
+    return _run(_fan_out(db.db_config, sql, args_by_key, handle, pool_size))
@@ -0,0 +1,511 @@
+"""
+Benchmarks do pipeline db_builder.
+
+Uso (a partir da pasta db_builder):
+    python benchmark.py suite --scale 0.05            # pipeline completo com dados sintéticos
+    python benchmark.py compare antes.json depois.json
+    python benchmark.py planning --n 200
+    python benchmark.py startup --repeat 5              # tempo de início da CLI (cli.py)
+    python benchmark.py weights --n 200000              # pesos KNN/banda de distância (spatial_weights.py)
+    python benchmark.py hotspots --n 399 --m 900        # Gi* de todos os candidatos (hotspots.py)
+
+O banco alvo é o do docker-compose (padrão de config.DB_CONFIG) ou qualquer Postgres/PostGIS
+informado por --host/--port/--dbname/--user/--password (ou pelas variáveis PG_* do .env).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from config import DB_CONFIG, FILES, PROCESSED_FILES, PARQUET_FILES, GWR_BANDWIDTH, SWAP_LOAD, SHP_MUN_TABLE
+from db_manager import DatabaseManager
+from queries import votos_candidato_sql
+from instrumentation import tracer
+from staging import STAGING_SUFFIX
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+
+
+def _explain(cur, sql, params=None):
+    """Retorna (Planning Time, Execution Time) em ms via EXPLAIN ANALYZE"""
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0][0]
+    return plan.get("Planning Time", 0.0), plan.get("Execution Time", 0.0)
+
+
+def bench_planning(db, n=200):
+    """
+    Compara o custo de planejamento da consulta por candidato em três modos:
+      - literal:   nome interpolado no texto do SQL (comportamento antigo)
+      - bound:     parâmetro vinculado pelo driver (o servidor ainda recebe um SQL por candidato)
+      - prepared:  PREPARE uma vez + EXECUTE por candidato (um único plano reaproveitado)
+    """
+    print(f"Benchmark de planejamento com {n} candidatos...")
+    with db.engine.connect() as conn:
+        candidates = [row[0] for row in conn.exec_driver_sql(
+            f"SELECT nm_votavel FROM {db.schema}.votos_mun GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT {int(n)}"
+        ).fetchall()]
+
+    template = votos_candidato_sql(db.schema)
+    results = {}
+
+    with db.conn.cursor() as cur:
+        # 1. Literal: um texto de SQL diferente por candidato
+        def run_literal(cand):
+            literal = "'" + cand.replace("'", "''") + "'"
+            sql = template.replace("$1", literal)
+            return sql, None
+
+        # 2. Bound: psycopg2 faz a interpolação no cliente
+        def run_bound(cand):
+            return template.replace("$1", "%s"), (cand,)
+
+        for mode, build in (("literal", run_literal), ("bound", run_bound)):
+            start = time.perf_counter()
+            for cand in candidates:
+                sql, params = build(cand)
+                cur.execute(sql, params)
+                cur.fetchall()
+            wall = time.perf_counter() - start
+            planning = execution = 0.0
+            for cand in candidates:
+                sql, params = build(cand)
+                p, e = _explain(cur, sql, params)
+                planning += p
+                execution += e
+            results[mode] = {"wall_s": wall, "planning_ms": planning, "execution_ms": execution}
+
+        # 3. Prepared: um único plano no servidor
+        cur.execute("DEALLOCATE ALL")
+        cur.execute(f"PREPARE bench_votos_candidato (varchar) AS {template}")
+        start = time.perf_counter()
+        for cand in candidates:
+            cur.execute("EXECUTE bench_votos_candidato (%s)", (cand,))
+            cur.fetchall()
+        wall = time.perf_counter() - start
+        planning = execution = 0.0
+        for cand in candidates:
+            p, e = _explain(cur, "EXECUTE bench_votos_candidato (%s)", (cand,))
+            planning += p
+            execution += e
+        results["prepared"] = {"wall_s": wall, "planning_ms": planning, "execution_ms": execution}
+        cur.execute("DEALLOCATE bench_votos_candidato")
+    db.conn.rollback()
+    # Descarta o cache de consultas preparadas do DatabaseManager (DEALLOCATE ALL acima)
+    for stmt in db.prepared.values():
+        stmt.prepared = False
+
+    print(f"{'Modo':<10} | {'Wall (s)':>10} | {'Planejamento (ms)':>18} | {'Execução (ms)':>14}")
+    print("-" * 62)
+    for mode, r in results.items():
+        print(f"{mode:<10} | {r['wall_s']:>10.3f} | {r['planning_ms']:>18.1f} | {r['execution_ms']:>14.1f}")
+    return results
+
+
+# Pilhas pesadas que só os subcomandos de análise deveriam importar
+HEAVY_MODULES = ("matplotlib", "seaborn", "geopandas", "libpysal", "esda", "splot", "mgwr")
+
+
+def _startup_commands():
+    """(nome, argv) dos comandos medidos; `load --csv_dir` usa uma pasta vazia (só o custo de início e conexão)"""
+    empty_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    return empty_dir, [
+        ("cli --help", ["--help"]),
+        ("load --help", ["load", "--help"]),
+        ("process --help", ["process", "--help"]),
+        ("analyze --help", ["analyze", "--help"]),
+        ("gwr --help", ["gwr", "--help"]),
+        ("load --csv_dir (vazia)", ["load", "--csv_dir", empty_dir]),
+    ]
+
+
+def _imported_modules(importtime_stderr):
+    """Módulos de topo importados, a partir da saída de `python -X importtime`"""
+    modules = set()
+    for line in importtime_stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return modules
+
+
+def bench_startup(repeat=5):
+    """Tempo de parede de cada comando da CLI (processo novo a cada vez) e pilhas pesadas importadas"""
+    cli = os.path.join(ROOT_DIR, "cli.py")
+    env = dict(os.environ)
+    env.update({"PG_HOST": str(DB_CONFIG["host"]), "PG_PORT": str(DB_CONFIG["port"]), "PG_DB": DB_CONFIG["dbname"],
+                "PG_USER": DB_CONFIG["user"], "PG_PASSWORD": DB_CONFIG["password"]})
+    empty_dir, commands = _startup_commands()
+    results = {}
+    try:
+        for name, argv in commands:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, cli] + argv, env=env, cwd=ROOT_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                times.append(time.perf_counter() - start)
+            proc = subprocess.run([sys.executable, "-X", "importtime", cli] + argv, env=env, cwd=ROOT_DIR,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            heavy = sorted(m for m in HEAVY_MODULES if m in _imported_modules(proc.stderr))
+            times.sort()
+            results[name] = {"min_s": round(times[0], 4), "median_s": round(times[len(times) // 2], 4), "heavy": heavy}
+    finally:
+        shutil.rmtree(empty_dir, ignore_errors=True)
+
+    print(f"{'Comando':<25} | {'Mín (s)':>8} | {'Mediana (s)':>11} | Pilhas pesadas importadas")
+    print("-" * 80)
+    for name, r in results.items():
+        print(f"{name:<25} | {r['min_s']:>8.3f} | {r['median_s']:>11.3f} | {', '.join(r['heavy']) or '-'}")
+    return results
+
+
+def bench_weights(n=200000, k=8, threshold=2000.0, seed=0):
+    """
+    Pesos KNN e por banda de distância sobre `n` pontos aleatórios (um retângulo de ~500 x 300 km,
+    como o Paraná), e a releitura do cache em .npz.
+    """
+    import numpy as np
+    import spatial_weights
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform([0, 0], [500000, 300000], size=(n, 2))
+    ids = np.arange(n)
+    results = {}
+
+    def run(name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        W = fn(*args, **kwargs)
+        results[name] = {"wall_s": round(time.perf_counter() - start, 4), "nnz": int(W.nnz)}
+        return W
+
+    run("knn", spatial_weights.knn_weights, coords, k=k)
+    run("knn (1 thread)", spatial_weights.knn_weights, coords, k=k, workers=1)
+    run("distance", spatial_weights.distance_band_weights, coords, threshold=threshold)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "w.npz")
+        W = run("knn + save", lambda: spatial_weights.knn_weights(coords, k=k))
+        spatial_weights.save_weights(path, W, ids)
+        run("load (.npz)", lambda: spatial_weights.load_weights(path)[0])
+
+    print(f"{'Pesos (n=' + str(n) + ')':<25} | {'Wall (s)':>9} | {'Não nulos':>12}")
+    print("-" * 52)
+    for name, r in results.items():
+        print(f"{name:<25} | {r['wall_s']:>9.3f} | {r['nnz']:>12}")
+    return results
+
+
+def bench_hotspots(n=399, m=900, permutations=999, k=6, seed=0):
+    """
+    Gi* com inferência por permutação para `m` candidatos em `n` unidades aleatórias
+    (vizinhança KNN), como a rodada noturna de hotspots.py no nível municipal.
+    """
+    import numpy as np
+    import hotspots
+    import spatial_weights
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform([0, 0], [500000, 300000], size=(n, 2))
+    A = spatial_weights.knn_weights(coords, k=k)
+    Y = rng.gamma(1.0, 1.0, size=(n, m))
+    results = {}
+    for name, perms in (("analítico", 0), (f"{permutations} permutações", permutations)):
+        start = time.perf_counter()
+        hotspots.gi_star(Y, A, perms, seed)
+        results[name] = {"wall_s": round(time.perf_counter() - start, 4)}
+
+    print(f"{'Gi* (' + str(n) + ' x ' + str(m) + ')':<25} | {'Wall (s)':>9}")
+    print("-" * 37)
+    for name, r in results.items():
+        print(f"{name:<25} | {r['wall_s']:>9.3f}")
+    return results
+
+
+def _git_version():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return "desconhecida"
+
+
+class StageTimer:
+    """Cronometra etapas do pipeline e acumula os resultados em um dicionário serializável"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        print(f"\n[bench] {name}...")
+        ok, error, result = True, None, None
+        try:
+            with tracer.stage(name) as span:
+                result = fn(*args, **kwargs)
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+            print(f"[bench] Erro em {name}: {error}")
+        self.stages[name] = {
+            "wall_s": round(span.wall_s, 4),
+            "cpu_s": round(span.cpu_s, 4),
+            "peak_rss_mb": round(span.peak_rss / 2**20, 1),
+            "bytes_read": span.bytes_read,
+            "sql_count": span.sql_count,
+            "sql_time_s": round(span.sql_time_s, 4),
+            "ok": ok,
+            "error": error,
+        }
+        print(f"[bench] {name}: {self.stages[name]['wall_s']:.3f}s")
+        return result
+
+
+def _use_synthetic_files(files, work_dir):
+    """Aponta config.FILES/PROCESSED_FILES para os dados sintéticos (os dicionários são compartilhados entre os módulos)"""
+    FILES.update(files)
+    processed_dir = os.path.join(work_dir, "processed_data")
+    os.makedirs(processed_dir, exist_ok=True)
+    for key, path in list(PROCESSED_FILES.items()):
+        PROCESSED_FILES[key] = os.path.join(processed_dir, os.path.basename(path))
+    for table, path in list(PARQUET_FILES.items()):
+        PARQUET_FILES[table] = os.path.join(processed_dir, "parquet", os.path.basename(path))
+
+
+def _setup_resultados_secao(db):
+    """Mesma etapa do main: limpeza em streaming da votação por seção + COPY na resultados_secao"""
+    return db.load_resultados_secao().rows_out
+
+
+def _rerun_geo_loads(db):
+    """
+    Recarrega as tabelas geográficas sobre as já publicadas: o que a troca da carga anterior
+    deixou para trás (ex.: índices ainda com o sufixo de staging) faria esta segunda carga falhar.
+    """
+    db.load_shapefiles()
+    db.load_geo_mun()
+    staged = set(db.staged)
+    db.publish_tables()
+    if not SWAP_LOAD:
+        return
+    failed = ({SHP_MUN_TABLE, "geo_mun", "mapa_municipio"} - staged) | set(db.staged)
+    if failed:
+        raise RuntimeError(f"A segunda carga não publicou: {', '.join(sorted(failed))}")
+    leftover = db.read_sql(
+        "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = %(schema)s AND position(%(suffix)s IN c.relname) > 0",
+        {"schema": db.schema, "suffix": STAGING_SUFFIX},
+    )
+    if not leftover.empty:
+        raise RuntimeError(f"Relações com o sufixo de staging após a troca: {', '.join(leftover['relname'])}")
+
+
+def run_suite(scale=0.05, n_municipios=399, seed=0, work_dir=None, keep=False, skip_gwr=False):
+    """
+    Gera dados sintéticos e cronometra cada etapa:
+    carregar_csv, run_all_processing, load_csv_data, load_shapefiles, agregados, cada análise e o GWR.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    sys.path.insert(0, ROOT_DIR)
+
+    import synthetic_data
+    from data_processor import run_all_processing
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="bench_db_builder_")
+    timer = StageTimer()
+
+    files, counts = timer.run("generate", synthetic_data.generate, work_dir, scale, n_municipios, seed)
+    _use_synthetic_files(files, work_dir)
+
+    db = DatabaseManager()
+    cwd = os.getcwd()
+    figs_dir = os.path.join(work_dir, "figuras")
+    os.makedirs(figs_dir, exist_ok=True)
+    try:
+        # 1. Carga genérica de CSV (carregar_banco.py) da RAIS bruta, usada pelas análises como tabela 'rais'
+        import carregar_banco
+        carga_dir = os.path.join(work_dir, "carga")
+        os.makedirs(carga_dir, exist_ok=True)
+        shutil.copyfile(FILES["rais"], os.path.join(carga_dir, "rais.csv"))
+        timer.run("carregar_csv", carregar_banco.carregar_csv, os.path.join(carga_dir, "rais.csv"), db.engine)
+
+        # 2. Pipeline db_builder
+        timer.run("run_all_processing", run_all_processing)
+        timer.run("create_tables", db.create_tables)
+        timer.run("load_csv_data", db.load_csv_data)
+        timer.run("load_shapefiles", db.load_shapefiles)
+        counts["resultados_secao"] = timer.run("setup_resultados_secao", _setup_resultados_secao, db)
+        timer.run("load_geo_mun", db.load_geo_mun)
+        timer.run("build_region_tables", db.build_region_tables)
+        timer.run("build_neighbor_tables", db.build_neighbor_tables)
+        timer.run("build_aggregate_tables", db.build_aggregate_tables)
+        timer.run("build_atributos_table", db.build_atributos_table)
+        timer.run("publish_tables", db.publish_tables)
+        timer.run("rerun_geo_loads", _rerun_geo_loads, db)
+
+        # 3. Análises (as figuras vão para a pasta de trabalho)
+        os.chdir(figs_dir)
+        import analysis
+        timer.run("analysis.get_winning_candidates_map", analysis.get_winning_candidates_map, db)
+        timer.run("analysis.analyze_correlations", analysis.analyze_correlations, db)
+        timer.run("analysis.analyze_regional_performance", analysis.analyze_regional_performance, db)
+        timer.run("analysis.plot_top5_performance", analysis.plot_top5_performance, db)
+
+        from metrics_analysis import SpatialMetricsAnalysis
+        metrics = timer.run("metrics.load_geometries", SpatialMetricsAnalysis)
+        if metrics is not None:
+            timer.run("metrics.analyze_autocorrelation_candidates", metrics.analyze_autocorrelation_candidates)
+            timer.run("metrics.analyze_aggregated_levels", metrics.analyze_aggregated_levels)
+            timer.run("metrics.analyze_socioeconomic_correlation", metrics.analyze_socioeconomic_correlation)
+            timer.run("metrics.analyze_party_autocorrelation", metrics.analyze_party_autocorrelation)
+            timer.run("metrics.analyze_hotspots", metrics.analyze_hotspots)
+            metrics.db.close()
+
+        # 4. GWR (extra_analysis.py)
+        if not skip_gwr:
+            import extra_analysis
+            gdf = timer.run("gwr.fetch_data", extra_analysis.fetch_data, db)
+            if gdf is not None and not gdf.empty:
+                prepared = timer.run("gwr.preprocess", extra_analysis.preprocess_for_gwr, gdf)
+                if prepared is not None:
+                    y, X, coords, x_names, gdf_clean = prepared
+                    gwr_results = timer.run("gwr.fit", extra_analysis.perform_gwr, y, X, coords, GWR_BANDWIDTH)
+                    if gwr_results is not None:
+                        timer.run("gwr.residual_moran", extra_analysis.residual_autocorrelation, gdf_clean, gwr_results)
+                        timer.run("gwr.plots", extra_analysis.analyze_and_visualize, gdf_clean, gwr_results, x_names)
+    finally:
+        os.chdir(cwd)
+        db.close()
+        if own_dir and not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "version": _git_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "scale": scale,
+        "n_municipios": n_municipios,
+        "seed": seed,
+        "rows": counts,
+        "stages": timer.stages,
+    }
+
+
+def save_results(results, output=None):
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"bench_{results['version']}_{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados salvos em: {output}")
+    return output
+
+
+def print_summary(results):
+    print(f"\n{'Etapa':<50} | {'Wall (s)':>10} | {'CPU (s)':>10} | OK")
+    print("-" * 82)
+    for name, r in results["stages"].items():
+        print(f"{name:<50} | {r['wall_s']:>10.3f} | {r['cpu_s']:>10.3f} | {'sim' if r['ok'] else 'NÃO'}")
+
+
+def compare_results(before_path, after_path):
+    """Compara dois arquivos de resultado etapa a etapa (razão > 1 = mais lento)"""
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"Antes:  {before['version']} ({before['timestamp']}, scale={before['scale']})")
+    print(f"Depois: {after['version']} ({after['timestamp']}, scale={after['scale']})")
+    print(f"\n{'Etapa':<50} | {'Antes (s)':>10} | {'Depois (s)':>10} | {'Razão':>7}")
+    print("-" * 86)
+    for name in list(dict.fromkeys(list(before["stages"]) + list(after["stages"]))):
+        b = before["stages"].get(name, {}).get("wall_s")
+        a = after["stages"].get(name, {}).get("wall_s")
+        ratio = f"{a / b:.2f}" if a is not None and b else "-"
+        b_str = f"{b:.3f}" if b is not None else "-"
+        a_str = f"{a:.3f}" if a is not None else "-"
+        print(f"{name:<50} | {b_str:>10} | {a_str:>10} | {ratio:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline db_builder.")
+    parser.add_argument("--host", default=os.getenv("PG_HOST"), help="Host do Postgres (padrão: config.DB_CONFIG).")
+    parser.add_argument("--port", default=os.getenv("PG_PORT"))
+    parser.add_argument("--dbname", default=os.getenv("PG_DB"))
+    parser.add_argument("--user", default=os.getenv("PG_USER"))
+    parser.add_argument("--password", default=os.getenv("PG_PASSWORD"))
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    p_suite = subparsers.add_parser("suite", help="Pipeline completo com dados sintéticos.")
+    p_suite.add_argument("--scale", type=float, default=0.05, help="Fator de escala (1.0 = volume do Paraná).")
+    p_suite.add_argument("--municipios", type=int, default=399, help="Número de municípios sintéticos.")
+    p_suite.add_argument("--seed", type=int, default=0)
+    p_suite.add_argument("--work-dir", default=None, help="Pasta para os dados gerados (padrão: temporária).")
+    p_suite.add_argument("--keep", action="store_true", help="Mantém a pasta temporária ao final.")
+    p_suite.add_argument("--skip-gwr", action="store_true", help="Não executa o GWR (etapa mais lenta).")
+    p_suite.add_argument("--output", default=None, help="Arquivo JSON de saída (padrão: bench_results/).")
+
+    p_compare = subparsers.add_parser("compare", help="Compara dois resultados JSON.")
+    p_compare.add_argument("before")
+    p_compare.add_argument("after")
+
+    p_planning = subparsers.add_parser("planning", help="Custo de planejamento: SQL literal vs. consulta preparada.")
+    p_planning.add_argument("--n", type=int, default=200, help="Número de candidatos no laço.")
+
+    p_startup = subparsers.add_parser("startup", help="Tempo de início da CLI (cli.py) e importações pesadas.")
+    p_startup.add_argument("--repeat", type=int, default=5, help="Execuções por comando.")
+
+    p_weights = subparsers.add_parser("weights", help="Pesos espaciais KNN/banda de distância (KD-tree).")
+    p_weights.add_argument("--n", type=int, default=200000, help="Número de pontos.")
+    p_weights.add_argument("--k", type=int, default=8)
+    p_weights.add_argument("--threshold", type=float, default=2000.0, help="Raio da banda, em metros.")
+
+    p_hotspots = subparsers.add_parser("hotspots", help="Gi* vetorizado com permutações (hotspots.py).")
+    p_hotspots.add_argument("--n", type=int, default=399, help="Número de unidades.")
+    p_hotspots.add_argument("--m", type=int, default=900, help="Número de candidatos.")
+    p_hotspots.add_argument("--permutations", type=int, default=999)
+
+    args = parser.parse_args(argv)
+
+    for key in ("host", "port", "dbname", "user", "password"):
+        if getattr(args, key):
+            DB_CONFIG[key] = getattr(args, key)
+
+    if args.bench == "compare":
+        compare_results(args.before, args.after)
+        return
+
+    if args.bench == "weights":
+        bench_weights(args.n, args.k, args.threshold)
+        return
+
+    if args.bench == "hotspots":
+        bench_hotspots(args.n, args.m, args.permutations)
+        return
+
+    if args.bench == "startup":
+        bench_startup(args.repeat)
+        return
+
+    if args.bench == "suite":
+        results = run_suite(args.scale, args.municipios, args.seed, args.work_dir, args.keep, args.skip_gwr)
+        print_summary(results)
+        save_results(results, args.output)
+        return
+
+    db = DatabaseManager()
+    try:
+        if args.bench == "planning":
+            bench_planning(db, n=args.n)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
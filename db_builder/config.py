@@ -11,28 +11,89 @@ PROCESSED_DIR = os.path.join(BASE_DIR, "processed_data")
 # Certifique-se de que a pasta de processados existe
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
+# --- Eleições (ano, UF) ---
+# Eleição das análises: malhas, censo, RAIS e candidato alvo são desta eleição
+ANO = int(os.getenv("DB_BUILDER_ANO", "2022"))
+UF = os.getenv("DB_BUILDER_UF", "PR").upper()
+
+def _parse_eleicoes(value):
+    """"2022:PR,2022:SC" -> [(2022, "PR"), (2022, "SC")]"""
+    eleicoes = []
+    for item in value.split(","):
+        ano, uf = item.strip().split(":")
+        eleicoes.append((int(ano), uf.strip().upper()))
+    return eleicoes
+
+# Eleições carregadas na resultados_secao (uma partição por ano e UF, processadas em paralelo)
+ELEICOES = _parse_eleicoes(os.getenv("DB_BUILDER_ELEICOES", f"{ANO}:{UF}"))
+
 # --- Arquivos de Entrada ---
+# Os arquivos por estado seguem ANO/UF; censo_mun e mapa_cod são nacionais (filtrados pela UF no processamento)
 FILES = {
     # Apontando para o arquivo de votação real e descompactado
-    "votacao": os.path.join(DATA_DIR, "dados_info", "votacao_secao_2022_PR", "votacao_secao_2022_PR.csv"), 
+    "votacao": os.path.join(DATA_DIR, "dados_info", f"votacao_secao_{ANO}_{UF}", f"votacao_secao_{ANO}_{UF}.csv"),
     "censo_mun": os.path.join(DATA_DIR, "censo-municipio.csv"),
     "censo_sec": os.path.join(DATA_DIR, "censo-setor-censitario.csv"),
-    "rais": os.path.join(DATA_DIR, "RAIS-PR-2022.csv"),
-    "extra": os.path.join(DATA_DIR, "IndiceBrConectividadePR2022.csv"),
-    "shp_mun": os.path.join(DATA_DIR, "dados_info", "PR_Municipios_2022", "PR_Municipios_2022.shp"),
+    "rais": os.path.join(DATA_DIR, f"RAIS-{UF}-{ANO}.csv"),
+    "extra": os.path.join(DATA_DIR, f"IndiceBrConectividade{UF}{ANO}.csv"),
+    "shp_mun": os.path.join(DATA_DIR, "dados_info", f"{UF}_Municipios_{ANO}", f"{UF}_Municipios_{ANO}.shp"),
+    # Malha usada na geo_mun (enriquecida com o código TSE por data_processor.process_geo_mun)
+    "shp_geo_mun": os.path.join(DATA_DIR, "dados_info", f"{UF}_Municipios_2024", f"{UF}_Municipios_2024.shp"),
     "mapa_cod": os.path.join(DATA_DIR, "mapa-cod-municipio.csv"),
 }
+# Fontes que só existem para o PR: o arquivo não traz a UF no nome nem uma coluna para filtrar
+PR_ONLY_FILES = ("censo_sec",)
+# Malha do IBGE carregada pelo load_shapefiles (usada pelo GWR)
+SHP_MUN_TABLE = f"municipios_{UF.lower()}_{ANO}"
 
 # --- Arquivos de Saída (Processados) ---
 PROCESSED_FILES = {
     # Arquivo para a votação do deputado estadual específico (gerado dinamicamente abaixo)
     # A chave "votacao_dep_candidate" será criada a partir de CANDIDATE_NAME
     "censo_mun": os.path.join(PROCESSED_DIR, "censo_mun_processado.csv"),
-    "censo_sec": os.path.join(PROCESSED_DIR, "censo_sec_processado.csv"),
+    "censo_sec": os.path.join(PROCESSED_DIR, "censo_sec.parquet"),  # GeoParquet (geometria em WKB)
     "rais": os.path.join(PROCESSED_DIR, "rais_processado.csv"),
     "extra": os.path.join(PROCESSED_DIR, "extra_processado.csv"),
+    "geo_mun": os.path.join(PROCESSED_DIR, "geo_mun.parquet"),  # GeoParquet
+    # Setores censitários interpolados para a malha municipal (data_processor.process_sector_municipio)
+    "censo_sec_mun": os.path.join(PROCESSED_DIR, "censo_sec_mun_processado.csv"),
 }
 
+def voting_file(ano, uf):
+    """CSV de votação por seção do TSE de uma eleição (o da eleição das análises é FILES["votacao"], com o mesmo padrão)"""
+    if (ano, uf) == (ANO, UF):
+        return FILES["votacao"]
+    return os.path.join(DATA_DIR, "dados_info", f"votacao_secao_{ano}_{uf}", f"votacao_secao_{ano}_{uf}.csv")
+
+def check_sources():
+    """
+    Falha logo no início se a eleição configurada não tem os arquivos de entrada: fontes só do PR
+    com outra UF, ou arquivos (inclusive a votação de cada eleição em ELEICOES) que não existem.
+    Sem isso, uma UF/ano sem dados próprios misturaria arquivos de outra eleição.
+    """
+    if UF != "PR":
+        raise ValueError(f"DB_BUILDER_UF={UF}: {', '.join(PR_ONLY_FILES)} só existe(m) para o PR "
+                         f"({', '.join(FILES[k] for k in PR_ONLY_FILES)})")
+    paths = list(FILES.values()) + [voting_file(ano, uf) for ano, uf in ELEICOES]
+    missing = [path for path in dict.fromkeys(paths) if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Arquivos de entrada de {ANO}/{UF} não encontrados: {', '.join(missing)}")
+
+def election_suffix(ano, uf):
+    """Sufixo das partições de uma eleição (ex.: resultados_secao_2022_pr)"""
+    return f"{ano}_{uf.lower()}"
+
+# Linhas por chunk na leitura em streaming da votação por seção (resultados_secao)
+VOTACAO_CHUNKSIZE = int(os.getenv("DB_BUILDER_VOTACAO_CHUNKSIZE", "500000"))
+# Setores censitários: linhas por chunk (cada uma com o WKT do polígono) e threads na conversão WKT -> WKB
+CENSO_SEC_CHUNKSIZE = int(os.getenv("DB_BUILDER_CENSO_SEC_CHUNKSIZE", "5000"))
+CENSO_SEC_WORKERS = int(os.getenv("DB_BUILDER_CENSO_SEC_WORKERS", str(os.cpu_count() or 1)))
+# A coluna GEOGRAPHY do BigQuery (Base dos Dados) é exportada em WGS 84
+CENSO_SEC_SRID = 4326
+# Interpolação areal setores -> municípios/zonas (areal_interpolation.py): threads e setores por bloco
+INTERP_WORKERS = int(os.getenv("DB_BUILDER_INTERP_WORKERS", str(os.cpu_count() or 1)))
+INTERP_CHUNK = int(os.getenv("DB_BUILDER_INTERP_CHUNK", "2000"))
+
 # --- Configuração do candidato alvo (editar conforme necessário) ---
 # Nome exato como aparece no arquivo de votação (geralmente em MAIÚSCULAS)
 CANDIDATE_NAME = "ALEXANDRE MARANHÃO KHURY"
@@ -58,4 +119,72 @@ DB_CONFIG = {
     "port": "5432",
     "dbname": "geodata", # Nome do banco de dados definido no docker-compose.yml
     "schema": "public"      # Schema padrão
-}
\ No newline at end of file
+}
+
+# Partições (hash de cd_municipio) da resultados_secao e conexões usadas na carga paralela
+SECAO_PARTITIONS = int(os.getenv("DB_BUILDER_SECAO_PARTITIONS", "8"))
+LOAD_WORKERS = int(os.getenv("DB_BUILDER_LOAD_WORKERS", "4"))
+# Processos que limpam e carregam eleições diferentes ao mesmo tempo (cada um com LOAD_WORKERS conexões)
+ELECTION_WORKERS = int(os.getenv("DB_BUILDER_ELECTION_WORKERS", str(min(len(ELEICOES), os.cpu_count() or 1))))
+
+# Carga em tabelas de staging trocadas atomicamente no final (staging.py); "0" volta ao DROP + CREATE direto
+SWAP_LOAD = os.getenv("DB_BUILDER_SWAP_LOAD", "1") == "1"
+SWAP_LOCK_TIMEOUT = os.getenv("DB_BUILDER_SWAP_LOCK_TIMEOUT", "5s")
+
+# Linhas por bloco nas leituras em streaming do banco (DatabaseManager.stream_query)
+STREAM_FETCH_SIZE = int(os.getenv("DB_BUILDER_FETCH_SIZE", "50000"))
+
+# --- Instrumentação (instrumentation.py) ---
+# Arquivo de trace: ".jsonl" grava JSON lines; qualquer outra extensão grava no formato Chrome trace.
+# Vazio = apenas o resumo no final da execução.
+TRACE_FILE = os.getenv("DB_BUILDER_TRACE", "")
+# Fração (0 a 1) das consultas de leitura reexecutadas com EXPLAIN ANALYZE para medir o tempo no banco
+TRACE_EXPLAIN_SAMPLE = float(os.getenv("DB_BUILDER_TRACE_EXPLAIN", "0"))
+
+# --- Estatísticas espaciais ---
+# Calcula o I de Moran dentro do Postgres (spatial_analysis.py) em vez de trazer as geometrias para o Python
+MORAN_SERVER_SIDE = os.getenv("DB_BUILDER_MORAN_SQL", "0") == "1"
+MORAN_PERMUTATIONS = 999
+
+# Pesos espaciais do Moran e do diagnóstico do GWR (spatial_weights.py):
+# "queen" (contiguidade de polígonos), "knn" (k vizinhos mais próximos) ou "distance" (banda de distância)
+SPATIAL_WEIGHTS = os.getenv("DB_BUILDER_WEIGHTS", "queen")
+WEIGHTS_K = int(os.getenv("DB_BUILDER_WEIGHTS_K", "8"))
+# Raio da banda de distância, em metros (coordenadas projetadas em METRIC_CRS)
+WEIGHTS_THRESHOLD = float(os.getenv("DB_BUILDER_WEIGHTS_THRESHOLD", "50000"))
+# SIRGAS 2000 / Brazil Polyconic: distâncias em metros para todo o território nacional
+METRIC_CRS = "EPSG:5880"
+# Threads e pontos por bloco nas consultas ao KD-tree; matrizes gravadas em .npz para reaproveitamento
+WEIGHTS_WORKERS = int(os.getenv("DB_BUILDER_WEIGHTS_WORKERS", str(os.cpu_count() or 1)))
+WEIGHTS_CHUNK = int(os.getenv("DB_BUILDER_WEIGHTS_CHUNK", "20000"))
+WEIGHTS_DIR = os.path.join(PROCESSED_DIR, "weights")
+# Gi* (hotspots.py): permutações da inferência condicional e memória (MB) por lote de unidades
+HOTSPOT_PERMUTATIONS = int(os.getenv("DB_BUILDER_HOTSPOT_PERMUTATIONS", "999"))
+HOTSPOT_BATCH_MB = int(os.getenv("DB_BUILDER_HOTSPOT_BATCH_MB", "256"))
+# Inclui o Gi* no `analyze --metrics` (SpatialMetricsAnalysis.run_all); o comando `hotspots` roda sempre
+METRICS_HOTSPOTS = os.getenv("DB_BUILDER_METRICS_HOTSPOTS", "0") == "1"
+# Semente das permutações; sem a variável (ou vazia) não há semente. 0 é uma semente válida
+_hotspot_seed = os.getenv("DB_BUILDER_HOTSPOT_SEED")
+HOTSPOT_SEED = int(_hotspot_seed) if _hotspot_seed not in (None, "") else None
+# Largura de banda do GWR em vizinhos mais próximos (kernel adaptativo); 0 = busca pelo Sel_BW
+GWR_BANDWIDTH = int(os.getenv("DB_BUILDER_GWR_BANDWIDTH", "0")) or None
+
+# Consultas por candidato em paralelo via asyncpg (async_db.py), se instalado
+ASYNC_QUERIES = os.getenv("DB_BUILDER_ASYNC", "1") == "1"
+ASYNC_POOL_SIZE = int(os.getenv("DB_BUILDER_ASYNC_POOL", "4"))
+
+# --- Backend das análises ---
+# "postgres" (padrão) ou "duckdb": as análises rodam em processo sobre os Parquet/GeoParquet
+# do processamento (duck_db.py), sem precisar do PostGIS
+ANALYSIS_BACKEND = os.getenv("DB_BUILDER_BACKEND", "postgres")
+# Arquivo do DuckDB; ":memory:" recria as tabelas derivadas a cada execução
+DUCKDB_PATH = os.getenv("DB_BUILDER_DUCKDB", ":memory:")
+PARQUET_DIR = os.path.join(PROCESSED_DIR, "parquet")
+# Tabela -> Parquet (gravados pelo processamento quando ANALYSIS_BACKEND = "duckdb")
+PARQUET_FILES = {
+    table: os.path.join(PARQUET_DIR, f"{table}.parquet")
+    for table in ["censo_mun", "censo_sec_mun", "rais_agg", "extra", f"votacao_dep_{CANDIDATE_SLUG}"]
+}
+# Os setores censitários já saem do processamento em GeoParquet (PROCESSED_FILES["censo_sec"])
+# A votação por seção é uma pasta particionada no estilo Hive: resultados_secao/ano=2022/sg_uf=PR/
+PARQUET_FILES["resultados_secao"] = os.path.join(PARQUET_DIR, "resultados_secao")
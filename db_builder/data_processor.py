@@ -1,35 +1,297 @@
+import os
+import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from config import FILES, PROCESSED_FILES
+from config import (FILES, PROCESSED_FILES, VOTACAO_CHUNKSIZE, ANALYSIS_BACKEND, PARQUET_FILES,
+                    ANO, UF, ELEICOES, ELECTION_WORKERS, voting_file, check_sources,
+                    CENSO_SEC_CHUNKSIZE, CENSO_SEC_WORKERS, CENSO_SEC_SRID)
+from instrumentation import tracer
+from profiling import profile_dataframe, profiles, merge_profile
+
+# Colunas da votação por seção que compõem a resultados_secao (mesma seleção do database.ipynb)
+VOTACAO_SECAO_COLUMNS = [
+    "CD_MUNICIPIO", "NM_MUNICIPIO", "NR_ZONA", "NR_SECAO", "NR_VOTAVEL", "NM_VOTAVEL",
+    "QT_VOTOS", "SQ_CANDIDATO", "NR_LOCAL_VOTACAO", "NM_LOCAL_VOTACAO", "DS_LOCAL_VOTACAO_ENDERECO",
+]
+
+# Tipos da leitura: textos repetidos (poucos milhares de valores distintos em milhões de linhas)
+# viram categorias; códigos são lidos como int32 (SQ_CANDIDATO não cabe) e depois reduzidos.
+# Obs.: não declarar int16 direto no read_csv, que estoura silenciosamente valores fora da faixa.
+VOTACAO_DTYPES = {
+    "DS_CARGO": "category",
+    "NM_MUNICIPIO": "category",
+    "NM_VOTAVEL": "category",
+    "NM_LOCAL_VOTACAO": "category",
+    "DS_LOCAL_VOTACAO_ENDERECO": "category",
+    "CD_MUNICIPIO": "int32",
+    "NR_ZONA": "int32",
+    "NR_SECAO": "int32",
+    "NR_VOTAVEL": "int32",
+    "QT_VOTOS": "int32",
+    "SQ_CANDIDATO": "int64",
+    "NR_LOCAL_VOTACAO": "int32",
+}
+
+# Tipos da malha municipal do IBGE (os códigos vêm como texto no shapefile), aplicados em um único astype
+GEO_MUN_DTYPES = {
+    "CD_MUN": "int32", "NM_MUN": "str",
+    "CD_RGI": "int32", "NM_RGI": "str",
+    "CD_RGINT": "int32", "NM_RGINT": "str",
+    "CD_UF": "int16", "NM_UF": "str", "SIGLA_UF": "str",
+    "CD_REGIA": "int16", "NM_REGIA": "str", "SIGLA_RG": "str",
+    "AREA_KM2": "float64",
+}
+GEO_MUN_COLUMNS = [
+    "CD_MUN_TSE", "CD_MUN_IBG", "NM_MUN", "CD_RGI", "NM_RGI", "CD_RGINT", "NM_RGINT",
+    "CD_UF", "NM_UF", "SIGLA_UF", "CD_REGIA", "NM_REGIA", "SIGLA_RG", "AREA_KM2", "geometry",
+]
+
+# Saídas do processamento desta execução, por chave de PROCESSED_FILES.
+# O DatabaseManager carrega daqui por COPY binário (transfer.write_frame) em vez de reler os CSVs.
+PROCESSED_FRAMES = {}
+
+def compact_int_columns(df):
+    """Reduz cada coluna inteira ao menor tipo que comporta seus valores (ex.: NR_ZONA -> int16)"""
+    for col in df.select_dtypes(include="integer").columns:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+# Colunas verificadas na limpeza (database.ipynb): textos com marcadores de ausência do TSE
+# e códigos numéricos em que valores negativos são sentinelas (ex.: SQ_CANDIDATO = -1 em votos de legenda)
+SECAO_TEXT_COLUMNS = ["NM_MUNICIPIO", "NM_VOTAVEL", "NM_LOCAL_VOTACAO", "DS_LOCAL_VOTACAO_ENDERECO"]
+SECAO_NUMERIC_COLUMNS = ["CD_MUNICIPIO", "NR_ZONA", "NR_SECAO", "NR_VOTAVEL", "QT_VOTOS", "SQ_CANDIDATO", "NR_LOCAL_VOTACAO"]
+TSE_MISSING_TEXT = ["#NULO", "#NE"]
+
+def read_voting_data(usecols=None, chunksize=None, path=None):
+    """
+    Lê o CSV de votação por seção (`path`, padrão FILES["votacao"]) com categorias e os menores
+    inteiros possíveis. Com chunksize, retorna um iterador de DataFrames (cada um já compactado).
+    """
+    usecols = usecols or ["DS_CARGO"] + VOTACAO_SECAO_COLUMNS
+    reader = pd.read_csv(
+        path or FILES["votacao"],
+        sep=";",
+        encoding="latin1",
+        usecols=usecols,
+        dtype={col: VOTACAO_DTYPES[col] for col in usecols if col in VOTACAO_DTYPES},
+        chunksize=chunksize,
+    )
+    if chunksize is None:
+        return compact_int_columns(reader)
+    return (compact_int_columns(chunk) for chunk in reader)
+
+class SectionProfile:
+    """
+    Perfil da votação por seção acumulado em uma única passada pelos chunks
+    (substitui os loops com np.unique e o describe() do database.ipynb).
+    """
+
+    def __init__(self):
+        self.rows_in = 0
+        self.rows_cargo = 0
+        self.rows_out = 0
+        self.rows_na = 0
+        self.missing_text = pd.Series(0, index=SECAO_TEXT_COLUMNS, dtype="int64")
+        self.negative = pd.Series(0, index=SECAO_NUMERIC_COLUMNS, dtype="int64")
+        self.minimum = pd.Series(np.nan, index=SECAO_NUMERIC_COLUMNS)
+        self.maximum = pd.Series(np.nan, index=SECAO_NUMERIC_COLUMNS)
+        self.value_counts = {col: pd.Series(dtype="int64") for col in SECAO_TEXT_COLUMNS}
+        self.votes = pd.Series(dtype="int64")
+
+    def update(self, rows_in, df, missing_text, negative, valid):
+        """Soma os contadores de um chunk (df já filtrado pelo cargo, antes de remover os inválidos)"""
+        self.rows_in += rows_in
+        self.rows_cargo += len(df)
+        self.rows_out += int(valid.sum())
+        self.rows_na += int(df.isna().any(axis=1).sum())
+        self.missing_text = self.missing_text.add(missing_text.sum(), fill_value=0)
+        self.negative = self.negative.add(negative.sum(), fill_value=0)
+
+        clean = df[valid]
+        if clean.empty:
+            return
+        numeric = clean[SECAO_NUMERIC_COLUMNS]
+        self.minimum = np.fmin(self.minimum, numeric.min())
+        self.maximum = np.fmax(self.maximum, numeric.max())
+        for col in SECAO_TEXT_COLUMNS:
+            counts = clean[col].value_counts()
+            self.value_counts[col] = self.value_counts[col].add(counts[counts > 0], fill_value=0)
+        votes = clean.groupby("NM_VOTAVEL", observed=True)["QT_VOTOS"].sum()
+        self.votes = self.votes.add(votes, fill_value=0)
+
+    def report(self, top=10):
+        print(f"  - Linhas lidas: {self.rows_in} | Deputado Estadual: {self.rows_cargo} | válidas: {self.rows_out}")
+        print(f"  - Linhas com valores ausentes (NaN): {self.rows_na}")
+        print(f"  - Valores de texto ausentes (#NULO/#NE): {self.missing_text.astype(int).to_dict()}")
+        print(f"  - Códigos negativos removidos por coluna: {self.negative.astype(int).to_dict()}")
+        ranges = ", ".join(f"{col}={lo:.0f}..{hi:.0f}" for col, lo, hi in zip(SECAO_NUMERIC_COLUMNS, self.minimum, self.maximum))
+        print(f"  - Faixa dos códigos: {ranges}")
+        for col in SECAO_TEXT_COLUMNS:
+            print(f"  - {col}: {len(self.value_counts[col])} valores distintos")
+        print(f"  - Mais votados: {self.votes.sort_values(ascending=False).head(top).astype(int).to_dict()}")
+
+    def merge(self, other):
+        """Soma o perfil de outra eleição/processo a este"""
+        self.rows_in += other.rows_in
+        self.rows_cargo += other.rows_cargo
+        self.rows_out += other.rows_out
+        self.rows_na += other.rows_na
+        self.missing_text = self.missing_text.add(other.missing_text, fill_value=0)
+        self.negative = self.negative.add(other.negative, fill_value=0)
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        for col in SECAO_TEXT_COLUMNS:
+            self.value_counts[col] = self.value_counts[col].add(other.value_counts[col], fill_value=0)
+        self.votes = self.votes.add(other.votes, fill_value=0)
+        return self
+
+def in_processes(n_jobs, workers=ELECTION_WORKERS):
+    """As eleições rodam em processos separados (map_elections) ou em sequência neste processo"""
+    return workers > 1 and n_jobs > 1
+
+def map_elections(fn, jobs, workers=ELECTION_WORKERS):
+    """
+    Executa fn(*args) para cada eleição de `jobs` ({(ano, uf): args}) e retorna {(ano, uf): resultado}.
+    Com mais de um worker, cada eleição roda em um processo próprio e as eleições ocupam todos os
+    núcleos. Os processos são criados com spawn (não herdam as conexões abertas deste processo),
+    então `fn` deve ser uma função de módulo e receber caminhos e configuração nos argumentos.
+    """
+    if not in_processes(len(jobs), workers):
+        return {key: fn(*args) for key, args in jobs.items()}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context) as executor:
+        futures = {key: executor.submit(fn, *args) for key, args in jobs.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+def collect_section_profiles(results, parallel):
+    """
+    Junta os perfis devolvidos pelas eleições (SectionProfile, perfil da votacao_secao).
+    Os perfis de colunas voltam para o registro do profiling; vindos de outros processos,
+    as linhas também entram no tracer (que só existe neste processo).
+    """
+    total = SectionProfile()
+    for (ano, uf), (profile, table_profile) in sorted(results.items()):
+        print(f"  Eleição {ano}/{uf}:")
+        profile.report()
+        total.merge(profile)
+        merge_profile(table_profile)
+        if parallel:
+            tracer.add_rows(rows_in=profile.rows_in, rows_out=profile.rows_out)
+    return total
+
+def vote_codes(nr_votavel):
+    """
+    Partido e candidato derivados do número votado, na mesma passada da limpeza:
+    votos nominais têm 4 ou 5 dígitos (os 2 primeiros são o partido);
+    votos de legenda, brancos e nulos ficam com NA.
+    """
+    nr = nr_votavel.to_numpy(dtype=np.int32)
+    legenda = nr < 1000
+    partido = np.where(nr >= 10000, nr // 1000, nr // 100).astype(np.int16)
+    return pd.arrays.IntegerArray(partido, legenda), pd.arrays.IntegerArray(nr, legenda.copy())
+
+def iter_voting_sections(chunksize=VOTACAO_CHUNKSIZE, profile=None, eleicao=(ANO, UF), path=None):
+    """
+    Limpeza da votação por seção em streaming (antes feita no database.ipynb):
+    filtra Deputado Estadual, seleciona as colunas da resultados_secao e remove
+    linhas com códigos negativos. Gera um DataFrame limpo por chunk, com as chaves
+    da eleição (ANO, SG_UF) que particionam a resultados_secao e NR_PARTIDO/NR_CANDIDATO
+    (vote_codes), e, se `profile` for
+    informado, acumula os contadores de perfil na mesma passada.
+    """
+    ano, uf = eleicao
+    for chunk in read_voting_data(chunksize=chunksize, path=path or voting_file(ano, uf)):
+        rows_in = len(chunk)
+        df = chunk.loc[chunk["DS_CARGO"] == "DEPUTADO ESTADUAL", VOTACAO_SECAO_COLUMNS]
+
+        # Máscaras vetorizadas de validade
+        missing_text = df[SECAO_TEXT_COLUMNS].isin(TSE_MISSING_TEXT)
+        negative = df[SECAO_NUMERIC_COLUMNS] < 0
+        valid = ~negative.any(axis=1)
+
+        if profile is not None:
+            profile.update(rows_in, df, missing_text, negative, valid)
+        # Perfil de qualidade por coluna (antes de remover as sentinelas, para contá-las)
+        profile_dataframe("votacao_secao", df)
+        tracer.add_rows(rows_in=rows_in, rows_out=int(valid.sum()))
+        df = df[valid]
+        nr_partido, nr_candidato = vote_codes(df["NR_VOTAVEL"])
+        yield df.assign(ANO=np.int16(ano), SG_UF=uf, NR_PARTIDO=nr_partido, NR_CANDIDATO=nr_candidato)
+
+def save_parquet(table, df):
+    """Cópia em Parquet de uma saída do processamento, lida pelo backend DuckDB (duck_db.py)"""
+    if ANALYSIS_BACKEND != "duckdb":
+        return
+    os.makedirs(os.path.dirname(PARQUET_FILES[table]), exist_ok=True)
+    df.to_parquet(PARQUET_FILES[table], index=False, engine="pyarrow")
+
+def _write_sections_parquet(ano, uf, path, out_dir, chunksize):
+    """Uma eleição da save_sections_parquet; roda em um processo próprio (map_elections)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ("cd_municipio", pa.int32()), ("nm_municipio", pa.string()), ("nr_zona", pa.int16()),
+        ("nr_secao", pa.int16()), ("nr_votavel", pa.int32()), ("nm_votavel", pa.string()),
+        ("qt_votos", pa.int16()), ("sq_candidato", pa.int64()), ("nr_local_votacao", pa.int16()),
+        ("nm_local_votacao", pa.string()), ("ds_local_votacao_endereco", pa.string()),
+        ("nr_partido", pa.int16()), ("nr_candidato", pa.int32()),
+    ])
+    # ano e sg_uf ficam no caminho (particionamento Hive), não nas colunas
+    partition_dir = os.path.join(out_dir, f"ano={ano}", f"sg_uf={uf}")
+    os.makedirs(partition_dir, exist_ok=True)
+    profile = SectionProfile()
+    with pq.ParquetWriter(os.path.join(partition_dir, "part-0.parquet"), schema) as writer:
+        for chunk in iter_voting_sections(chunksize=chunksize, profile=profile, eleicao=(ano, uf), path=path):
+            # Cast seguro: categorias viram texto e os inteiros são reduzidos com verificação de faixa
+            table = pa.Table.from_pandas(chunk.rename(columns=str.lower), preserve_index=False)
+            writer.write_table(table.select(schema.names).cast(schema))
+    return profile, profiles.pop("votacao_secao", None)
+
+def save_sections_parquet(chunksize=VOTACAO_CHUNKSIZE, eleicoes=ELEICOES, workers=ELECTION_WORKERS):
+    """
+    Grava a votação por seção limpa (iter_voting_sections) em Parquet, chunk a chunk,
+    com os mesmos tipos da resultados_secao no Postgres, em uma pasta particionada por
+    ano e UF. As eleições são gravadas em paralelo (map_elections). Usado pelo backend DuckDB.
+    """
+    out_dir = PARQUET_FILES["resultados_secao"]
+    print(f"Gravando resultados_secao em Parquet ({len(eleicoes)} eleições)...")
+    jobs = {(ano, uf): (ano, uf, voting_file(ano, uf), out_dir, chunksize) for ano, uf in eleicoes}
+    results = map_elections(_write_sections_parquet, jobs, workers)
+    collect_section_profiles(results, in_processes(len(jobs), workers))
+    print(f"  - Salvo em: {out_dir}")
 
 def process_voting_data():
     try:
-        df_votacao = pd.read_csv(
-            FILES["votacao"],
-            sep=";",
-            encoding="latin1",
-            usecols=["CD_MUNICIPIO", "DS_CARGO", "NM_VOTAVEL", "QT_VOTOS"]
-        )
+        df_votacao = read_voting_data(["CD_MUNICIPIO", "DS_CARGO", "NM_VOTAVEL", "QT_VOTOS"])
 
         candidate_name = __import__('config').CANDIDATE_NAME
         candidate_slug = __import__('config').CANDIDATE_SLUG
         out_key = f"votacao_dep_{candidate_slug}"
 
+        tracer.add_rows(rows_in=len(df_votacao))
+
         # Filtra apenas para o cargo de Deputado Estadual
-        df_dep = df_votacao[df_votacao["DS_CARGO"] == "DEPUTADO ESTADUAL"].copy()
+        df_dep = df_votacao[df_votacao["DS_CARGO"] == "DEPUTADO ESTADUAL"]
 
         # Calcula o total de votos para Deputado Estadual por município
-        total_votos_mun = df_dep.groupby("CD_MUNICIPIO")["QT_VOTOS"].sum().reset_index()
+        # (soma em int64 para não estourar o tipo reduzido de QT_VOTOS)
+        total_votos_mun = df_dep.groupby("CD_MUNICIPIO")["QT_VOTOS"].sum().astype("int64").reset_index()
         total_votos_mun.rename(columns={"QT_VOTOS": "total_votos_dep_est"}, inplace=True)
 
         # Calcula os votos para o candidato específico por município
-        df_cand = df_dep[df_dep["NM_VOTAVEL"] == candidate_name].copy()
-        votos_cand_mun = df_cand.groupby("CD_MUNICIPIO")["QT_VOTOS"].sum().reset_index()
+        # A comparação é feita sobre o código inteiro da categoria, não sobre strings
+        nm_votavel = df_dep["NM_VOTAVEL"].cat
+        cand_code = nm_votavel.categories.get_loc(candidate_name) if candidate_name in nm_votavel.categories else -2
+        df_cand = df_dep[nm_votavel.codes == cand_code]
+        votos_cand_mun = df_cand.groupby("CD_MUNICIPIO")["QT_VOTOS"].sum().astype("int64").reset_index()
         votos_cand_mun.rename(columns={"QT_VOTOS": "votos_candidato"}, inplace=True)
 
         # Junta os dados e calcula o percentual
         df_agg = pd.merge(total_votos_mun, votos_cand_mun, on="CD_MUNICIPIO", how="left")
-        df_agg["votos_candidato"].fillna(0, inplace=True)
+        df_agg["votos_candidato"] = df_agg["votos_candidato"].fillna(0)
         df_agg["percentual_candidato"] = (df_agg["votos_candidato"] / df_agg["total_votos_dep_est"]) * 100
 
         # Mapeia o código do TSE para o do IBGE
@@ -42,6 +304,9 @@ def process_voting_data():
 
         # Salva o arquivo processado
         df_final.to_csv(PROCESSED_FILES[out_key], index=False, header=True, sep=";")
+        save_parquet(out_key, df_final)
+        PROCESSED_FRAMES[out_key] = df_final
+        tracer.add_rows(rows_out=len(df_final))
         print(f"Arquivo de votação para {candidate_name} salvo em: {PROCESSED_FILES[out_key]}")
 
     except Exception as e:
@@ -54,33 +319,91 @@ def process_voting_data():
 def process_census_municipio():
     print("Processando Censo Município...")
     df = pd.read_csv(FILES["censo_mun"], sep=",", encoding="utf-8")
+    tracer.add_rows(rows_in=len(df))
     
-    df = df[df["sigla_uf"] == "PR"]
+    df = df[df["sigla_uf"] == UF]
     
     columns = [
         "id_municipio", "domicilios", "populacao", "area",
         "taxa_alfabetizacao", "idade_mediana", "razao_sexo",
         "indice_envelhecimento"
     ]
-    df = df[columns]
+    df = profile_dataframe("censo_mun", df[columns])
     
     df.to_csv(PROCESSED_FILES["censo_mun"], index=False, header=False, sep=";")
+    save_parquet("censo_mun", df)
+    PROCESSED_FRAMES["censo_mun"] = df
+    tracer.add_rows(rows_out=len(df))
 
-def process_census_sector():
+# Colunas e tipos dos setores censitários (fixos: a inferência por chunk poderia variar entre int e float)
+CENSO_SEC_DTYPES = {
+    "id_municipio": "int32", "id_setor_censitario": "int64", "pessoas": "Int32", "domicilios": "Int32",
+    "media_moradores_domicilios": "float64", "area": "float64", "geometria": "str",
+}
+
+def _censo_sec_schema():
+    """Schema Arrow da saída, com os metadados GeoParquet da coluna geometria (WKB)"""
+    import pyarrow as pa
+    from pyproj import CRS
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometria",
+        "columns": {"geometria": {"encoding": "WKB", "geometry_types": [],
+                                  "crs": CRS.from_epsg(CENSO_SEC_SRID).to_json_dict()}},
+    }
+    schema = pa.schema([
+        ("id_municipio", pa.int32()), ("id_setor_censitario", pa.int64()), ("pessoas", pa.int32()),
+        ("domicilios", pa.int32()), ("media_moradores_domicilios", pa.float64()), ("area", pa.float64()),
+        ("geometria", pa.binary()),
+    ])
+    return schema.with_metadata({b"geo": json.dumps(geo).encode()})
+
+def _sector_wkb(df):
+    """WKT -> WKB de um chunk, vetorizado (shapely 2 libera o GIL, então os chunks convertem em paralelo)"""
+    import shapely
+    geoms = shapely.from_wkt(df["geometria"].to_numpy(), on_invalid="warn")
+    return df.assign(geometria=shapely.to_wkb(geoms))
+
+def ordered_map(executor, fn, items, max_pending):
+    """executor.map na ordem de `items`, com no máximo `max_pending` itens em processamento (memória limitada)"""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def process_census_sector(chunksize=CENSO_SEC_CHUNKSIZE, workers=CENSO_SEC_WORKERS):
+    """
+    Setores censitários em streaming: o CSV é lido em chunks (só as colunas usadas), a geometria
+    WKT vira WKB em threads e cada chunk é acrescentado ao GeoParquet como um row group.
+    A memória depende do chunksize e do número de threads, não do número de setores;
+    a carga no Postgres relê o arquivo pelos row groups (DatabaseManager.load_censo_sec).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
     print("Processando Censo Setor...")
-    df = pd.read_csv(FILES["censo_sec"], sep=",", encoding="utf-8")
-    
-    columns = [
-        "id_municipio", "id_setor_censitario", "pessoas", "domicilios",
-        "media_moradores_domicilios", "area", "geometria"
-    ]
-    df = df[columns]
-    
-    df.to_csv(PROCESSED_FILES["censo_sec"], index=False, header=False, sep=";")
+    reader = pd.read_csv(FILES["censo_sec"], sep=",", encoding="utf-8", usecols=list(CENSO_SEC_DTYPES),
+                         dtype=CENSO_SEC_DTYPES, chunksize=chunksize)
+    schema = _censo_sec_schema()
+    path = PROCESSED_FILES["censo_sec"]
+    rows = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor, \
+            pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for df in ordered_map(executor, _sector_wkb, reader, max(1, workers) + 1):
+            df = df[list(CENSO_SEC_DTYPES)]
+            profile_dataframe("censo_sec", df.drop(columns="geometria"))
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            rows += len(df)
+    tracer.add_rows(rows_in=rows, rows_out=rows)
+    print(f"  - {rows} setores salvos em: {path}")
 
 def process_rais():
     print("Processando RAIS (Otimizado)...")
     df = pd.read_csv(FILES["rais"], sep=",", encoding="utf-8")
+    tracer.add_rows(rows_in=len(df))
+    profile_dataframe("rais", df)
     
     # Otimização: Pré-agregar os dados da RAIS
     # A análise final só precisa da média da remuneração por município.
@@ -92,16 +415,83 @@ def process_rais():
     
     # Salva o arquivo agregado, que é muito menor.
     rais_agg.to_csv(PROCESSED_FILES["rais"], index=False, header=True, sep=";")
+    save_parquet("rais_agg", rais_agg)
+    PROCESSED_FRAMES["rais"] = rais_agg
+    tracer.add_rows(rows_out=len(rais_agg))
     print(f"  - Arquivo RAIS agregado e otimizado salvo em: {PROCESSED_FILES['rais']}")
 
 def process_extra():
     print("Processando Dados Extras (Conectividade)...")
-    df = pd.read_csv(FILES["extra"], sep=",", encoding="utf-8")
+    df = profile_dataframe("extra", pd.read_csv(FILES["extra"], sep=",", encoding="utf-8"))
     df.to_csv(PROCESSED_FILES["extra"], index=False, header=False, sep=";")
+    save_parquet("extra", df)
+    PROCESSED_FRAMES["extra"] = df
+    tracer.add_rows(rows_in=len(df), rows_out=len(df))
+
+def read_mapa_municipios():
+    """Mapa de códigos de município TSE <-> IBGE (mapa-cod-municipio.csv)"""
+    return pd.read_csv(FILES["mapa_cod"], usecols=["id_municipio_tse", "id_municipio_ibge"],
+                       dtype={"id_municipio_tse": "int32", "id_municipio_ibge": "int32"})
+
+def process_geo_mun():
+    """
+    Malha municipal enriquecida com o código TSE (antigo create_cd_mun.py).
+    Leitura vetorizada pelo pyogrio com Arrow, só das colunas usadas; saída em GeoParquet,
+    carregada no PostGIS por DatabaseManager.load_geo_mun.
+    """
+    import geopandas as gpd
+    print("Processando malha municipal (geo_mun)...")
+    gdf = gpd.read_file(FILES["shp_geo_mun"], engine="pyogrio", use_arrow=True,
+                        columns=list(GEO_MUN_DTYPES))
+    tracer.add_rows(rows_in=len(gdf))
+    gdf = gdf.astype(GEO_MUN_DTYPES)
+
+    mapa = read_mapa_municipios().rename(columns={"id_municipio_tse": "CD_MUN_TSE"})
+    gdf = gdf.merge(mapa, left_on="CD_MUN", right_on="id_municipio_ibge", how="left")
+    gdf = gdf.rename(columns={"CD_MUN": "CD_MUN_IBG"})[GEO_MUN_COLUMNS]
+    # Municípios sem correspondência no TSE ficam com NULL (sem virar float)
+    gdf["CD_MUN_TSE"] = gdf["CD_MUN_TSE"].astype("Int32")
+    profile_dataframe("geo_mun", gdf.drop(columns="geometry"))
+
+    gdf.to_parquet(PROCESSED_FILES["geo_mun"], index=False)
+    PROCESSED_FRAMES["geo_mun"] = gdf
+    tracer.add_rows(rows_out=len(gdf))
+    print(f"  - Malha municipal salva em: {PROCESSED_FILES['geo_mun']}")
+
+def process_sector_municipio():
+    """
+    Pessoas e domicílios dos setores censitários interpolados pela área para a malha municipal
+    (areal_interpolation.area_interpolate, com STRtree). Usa as saídas de process_census_sector
+    e process_geo_mun.
+    """
+    import geopandas as gpd
+    from areal_interpolation import area_interpolate
+    print("Interpolando setores censitários para os municípios...")
+    setores = gpd.read_parquet(PROCESSED_FILES["censo_sec"])
+    gdf = PROCESSED_FRAMES.get("geo_mun")
+    if gdf is None:
+        gdf = gpd.read_parquet(PROCESSED_FILES["geo_mun"], columns=["CD_MUN_IBG", "geometry"])
+    tracer.add_rows(rows_in=len(setores))
+
+    df = area_interpolate(setores, gdf[["CD_MUN_IBG", "geometry"]], extensive=["pessoas", "domicilios"])
+    df.insert(0, "id_municipio", gdf["CD_MUN_IBG"].astype("int32").to_numpy())
+    # Área em km² (METRIC_CRS em metros)
+    df["area_sobreposta"] = df["area_sobreposta"] / 1e6
+    df = profile_dataframe("censo_sec_mun", df.reset_index(drop=True))
+
+    df.to_csv(PROCESSED_FILES["censo_sec_mun"], index=False, header=True, sep=";")
+    save_parquet("censo_sec_mun", df)
+    PROCESSED_FRAMES["censo_sec_mun"] = df
+    tracer.add_rows(rows_out=len(df))
+    print(f"  - {len(df)} municípios salvos em: {PROCESSED_FILES['censo_sec_mun']}")
 
 def run_all_processing():
-    process_voting_data()
-    process_census_municipio()
-    process_census_sector()
-    process_rais()
-    process_extra()
\ No newline at end of file
+    check_sources()
+    steps = [process_voting_data, process_census_municipio, process_census_sector,
+             process_rais, process_extra, process_geo_mun, process_sector_municipio]
+    if ANALYSIS_BACKEND == "duckdb":
+        # No Postgres a resultados_secao é carregada direto do CSV (DatabaseManager.load_resultados_secao)
+        steps.append(save_sections_parquet)
+    for step in steps:
+        with tracer.stage(step.__name__):
+            step()
\ No newline at end of file
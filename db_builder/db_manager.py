@@ -1,10 +1,36 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
+import pandas as pd
+import shapely
 from sqlalchemy import create_engine
 import geopandas as gpd
-from config import DB_CONFIG, PROCESSED_FILES, FILES
+from config import (DB_CONFIG, PROCESSED_FILES, FILES, STREAM_FETCH_SIZE, SECAO_PARTITIONS, LOAD_WORKERS,
+                    SWAP_LOAD, SWAP_LOCK_TIMEOUT, ANALYSIS_BACKEND, ANO, UF, ELEICOES, ELECTION_WORKERS,
+                    election_suffix, voting_file, CENSO_SEC_SRID, SHP_MUN_TABLE)
+from queries import PreparedQuery, atributos_mun_sql
+from instrumentation import tracer, TracingCursor
+from profiling import save_profiles
+from transfer import write_frame, read_frame
+from staging import staging_name, swap_tables, write_geo_table
 import importlib
 
+# Tipos pandas para as colunas de stream_query, pelo OID do tipo no Postgres.
+# Inteiros anuláveis mantêm o mesmo tipo em todos os blocos, mesmo quando um bloco traz NULLs.
+PG_DTYPES = {
+    16: "boolean",    # bool
+    20: "Int64",      # int8
+    21: "Int16",      # int2
+    23: "Int32",      # int4
+    700: "float32",   # float4
+    701: "float64",   # float8
+    1700: "float64",  # numeric
+}
+
 class DatabaseManager:
+    backend = "postgres"
+
     def __init__(self):
         # Carrega a configuração do arquivo config.py
         self.db_config = DB_CONFIG
@@ -14,16 +40,128 @@ class DatabaseManager:
         self.conn_str = f"postgresql://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/{self.db_config['dbname']}"
         
         # Conexão Psycopg2
-        self.conn = psycopg2.connect(
+        self.conn = self._connect()
+        self.cur = self.conn.cursor()
+        self.engine = create_engine(self.conn_str)
+        tracer.instrument_engine(self.engine)
+        
+        # Consultas preparadas no servidor (válidas apenas nesta conexão)
+        self.prepared = {}
+        # Nomes únicos para os cursores de stream_query
+        self._stream_ids = itertools.count()
+        # Tabelas construídas em staging nesta carga, à espera de publish_tables ({tabela: staging})
+        self.staged = {}
+
+    def _connect(self):
+        return psycopg2.connect(
             dbname=self.db_config['dbname'],
             user=self.db_config['user'],
             password=self.db_config['password'],
             host=self.db_config['host'],
             port=self.db_config['port'],
-            options=f"-c search_path={self.schema},public"
+            options=f"-c search_path={self.schema},public",
+            cursor_factory=TracingCursor
         )
-        self.cur = self.conn.cursor()
-        self.engine = create_engine(self.conn_str)
+
+    def stream_query(self, sql, params=None, fetch_size=STREAM_FETCH_SIZE, geom_col=None, crs=None, arrow=False):
+        """
+        Lê o resultado de `sql` em blocos de `fetch_size` linhas via cursor nomeado (server-side),
+        sem materializar tudo de uma vez. Gera DataFrames (GeoDataFrames se `geom_col`
+        for informado, ou pyarrow.Table com arrow=True). Parâmetros no formato %(nome)s.
+        Usa uma conexão própria, então a conexão principal continua livre durante a leitura.
+        """
+        conn = self._connect()
+        try:
+            with conn.cursor(name=f"stream_{next(self._stream_ids)}") as cur:
+                cur.itersize = fetch_size
+                cur.execute(sql, params)
+                columns = None
+                while True:
+                    rows = cur.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    if columns is None:
+                        columns = [desc[0] for desc in cur.description]
+                        dtypes = {desc[0]: PG_DTYPES[desc[1]] for desc in cur.description if desc[1] in PG_DTYPES}
+                    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True).astype(dtypes)
+                    if geom_col is not None:
+                        # O psycopg2 entrega geometrias como EWKB em hexadecimal; sem `crs`, vale o SRID
+                        # da primeira geometria do primeiro bloco (como gpd.read_postgis)
+                        geoms = gpd.GeoSeries.from_wkb(df[geom_col])
+                        if crs is None and geoms.notna().any():
+                            srid = int(shapely.get_srid(geoms.dropna().iat[0]))
+                            crs = f"EPSG:{srid}" if srid > 0 else None
+                        df = gpd.GeoDataFrame(df, geometry=geoms.set_crs(crs, allow_override=True), crs=crs)
+                        if geom_col != "geometry":
+                            df = df.drop(columns=geom_col).rename_geometry(geom_col)
+                    elif arrow:
+                        import pyarrow as pa
+                        df = pa.Table.from_pandas(df, preserve_index=False)
+                    tracer.add_rows(rows_out=len(rows))
+                    yield df
+            conn.commit()
+        finally:
+            conn.close()
+
+    def read_sql(self, sql, params=None):
+        """Executa `sql` (parâmetros %(nome)s) e retorna um DataFrame"""
+        return pd.read_sql(sql, self.engine, params=params)
+
+    def read_frame(self, sql, params=None):
+        """Como read_sql, pela leitura binária de transfer.read_frame (ADBC, se instalado)"""
+        return read_frame(self, sql, params)
+
+    def read_geo(self, sql, params=None, geom_col="geometry"):
+        """Como read_sql, retornando um GeoDataFrame"""
+        return gpd.read_postgis(sql, self.engine, geom_col=geom_col, params=params)
+
+    def scalar(self, sql, params=None):
+        """Primeira coluna da primeira linha de `sql`"""
+        with self.engine.connect() as conn:
+            return conn.exec_driver_sql(sql, params).scalar()
+
+    def prepare(self, name, sql, arg_types):
+        """Registra (ou reaproveita) uma consulta preparada nesta conexão"""
+        if name not in self.prepared:
+            self.prepared[name] = PreparedQuery(self.conn, name, sql, arg_types)
+        return self.prepared[name]
+
+    def staging_table(self, table, always=False):
+        """
+        Nome em que a carga deve construir `table`: a versão de staging, publicada depois por
+        publish_tables (ou a própria tabela, com DB_BUILDER_SWAP_LOAD=0). always=True usa a
+        staging mesmo assim, para cargas que não cabem em uma transação (load_resultados_secao).
+        """
+        if not (SWAP_LOAD or always):
+            return table
+        self.staged[table] = staging_name(table)
+        return self.staged[table]
+
+    def resolve(self, table):
+        """Nome a ler: a versão em staging, se esta carga já a construiu e ainda não publicou"""
+        return self.staged.get(table, table)
+
+    def discard_staging(self, *tables):
+        """Descarta o staging de uma etapa que falhou; a versão publicada continua valendo"""
+        for table in tables:
+            staged = self.staged.pop(table, None)
+            if staged is not None:
+                self.cur.execute(f"DROP TABLE IF EXISTS {self.schema}.{staged}")
+        self.conn.commit()
+
+    def publish_tables(self):
+        """
+        Troca todas as tabelas construídas em staging pelas publicadas, em uma única transação
+        (staging.swap_tables). Até aqui as análises continuam lendo a versão anterior completa.
+        """
+        if not self.staged:
+            return
+        print(f"Publicando {len(self.staged)} tabelas no schema '{self.schema}': {', '.join(self.staged)}")
+        try:
+            swap_tables(self.conn, self.schema, self.staged, lock_timeout=SWAP_LOCK_TIMEOUT)
+            self.staged = {}
+        except Exception as e:
+            print(f"Erro ao publicar as tabelas (as versões anteriores foram mantidas): {e}")
 
     def create_schema(self):
         """Cria o schema se não existir"""
@@ -42,7 +180,10 @@ class DatabaseManager:
         # Determina a tabela de votação do candidato a partir da config
         config = importlib.import_module('config')
         candidate_slug = getattr(config, 'CANDIDATE_SLUG', 'khury')
-        vot_table = f"votacao_dep_{candidate_slug}"
+        vot_table = self.staging_table(f"votacao_dep_{candidate_slug}")
+        censo_mun, censo_sec, censo_sec_mun, rais_agg, extra = (
+            self.staging_table(t) for t in ("censo_mun", "censo_sec", "censo_sec_mun", "rais_agg", "extra")
+        )
 
         queries = [
             f"""
@@ -53,31 +194,37 @@ class DatabaseManager:
             );
             """,
             f"""
-            DROP TABLE IF EXISTS {self.schema}.censo_mun;
-            CREATE TABLE {self.schema}.censo_mun (
+            DROP TABLE IF EXISTS {self.schema}.{censo_mun};
+            CREATE TABLE {self.schema}.{censo_mun} (
                 id_municipio int, domicilios int, populacao int, area int,
                 taxa_alfabetizacao float, idade_mediana int, razao_sexo float,
                 indice_envelhecimento float
             );
             """,
             f"""
-            DROP TABLE IF EXISTS {self.schema}.censo_sec;
-            CREATE TABLE {self.schema}.censo_sec (
+            DROP TABLE IF EXISTS {self.schema}.{censo_sec};
+            CREATE TABLE {self.schema}.{censo_sec} (
                 id_municipio int, id_setor_censitario bigint, pessoas int,
                 domicilios int, media_moradores_domicilios float, area float,
-                geometria text -- Alterado para text para evitar problemas com geography
+                geometria geometry(Geometry, {CENSO_SEC_SRID})
+            );
+            """,
+            f"""
+            DROP TABLE IF EXISTS {self.schema}.{censo_sec_mun};
+            CREATE TABLE {self.schema}.{censo_sec_mun} (
+                id_municipio int, pessoas float, domicilios float, area_sobreposta float
             );
             """,
             f"""
-            DROP TABLE IF EXISTS {self.schema}.rais_agg;
-            CREATE TABLE {self.schema}.rais_agg (
+            DROP TABLE IF EXISTS {self.schema}.{rais_agg};
+            CREATE TABLE {self.schema}.{rais_agg} (
                 id_municipio int,
                 remuneracao_media float
             );
             """,
             f"""
-            DROP TABLE IF EXISTS {self.schema}.extra;
-            CREATE TABLE {self.schema}.extra (
+            DROP TABLE IF EXISTS {self.schema}.{extra};
+            CREATE TABLE {self.schema}.{extra} (
                 ano int, sigla_uf varchar, id_municipio int, ibc float,
                 cobertura_pop_4g5g float, fibra int, densidade_smp float,
                 hhi_smp int, densidade_scm float, hhi_scm int, adensamento_estacoes float
@@ -89,29 +236,364 @@ class DatabaseManager:
             self.cur.execute(query)
         self.conn.commit()
 
+    def create_resultados_secao_table(self, commit=True, partitions=SECAO_PARTITIONS, eleicoes=ELEICOES):
+        """
+        Cria a resultados_secao com os mesmos tipos compactos da leitura em pandas
+        (data_processor.VOTACAO_DTYPES): smallint para zona, seção, votos e local de votação.
+        nr_partido/nr_candidato já vêm da limpeza (data_processor.vote_codes), na mesma passada do COPY.
+        A tabela é particionada por eleição e, dentro dela, por hash de cd_municipio:
+        resultados_secao -> _2022 (ano) -> _2022_pr (UF) -> _2022_pr_p0, _p1, ... (`partitions`).
+        Consultas com ano/sg_uf (ou direto na partição da eleição, ver queries.secao_table)
+        leem só as partições daquela eleição; a recarga de um município reescreve só a partição dele.
+        Com commit=False a criação fica na transação da carga que vem a seguir.
+        A tabela é sempre criada em staging: a carga usa várias conexões e processos,
+        então a versão publicada só é substituída depois que todos terminam.
+        """
+        self.create_schema()
+        table = self.staging_table("resultados_secao", always=True)
+        queries = [f"""
+        DROP TABLE IF EXISTS {self.schema}.{table};
+        CREATE TABLE {self.schema}.{table} (
+            ano smallint NOT NULL, sg_uf char(2) NOT NULL,
+            cd_municipio int, nm_municipio varchar, nr_zona smallint, nr_secao smallint,
+            nr_votavel int, nm_votavel varchar, qt_votos smallint, sq_candidato bigint,
+            nr_local_votacao smallint, nm_local_votacao varchar, ds_local_votacao_endereco varchar,
+            nr_partido smallint, nr_candidato int
+        ) PARTITION BY LIST (ano);
+        """]
+        for ano in sorted({ano for ano, _ in eleicoes}):
+            queries.append(f"""
+            CREATE TABLE {self.schema}.{table}_{ano} PARTITION OF {self.schema}.{table}
+                FOR VALUES IN ({ano}) PARTITION BY LIST (sg_uf);
+            """)
+        for ano, uf in eleicoes:
+            election = f"{table}_{election_suffix(ano, uf)}"
+            queries.append(f"""
+            CREATE TABLE {self.schema}.{election} PARTITION OF {self.schema}.{table}_{ano}
+                FOR VALUES IN ('{uf}') PARTITION BY HASH (cd_municipio);
+            """)
+            for i in range(partitions):
+                queries.append(f"""
+                CREATE TABLE {self.schema}.{election}_p{i} PARTITION OF {self.schema}.{election}
+                    FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i});
+                """)
+        for query in queries:
+            self.cur.execute(query)
+        self.partition_map = {}
+        if commit:
+            self.conn.commit()
+
+    def index_resultados_secao(self):
+        """
+        Índices criados depois da carga (mais rápido que mantê-los durante o COPY).
+        Criados na tabela particionada, valem para todas as partições.
+        """
+        table = self.resolve("resultados_secao")
+        self.cur.execute(f"""
+        {self._secao_key_index(table)}
+        CREATE INDEX IF NOT EXISTS {table}_votavel_idx
+            ON {self.schema}.{table} (nm_votavel);
+        CREATE INDEX IF NOT EXISTS {table}_partido_idx
+            ON {self.schema}.{table} (nr_partido, cd_municipio);
+        ANALYZE {self.schema}.{table};
+        """)
+
+    def _secao_key_index(self, table):
+        """
+        Chave de uma linha da votação por seção (mais as chaves de partição, exigidas pelo Postgres
+        em índices únicos de tabelas particionadas). Também serve às buscas por município/zona/seção.
+        """
+        return f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS {table}_chave_idx
+            ON {self.schema}.{table} (cd_municipio, nr_zona, nr_secao, nr_votavel, ano, sg_uf);
+        """
+
+    def election_table(self, eleicao=(ANO, UF)):
+        """Partição da resultados_secao de uma eleição (particionada por hash de cd_municipio)"""
+        return f"{self.resolve('resultados_secao')}_{election_suffix(*eleicao)}"
+
+    def partitions_of(self, municipios, election_table=None):
+        """
+        Mapeia códigos de município para o índice da partição de hash, usando a mesma função
+        do Postgres (satisfies_hash_partition). Todas as eleições usam o mesmo módulo, então o
+        mapa vale para qualquer uma delas. Resultado em cache.
+        """
+        if not hasattr(self, "partition_map"):
+            self.partition_map = {}
+        missing = [int(m) for m in set(municipios) if int(m) not in self.partition_map]
+        if missing:
+            election_table = election_table or self.election_table(ELEICOES[0])
+            self.cur.execute(f"""
+            SELECT m.cd, p.i
+            FROM unnest(%s::int[]) AS m(cd)
+            CROSS JOIN generate_series(0, %s - 1) AS p(i)
+            WHERE satisfies_hash_partition('{self.schema}.{election_table}'::regclass, %s, p.i, m.cd)
+            """, (missing, SECAO_PARTITIONS, SECAO_PARTITIONS))
+            self.partition_map.update(dict(self.cur.fetchall()))
+        return self.partition_map
+
+    def _write_by_partition(self, chunks, election_table, workers=LOAD_WORKERS):
+        """
+        Separa cada chunk por partição e grava as partes em paralelo, direto nas partições de
+        `election_table` (sem o roteamento pela tabela pai). No máximo 2 * workers partes ficam
+        na memória (data_processor.ordered_map). Cada thread usa uma conexão própria; todas fazem
+        commit juntas no final, ou rollback se alguma falhar. `election_table` deve ser uma tabela
+        de staging: se um commit falhar depois de outros, a carga a descarta inteira.
+        """
+        from data_processor import ordered_map
+
+        local = threading.local()
+        connections = []
+        lock = threading.Lock()
+
+        def cursor():
+            if not hasattr(local, "cur"):
+                conn = self._connect()
+                with lock:
+                    connections.append(conn)
+                local.cur = conn.cursor()
+            return local.cur
+
+        def write(item):
+            partition, df = item
+            return write_frame(self, df, f"{election_table}_p{partition}", cur=cursor())
+
+        def parts():
+            for chunk in chunks:
+                chunk = chunk.rename(columns=str.lower)
+                mapping = self.partitions_of(chunk["cd_municipio"].unique(), election_table)
+                partition = chunk["cd_municipio"].map(mapping)
+                for i, part in chunk.groupby(partition, sort=False):
+                    yield int(i), part
+
+        rows = 0
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                rows = sum(ordered_map(executor, write, parts(), max_pending=2 * workers))
+            for conn in connections:
+                conn.commit()
+        except Exception:
+            for conn in connections:
+                conn.rollback()
+            raise
+        finally:
+            for conn in connections:
+                conn.close()
+        return rows
+
+    def load_resultados_secao(self, eleicoes=ELEICOES, workers=ELECTION_WORKERS):
+        """
+        Limpa a votação por seção em chunks (data_processor.iter_voting_sections) e
+        envia cada chunk direto para as partições da resultados_secao via COPY binário
+        (transfer.write_frame), sem arquivo intermediário. Cada eleição (ano, UF) é carregada
+        em um processo próprio (data_processor.map_elections), com LOAD_WORKERS conexões
+        gravando as partições de hash em paralelo. Os perfis são impressos ao final.
+        A carga vai para a staging; se qualquer eleição falhar, ela é descartada e a versão
+        publicada fica intacta. Com DB_BUILDER_SWAP_LOAD=0 a troca é feita já ao final desta etapa.
+        """
+        from data_processor import SectionProfile, map_elections, in_processes, collect_section_profiles
+
+        print(f"Construindo '{self.schema}.resultados_secao' a partir da votação por seção ({len(eleicoes)} eleições)...")
+        profile = SectionProfile()
+
+        try:
+            self.create_resultados_secao_table(eleicoes=eleicoes)
+            jobs = {
+                (ano, uf): (dict(self.db_config), self.election_table((ano, uf)), ano, uf, voting_file(ano, uf))
+                for ano, uf in eleicoes
+            }
+            results = map_elections(_load_election, jobs, workers)
+            self.index_resultados_secao()
+            self.conn.commit()
+            profile = collect_section_profiles(results, in_processes(len(jobs), workers))
+            if not SWAP_LOAD:
+                self.publish_tables()
+        except Exception as e:
+            print(f"Erro ao construir resultados_secao: {e}")
+            self.conn.rollback()
+            self.discard_staging("resultados_secao")
+        return profile
+
+    def reload_municipio(self, cd_municipio, eleicao=(ANO, UF)):
+        """
+        Recarrega os dados de um único município de uma eleição: apaga e regrava apenas a
+        partição que o contém, em uma transação. Os agregados municipais devem ser refeitos depois.
+        """
+        from data_processor import iter_voting_sections
+
+        cd_municipio = int(cd_municipio)
+        election_table = self.election_table(eleicao)
+        partition = self.partitions_of([cd_municipio], election_table)[cd_municipio]
+        table = f"{election_table}_p{partition}"
+        print(f"Recarregando município {cd_municipio} em '{self.schema}.{table}'...")
+
+        try:
+            self.cur.execute(f"DELETE FROM {self.schema}.{table} WHERE cd_municipio = %s", (cd_municipio,))
+            rows = 0
+            for chunk in iter_voting_sections(eleicao=eleicao):
+                chunk = chunk[chunk["CD_MUNICIPIO"] == cd_municipio]
+                rows += write_frame(self, chunk.rename(columns=str.lower), table)
+            self.cur.execute(f"ANALYZE {self.schema}.{table}")
+            self.conn.commit()
+            print(f"  - {rows} linhas recarregadas.")
+            return rows
+        except Exception as e:
+            print(f"Erro ao recarregar município {cd_municipio}: {e}")
+            self.conn.rollback()
+            return 0
+
+    def refresh_resultados_secao(self, path=None, eleicao=(ANO, UF)):
+        """
+        Atualização incremental de uma eleição a partir de um arquivo do TSE parcial (apuração)
+        ou republicado com correções: as seções presentes no arquivo substituem as gravadas.
+        O arquivo vai por COPY binário para uma tabela de entrada, é comparado às linhas gravadas
+        dessas seções pela chave (cd_municipio, nr_zona, nr_secao, nr_votavel) e só as diferenças
+        são aplicadas (INSERT ... ON CONFLICT e DELETE). Na eleição das análises, as diferenças
+        somadas por município atualizam votos_mun, votos_mun_partido e total_votos_mun.
+        Tudo em uma transação; no banco, o custo acompanha as seções do arquivo, não a tabela inteira.
+        Retorna {"inseridas": n, "atualizadas": n, "removidas": n} (None em caso de erro).
+        """
+        from data_processor import iter_voting_sections
+
+        s = self.schema
+        table = self.resolve("resultados_secao")
+        election_table = self.election_table(eleicao)
+        entrada = f"{election_table}_entrada"
+        key = "cd_municipio, nr_zona, nr_secao, nr_votavel"
+        columns = ["ano", "sg_uf", "cd_municipio", "nm_municipio", "nr_zona", "nr_secao", "nr_votavel",
+                   "nm_votavel", "qt_votos", "sq_candidato", "nr_local_votacao", "nm_local_votacao",
+                   "ds_local_votacao_endereco", "nr_partido", "nr_candidato"]
+        # Colunas que, diferentes no arquivo, fazem a linha ser regravada (partido e candidato vêm de nr_votavel)
+        changed = [c for c in columns if c not in ("ano", "sg_uf", "nr_partido", "nr_candidato", *key.split(", "))]
+        print(f"Atualizando '{s}.{election_table}' a partir de {path or voting_file(*eleicao)}...")
+
+        try:
+            self.cur.execute(f"""
+            {self._secao_key_index(table)}
+            DROP TABLE IF EXISTS {s}.{entrada};
+            CREATE UNLOGGED TABLE {s}.{entrada} (LIKE {s}.{election_table});
+            """)
+            rows = 0
+            for chunk in iter_voting_sections(eleicao=eleicao, path=path):
+                rows += write_frame(self, chunk.rename(columns=str.lower)[columns], entrada)
+            self.cur.execute(f"""
+            CREATE INDEX ON {s}.{entrada} ({key});
+            ANALYZE {s}.{entrada};
+
+            -- Diferenças entre o arquivo e as linhas gravadas das mesmas seções
+            -- (op: I = nova, U = alterada, D = removida)
+            CREATE TEMP TABLE secao_delta ON COMMIT DROP AS
+            WITH secoes AS (SELECT DISTINCT cd_municipio, nr_zona, nr_secao FROM {s}.{entrada}),
+            atual AS (
+                SELECT o.* FROM {s}.{election_table} o JOIN secoes USING (cd_municipio, nr_zona, nr_secao)
+            )
+            SELECT {key},
+                   COALESCE(n.nm_votavel, o.nm_votavel) AS nm_votavel,
+                   COALESCE(n.qt_votos, 0) - COALESCE(o.qt_votos, 0) AS delta,
+                   CASE WHEN o.cd_municipio IS NULL THEN 'I' WHEN n.cd_municipio IS NULL THEN 'D' ELSE 'U' END AS op
+            FROM {s}.{entrada} n FULL JOIN atual o USING ({key})
+            WHERE ({", ".join(f"n.{c}" for c in changed)}) IS DISTINCT FROM ({", ".join(f"o.{c}" for c in changed)});
+            ANALYZE secao_delta;
+
+            DELETE FROM {s}.{election_table} o USING secao_delta d
+            WHERE d.op = 'D' AND ({", ".join(f"o.{c}" for c in key.split(", "))}) = ({", ".join(f"d.{c}" for c in key.split(", "))});
+            """)
+            counts = {"removidas": self.cur.rowcount}
+            self.cur.execute(f"""
+            INSERT INTO {s}.{election_table} ({", ".join(columns)})
+            SELECT {", ".join(f"n.{c}" for c in columns)}
+            FROM {s}.{entrada} n JOIN secao_delta d USING ({key})
+            WHERE d.op <> 'D'
+            ON CONFLICT ({key}, ano, sg_uf) DO UPDATE SET
+                {", ".join(f"{c} = EXCLUDED.{c}" for c in changed)};
+            """)
+            self.cur.execute("""
+            SELECT COUNT(*) FILTER (WHERE op = 'I'), COUNT(*) FILTER (WHERE op = 'U') FROM secao_delta
+            """)
+            counts["inseridas"], counts["atualizadas"] = self.cur.fetchone()
+
+            if tuple(eleicao) == (ANO, UF):
+                self._apply_aggregate_deltas(election_table)
+            self.cur.execute(f"DROP TABLE {s}.{entrada}")
+            self.conn.commit()
+            print(f"  - {rows} linhas lidas; {counts['inseridas']} inseridas, "
+                  f"{counts['atualizadas']} atualizadas, {counts['removidas']} removidas.")
+            return counts
+        except Exception as e:
+            print(f"Erro na atualização incremental de {election_table}: {e}")
+            self.conn.rollback()
+            self.cur.execute(f"DROP TABLE IF EXISTS {s}.{entrada}")
+            self.conn.commit()
+            return None
+
+    def _apply_aggregate_deltas(self, election_table):
+        """
+        Soma as diferenças de secao_delta (refresh_resultados_secao) aos agregados municipais,
+        na transação em andamento; linhas que deixaram de ter votos na resultados_secao saem.
+        """
+        s = self.schema
+        votos_mun, votos_mun_partido, total_votos_mun = (
+            self.resolve(t) for t in ("votos_mun", "votos_mun_partido", "total_votos_mun")
+        )
+        self.cur.execute(f"""
+        CREATE TEMP TABLE mun_delta ON COMMIT DROP AS
+        SELECT cd_municipio, nr_votavel, MAX(nm_votavel) AS nm_votavel,
+               (CASE WHEN nr_votavel >= 10000 THEN nr_votavel / 1000
+                     WHEN nr_votavel >= 1000 THEN nr_votavel / 100 END)::smallint AS nr_partido,
+               SUM(delta) AS delta
+        FROM secao_delta
+        GROUP BY 1, 2;
+
+        INSERT INTO {s}.{votos_mun} AS v (cd_municipio, nr_votavel, nm_votavel, nr_partido, qt_votos)
+        SELECT cd_municipio, nr_votavel, nm_votavel, nr_partido, delta FROM mun_delta
+        ON CONFLICT (nr_votavel, cd_municipio) DO UPDATE SET
+            qt_votos = v.qt_votos + EXCLUDED.qt_votos, nm_votavel = EXCLUDED.nm_votavel;
+        DELETE FROM {s}.{votos_mun} v USING mun_delta d
+        WHERE v.cd_municipio = d.cd_municipio AND v.nr_votavel = d.nr_votavel AND v.qt_votos = 0
+          AND NOT EXISTS (
+              SELECT 1 FROM {s}.{election_table} r
+              WHERE r.cd_municipio = d.cd_municipio AND r.nr_votavel = d.nr_votavel
+          );
+
+        INSERT INTO {s}.{votos_mun_partido} AS p (cd_municipio, nr_partido, qt_votos)
+        SELECT cd_municipio, nr_partido, SUM(delta) FROM mun_delta
+        WHERE nr_partido IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (nr_partido, cd_municipio) DO UPDATE SET qt_votos = p.qt_votos + EXCLUDED.qt_votos;
+        DELETE FROM {s}.{votos_mun_partido} p USING mun_delta d
+        WHERE p.cd_municipio = d.cd_municipio AND p.nr_partido = d.nr_partido
+          AND NOT EXISTS (
+              SELECT 1 FROM {s}.{votos_mun} v WHERE v.cd_municipio = d.cd_municipio AND v.nr_partido = d.nr_partido
+          );
+
+        INSERT INTO {s}.{total_votos_mun} AS t (cd_municipio, total_votos)
+        SELECT cd_municipio, SUM(delta) FROM mun_delta
+        GROUP BY 1
+        ON CONFLICT (cd_municipio) DO UPDATE SET total_votos = t.total_votos + EXCLUDED.total_votos;
+        DELETE FROM {s}.{total_votos_mun} t USING mun_delta d
+        WHERE t.cd_municipio = d.cd_municipio
+          AND NOT EXISTS (SELECT 1 FROM {s}.{votos_mun} v WHERE v.cd_municipio = d.cd_municipio);
+        """)
+
+    def save_profiles(self):
+        """Grava em perfil_dados os perfis de qualidade coletados durante o processamento e a carga"""
+        print(f"Gravando perfil dos dados em '{self.schema}.perfil_dados'...")
+        try:
+            save_profiles(self.engine, self.schema)
+        except Exception as e:
+            print(f"Erro ao gravar perfil dos dados: {e}")
+
     def load_csv_data(self):
         print(f"Carregando CSVs no schema '{self.schema}'...")
-        
-        # Mapeamento para arquivos SEM cabeçalho
-        mappings_no_header = [
-            (PROCESSED_FILES["censo_mun"], "censo_mun"),
-            (PROCESSED_FILES["censo_sec"], "censo_sec"),
-            (PROCESSED_FILES["extra"], "extra"),
-        ]
-
-        for file_path, table_name in mappings_no_header:
-            print(f"-> Carregando {table_name} (sem header)...")
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    self.cur.copy_from(f, table=table_name, sep=";")
-                    self.conn.commit()
-            except Exception as e:
-                print(f"Erro ao carregar {table_name}: {e}")
-                self.conn.rollback()
+        from data_processor import PROCESSED_FRAMES
 
-        # Tratamento especial para arquivos COM header
-        # Carrega arquivos com header: votacao do candidato e rais agregada
-        mappings_with_header = []
+        self.load_censo_sec()
+        # (chave em PROCESSED_FILES, tabela, arquivo tem header)
+        mappings = [
+            ("censo_mun", "censo_mun", False),
+            ("extra", "extra", False),
+        ]
+        # Tratamento especial para arquivos COM header: votacao do candidato e rais agregada
         # Adiciona o arquivo de votação do candidato, se existir na configuração
         candidate_key = None
         for k in PROCESSED_FILES.keys():
@@ -119,25 +601,77 @@ class DatabaseManager:
                 candidate_key = k
                 break
         if candidate_key:
-            mappings_with_header.append((PROCESSED_FILES[candidate_key], vot_table))
-        mappings_with_header.append((PROCESSED_FILES["rais"], "rais_agg"))
-        
-        for file_path, table_name in mappings_with_header:
-            print(f"-> Carregando {table_name} (com header)...")
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    copy_sql = f"COPY {self.schema}.{table_name} FROM STDIN WITH CSV HEADER DELIMITER ';'"
-                    self.cur.copy_expert(sql=copy_sql, file=f)
+            # a chave já é o nome da tabela (votacao_dep_<slug>)
+            mappings.append((candidate_key, candidate_key, True))
+        mappings.append(("rais", "rais_agg", True))
+        mappings.append(("censo_sec_mun", "censo_sec_mun", True))
+
+        for key, logical_name, has_header in mappings:
+            # Tabela criada por create_tables (em staging, se a carga for publicada no final)
+            table_name = self.resolve(logical_name)
+            # Se o processamento rodou neste processo, o DataFrame ainda está em memória:
+            # vai por COPY binário, sem reler o CSV nem passar os números por texto
+            frame = PROCESSED_FRAMES.get(key)
+            if frame is not None:
+                print(f"-> Carregando {table_name} (binário, da memória)...")
+                try:
+                    write_frame(self, frame, table_name)
+                    self.cur.execute(f"ANALYZE {self.schema}.{table_name}")
                     self.conn.commit()
+                    continue
+                except Exception as e:
+                    print(f"   Carga binária falhou ({e}); usando o CSV processado.")
+                    self.conn.rollback()
+
+            print(f"-> Carregando {table_name} ({'com' if has_header else 'sem'} header)...")
+            try:
+                with open(PROCESSED_FILES[key], "r", encoding="utf-8") as f:
+                    if has_header:
+                        copy_sql = f"COPY {self.schema}.{table_name} FROM STDIN WITH CSV HEADER DELIMITER ';'"
+                        self.cur.copy_expert(sql=copy_sql, file=f)
+                    else:
+                        self.cur.copy_from(f, table=table_name, sep=";")
+                self.cur.execute(f"ANALYZE {self.schema}.{table_name}")
+                self.conn.commit()
             except Exception as e:
                 print(f"Erro ao carregar {table_name}: {e}")
                 self.conn.rollback()
+                self.discard_staging(logical_name)
+
+    def load_censo_sec(self):
+        """
+        Carrega o GeoParquet dos setores censitários (data_processor.process_census_sector) um row group
+        por vez, por COPY binário: a geometria vai em EWKB (WKB com o SRID), sem passar por texto.
+        """
+        import pyarrow.parquet as pq
+        import shapely
+        table_name = self.resolve("censo_sec")
+        print(f"-> Carregando {table_name} (GeoParquet, por row group)...")
+        try:
+            parquet = pq.ParquetFile(PROCESSED_FILES["censo_sec"])
+            rows = 0
+            for i in range(parquet.num_row_groups):
+                df = parquet.read_row_group(i).to_pandas()
+                geoms = shapely.set_srid(shapely.from_wkb(df["geometria"].to_numpy()), CENSO_SEC_SRID)
+                df["geometria"] = shapely.to_wkb(geoms, include_srid=True)
+                rows += write_frame(self, df, table_name)
+            self.cur.execute(f"""
+            CREATE INDEX ON {self.schema}.{table_name} USING GIST (geometria);
+            CREATE INDEX ON {self.schema}.{table_name} (id_municipio);
+            ANALYZE {self.schema}.{table_name};
+            """)
+            self.conn.commit()
+            print(f"   {rows} setores carregados.")
+        except Exception as e:
+            print(f"Erro ao carregar {table_name}: {e}")
+            self.conn.rollback()
+            self.discard_staging("censo_sec")
 
     def load_shapefiles(self):
         print(f"Carregando Shapefiles no schema '{self.schema}'...")
         
         shp_mappings = [
-            (FILES["shp_mun"], "municipios_pr_2022"),
+            (FILES["shp_mun"], SHP_MUN_TABLE),
         ]
 
         for file_path, table_name in shp_mappings:
@@ -145,18 +679,270 @@ class DatabaseManager:
             try:
                 gdf = gpd.read_file(file_path)
                 
-                gdf.to_postgis(
-                    table_name, 
-                    self.engine, 
-                    schema=self.schema,
-                    if_exists="replace", 
-                    index=False
-                )
+                # Índice GIST criado depois dos dados (e renomeado na troca de tabelas)
+                write_geo_table(gdf, self.staging_table(table_name), self.engine, schema=self.schema)
             except Exception as e:
                 print(f"Erro ao carregar shapefile {table_name}: {e}")
+                self.discard_staging(table_name)
+
+    def load_geo_mun(self):
+        """
+        Grava a malha municipal enriquecida (data_processor.process_geo_mun) na geo_mun, com índice GIST,
+        e a tradução de códigos TSE <-> IBGE na mapa_municipio, indexada nos dois sentidos.
+        """
+        from data_processor import PROCESSED_FRAMES, read_mapa_municipios
+        print(f"Carregando geo_mun e mapa_municipio no schema '{self.schema}'...")
+
+        gdf = PROCESSED_FRAMES.get("geo_mun")
+        geo_mun = self.staging_table("geo_mun")
+        mapa_municipio = self.staging_table("mapa_municipio")
+        try:
+            if gdf is None:
+                gdf = gpd.read_parquet(PROCESSED_FILES["geo_mun"])
+            # Já sai com o índice GIST ({geo_mun}_geometry_gist), criado depois dos dados
+            write_geo_table(gdf, geo_mun, self.engine, schema=self.schema)
+
+            self.cur.execute(f"""
+            DROP TABLE IF EXISTS {self.schema}.{mapa_municipio};
+            CREATE TABLE {self.schema}.{mapa_municipio} (cd_mun_tse int NOT NULL, cd_mun_ibge int NOT NULL);
+            """)
+            mapa = read_mapa_municipios().rename(columns={"id_municipio_tse": "cd_mun_tse", "id_municipio_ibge": "cd_mun_ibge"})
+            write_frame(self, mapa, mapa_municipio)
+            self.cur.execute(f"""
+            ALTER TABLE {self.schema}.{mapa_municipio} ADD PRIMARY KEY (cd_mun_tse);
+            CREATE INDEX ON {self.schema}.{mapa_municipio} (cd_mun_ibge);
+            ANALYZE {self.schema}.{mapa_municipio};
+            CREATE INDEX ON {self.schema}.{geo_mun} ("CD_MUN_TSE");
+            ANALYZE {self.schema}.{geo_mun};
+            """)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Erro ao carregar geo_mun: {e}")
+            self.conn.rollback()
+            self.discard_staging("geo_mun", "mapa_municipio")
+
+    def build_region_tables(self):
+        """
+        Pré-computa as tabelas de regiões (Imediata, Intermediária e UF) a partir da geo_mun.
+        O ST_Union é feito uma única vez na carga, e não a cada análise.
+        """
+        print(f"Construindo tabelas de regiões no schema '{self.schema}'...")
+
+        geo_mun = self.resolve("geo_mun")
+        mun_regiao = self.staging_table("mun_regiao")
+
+        # Tabela de tradução município -> regiões (códigos inteiros)
+        queries = [
+            f"""
+            DROP TABLE IF EXISTS {self.schema}.{mun_regiao};
+            CREATE TABLE {self.schema}.{mun_regiao} AS
+            SELECT DISTINCT
+                CAST(g."CD_MUN_TSE" AS INTEGER) AS cd_mun_tse,
+                CAST(g."CD_MUN_IBG" AS INTEGER) AS cd_mun_ibge,
+                CAST(g."CD_RGI" AS INTEGER) AS cd_rgi,
+                CAST(g."CD_RGINT" AS INTEGER) AS cd_rgint,
+                CAST(g."CD_UF" AS INTEGER) AS cd_uf
+            FROM {self.schema}.{geo_mun} g
+            WHERE g."CD_MUN_TSE" IS NOT NULL;
+            ALTER TABLE {self.schema}.{mun_regiao} ADD PRIMARY KEY (cd_mun_tse);
+            CREATE INDEX ON {self.schema}.{mun_regiao} (cd_mun_ibge);
+            CREATE INDEX ON {self.schema}.{mun_regiao} (cd_rgi);
+            CREATE INDEX ON {self.schema}.{mun_regiao} (cd_rgint);
+            ANALYZE {self.schema}.{mun_regiao};
+            """
+        ]
+
+        # Uma tabela por nível, com a geometria dissolvida e índice espacial
+        levels = {
+            "geo_rgi": ("CD_RGI", "NM_RGI", "cd_rgi", "nm_rgi"),
+            "geo_rgint": ("CD_RGINT", "NM_RGINT", "cd_rgint", "nm_rgint"),
+            "geo_uf": ("CD_UF", "NM_UF", "cd_uf", "nm_uf"),
+        }
+        for logical_name, (cd_col, nm_col, cd_name, nm_name) in levels.items():
+            table_name = self.staging_table(logical_name)
+            queries.append(f"""
+            DROP TABLE IF EXISTS {self.schema}.{table_name};
+            CREATE TABLE {self.schema}.{table_name} AS
+            SELECT
+                CAST(g."{cd_col}" AS INTEGER) AS {cd_name},
+                MIN(g."{nm_col}") AS {nm_name},
+                ST_Union(g.geometry) AS geometry
+            FROM {self.schema}.{geo_mun} g
+            GROUP BY 1;
+            ALTER TABLE {self.schema}.{table_name} ADD PRIMARY KEY ({cd_name});
+            CREATE INDEX ON {self.schema}.{table_name} USING GIST (geometry);
+            ANALYZE {self.schema}.{table_name};
+            """)
+
+        try:
+            for query in queries:
+                self.cur.execute(query)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Erro ao construir tabelas de regiões: {e}")
+            self.conn.rollback()
+            self.discard_staging("mun_regiao", *levels)
+
+    def build_neighbor_tables(self):
+        """
+        Persiste a vizinhança (contiguidade Queen) de municípios e regiões em uma única tabela.
+        Calculada uma vez com ST_Intersects sobre índice GIST; usada pelo Moran no banco (spatial_analysis.py).
+        """
+        print(f"Construindo tabela de vizinhança no schema '{self.schema}'...")
+
+        # nível -> (tabela, expressão do código)
+        levels = {
+            "mun": (self.resolve("geo_mun"), 'CAST(g."CD_MUN_TSE" AS INTEGER)'),
+            "rgi": (self.resolve("geo_rgi"), "g.cd_rgi"),
+            "rgint": (self.resolve("geo_rgint"), "g.cd_rgint"),
+        }
+        vizinhos = self.staging_table("vizinhos")
+
+        queries = [
+            f"""
+            DROP TABLE IF EXISTS {self.schema}.{vizinhos};
+            CREATE TABLE {self.schema}.{vizinhos} (
+                nivel varchar,
+                cd_origem int,
+                cd_vizinho int
+            );
+            CREATE INDEX IF NOT EXISTS {levels["mun"][0]}_geometry_gist ON {self.schema}.{levels["mun"][0]} USING GIST (geometry);
+            """
+        ]
+        for nivel, (table_name, cd_expr) in levels.items():
+            queries.append(f"""
+            INSERT INTO {self.schema}.{vizinhos} (nivel, cd_origem, cd_vizinho)
+            SELECT '{nivel}', a.cd, b.cd
+            FROM (SELECT {cd_expr} AS cd, g.geometry FROM {self.schema}.{table_name} g) a
+            JOIN (SELECT {cd_expr} AS cd, g.geometry FROM {self.schema}.{table_name} g) b
+              ON a.cd <> b.cd AND ST_Intersects(a.geometry, b.geometry);
+            """)
+        queries.append(f"""
+            ALTER TABLE {self.schema}.{vizinhos} ADD PRIMARY KEY (nivel, cd_origem, cd_vizinho);
+            ANALYZE {self.schema}.{vizinhos};
+        """)
+
+        try:
+            for query in queries:
+                self.cur.execute(query)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Erro ao construir tabela de vizinhança: {e}")
+            self.conn.rollback()
+            self.discard_staging("vizinhos")
+
+    def build_aggregate_tables(self):
+        """
+        Pré-agrega os votos da resultados_secao por município, para a eleição das análises
+        (config.ANO/UF): a leitura fica restrita às partições dessa eleição.
+        As análises regionais somam esses agregados em vez de reler as seções.
+        """
+        print(f"Construindo agregados municipais ({ANO}/{UF}) no schema '{self.schema}'...")
+
+        resultados_secao = self.election_table((ANO, UF))
+        votos_mun, votos_mun_partido, total_votos_mun = (
+            self.staging_table(t) for t in ("votos_mun", "votos_mun_partido", "total_votos_mun")
+        )
+        queries = [
+            f"""
+            DROP TABLE IF EXISTS {self.schema}.{votos_mun};
+            CREATE TABLE {self.schema}.{votos_mun} AS
+            SELECT cd_municipio, nr_votavel, nm_votavel, nr_partido, SUM(qt_votos) AS qt_votos
+            FROM {self.schema}.{resultados_secao}
+            GROUP BY 1, 2, 3, 4;
+            ALTER TABLE {self.schema}.{votos_mun} ADD PRIMARY KEY (nr_votavel, cd_municipio);
+            CREATE INDEX ON {self.schema}.{votos_mun} (nm_votavel);
+            CREATE INDEX ON {self.schema}.{votos_mun} (cd_municipio);
+            ANALYZE {self.schema}.{votos_mun};
+            """,
+            f"""
+            DROP TABLE IF EXISTS {self.schema}.{votos_mun_partido};
+            CREATE TABLE {self.schema}.{votos_mun_partido} AS
+            SELECT cd_municipio, nr_partido, SUM(qt_votos) AS qt_votos
+            FROM {self.schema}.{votos_mun}
+            WHERE nr_partido IS NOT NULL
+            GROUP BY 1, 2;
+            ALTER TABLE {self.schema}.{votos_mun_partido} ADD PRIMARY KEY (nr_partido, cd_municipio);
+            ANALYZE {self.schema}.{votos_mun_partido};
+            """,
+            f"""
+            DROP TABLE IF EXISTS {self.schema}.{total_votos_mun};
+            CREATE TABLE {self.schema}.{total_votos_mun} AS
+            SELECT cd_municipio, SUM(qt_votos) AS total_votos
+            FROM {self.schema}.{votos_mun}
+            GROUP BY 1;
+            ALTER TABLE {self.schema}.{total_votos_mun} ADD PRIMARY KEY (cd_municipio);
+            ANALYZE {self.schema}.{total_votos_mun};
+            """
+        ]
+
+        try:
+            for query in queries:
+                self.cur.execute(query)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Erro ao construir agregados municipais: {e}")
+            self.conn.rollback()
+            self.discard_staging("votos_mun", "votos_mun_partido", "total_votos_mun")
+
+    def build_atributos_table(self):
+        """
+        Pré-computa a atributos_mun: os dados socioeconômicos (Censo, RAIS agregada, conectividade)
+        por município, com o código TSE, em uma tabela estreita com chave primária.
+        As análises leem essa tabela (queries.atributos_municipais) em vez de refazer os joins.
+        """
+        print(f"Construindo atributos municipais no schema '{self.schema}'...")
+
+        atributos_mun = self.staging_table("atributos_mun")
+        query = atributos_mun_sql(
+            self.schema, atributos_mun,
+            **{t: self.resolve(t) for t in ("censo_mun", "rais_agg", "extra")},
+            mapa=self.resolve("mapa_municipio"),
+        )
+        try:
+            self.cur.execute(f"""
+            {query}
+            CREATE INDEX ON {self.schema}.{atributos_mun} (cd_mun_tse);
+            ANALYZE {self.schema}.{atributos_mun};
+            """)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Erro ao construir atributos municipais: {e}")
+            self.conn.rollback()
+            self.discard_staging("atributos_mun")
 
     def close(self):
         self.cur.close()
         self.conn.close()
+        if getattr(self, "_adbc_conn", None) is not None:
+            self._adbc_conn.close()
         self.engine.dispose()
-        print("Conexão encerrada.")
\ No newline at end of file
+        print("Conexão encerrada.")
+
+
+def _load_election(db_config, election_table, ano, uf, path):
+    """
+    Carga de uma eleição na sua partição da resultados_secao (processo de map_elections).
+    Devolve o perfil da limpeza e o perfil de colunas da votacao_secao, que o processo
+    principal junta aos das outras eleições.
+    """
+    from data_processor import iter_voting_sections, SectionProfile
+    from profiling import profiles
+
+    # Com spawn o processo começa com a configuração padrão: usa a do processo principal
+    DB_CONFIG.update(db_config)
+    db = DatabaseManager()
+    try:
+        profile = SectionProfile()
+        db._write_by_partition(iter_voting_sections(profile=profile, eleicao=(ano, uf), path=path), election_table)
+        return profile, profiles.pop("votacao_secao", None)
+    finally:
+        db.close()
+
+
+def open_analysis_db():
+    """Banco usado pelas análises, conforme DB_BUILDER_BACKEND: Postgres (DatabaseManager) ou DuckDB em processo"""
+    if ANALYSIS_BACKEND == "duckdb":
+        from duck_db import DuckDBManager
+        return DuckDBManager()
+    return DatabaseManager()
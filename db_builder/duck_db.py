@@ -0,0 +1,248 @@
+"""
+Backend em processo para as análises: DuckDB sobre os Parquet/GeoParquet do processamento.
+
+DuckDBManager expõe a mesma interface de leitura do DatabaseManager usada pelas análises
+(read_sql, read_geo, read_frame, scalar, prepare, stream_query), então analysis.py,
+metrics_analysis.py e extra_analysis.fetch_data rodam sem o PostGIS no ar
+(DB_BUILDER_BACKEND=duckdb; ver db_manager.open_analysis_db).
+
+As tabelas de origem são views sobre os arquivos (leitura colunar, nada é copiado);
+os agregados municipais e as regiões são recriados em processo com as mesmas regras
+da carga no Postgres. As geometrias ficam em WKB, como no GeoParquet: a extensão
+spatial é carregada se estiver instalada, mas não é necessária.
+"""
+import json
+import os
+import re
+import time
+
+import pandas as pd
+import geopandas as gpd
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from config import (DB_CONFIG, FILES, PROCESSED_FILES, PARQUET_FILES, DUCKDB_PATH, STREAM_FETCH_SIZE,
+                    ANO, UF, ELEICOES, election_suffix, SHP_MUN_TABLE)
+from queries import atributos_mun_sql
+from instrumentation import tracer
+
+# Mesmos níveis de DatabaseManager.build_region_tables: tabela -> (código, nome, colunas de saída)
+REGION_LEVELS = {
+    "geo_rgi": ("CD_RGI", "NM_RGI", "cd_rgi", "nm_rgi"),
+    "geo_rgint": ("CD_RGINT", "NM_RGINT", "cd_rgint", "nm_rgint"),
+    "geo_uf": ("CD_UF", "NM_UF", "cd_uf", "nm_uf"),
+}
+
+
+def _named(sql, params):
+    """Converte %(nome)s para $nome (sintaxe do DuckDB) e mantém só os parâmetros usados na consulta"""
+    names = set(re.findall(r"%\((\w+)\)s", sql))
+    sql = re.sub(r"%\((\w+)\)s", r"$\1", sql).replace("%%", "%")
+    params = {k: v for k, v in (params or {}).items() if k in names}
+    return sql, params or None
+
+
+def _geoparquet_crs(path):
+    """CRS da coluna de geometria principal, pelos metadados do GeoParquet (padrão da especificação: OGC:CRS84)"""
+    import pyarrow.parquet as pq
+    meta = pq.read_schema(path).metadata or {}
+    geo = json.loads(meta.get(b"geo", b"{}"))
+    column = geo.get("columns", {}).get(geo.get("primary_column", "geometry"), {})
+    return column.get("crs", "OGC:CRS84")
+
+
+def _decimals_to_float(batch):
+    """Colunas decimal (ex.: SUM de inteiros) como float64, como no .df() do DuckDB e no stream_query do Postgres"""
+    import pyarrow as pa
+    fields = [pa.field(f.name, pa.float64()) if pa.types.is_decimal(f.type) else f for f in batch.schema]
+    schema = pa.schema(fields, metadata=batch.schema.metadata)
+    return batch if schema.equals(batch.schema) else batch.cast(schema)
+
+
+def _to_geo(df, geom_col, crs):
+    df[geom_col] = gpd.GeoSeries.from_wkb(df[geom_col].map(bytes, na_action="ignore"), crs=crs)
+    return gpd.GeoDataFrame(df, geometry=geom_col, crs=crs)
+
+
+def _execute(con, sql, params):
+    """con.execute registrado no tracer, como os comandos do TracingCursor no Postgres"""
+    start = time.perf_counter()
+    try:
+        return con.execute(sql, params)
+    finally:
+        tracer.record_sql(sql, time.perf_counter() - start)
+
+
+class DuckQuery:
+    """Equivalente ao PreparedQuery para o DuckDB (placeholders $1, $2, ...)"""
+
+    def __init__(self, con, sql):
+        self.con = con
+        self.sql = sql
+
+    def execute(self, *args):
+        """Executa a consulta e retorna um DataFrame"""
+        return _execute(self.con, self.sql, list(args)).df()
+
+
+class DuckDBManager:
+    backend = "duckdb"
+
+    def __init__(self, database=DUCKDB_PATH):
+        if duckdb is None:
+            raise ImportError("O backend DuckDB requer o pacote duckdb (pip install duckdb).")
+        self.schema = DB_CONFIG.get('schema', 'public')
+        self.con = duckdb.connect(database)
+        self.spatial = self._load_spatial()
+        self.crs = None
+        self.con.execute(f"CREATE SCHEMA IF NOT EXISTS {self.schema}")
+        self.con.execute(f"SET schema = '{self.schema}'")
+        self.register_sources()
+        self.build_derived_tables()
+
+    def _load_spatial(self):
+        try:
+            self.con.execute("LOAD spatial")
+        except duckdb.Error:
+            return False
+        # Mantém as geometrias do GeoParquet em WKB, como nas demais tabelas
+        self.con.execute("SET enable_geoparquet_conversion = false")
+        return True
+
+    def _create_from_frame(self, table, df):
+        self.con.register("_frame", df)
+        try:
+            self.con.execute(f"CREATE OR REPLACE TABLE {self.schema}.{table} AS SELECT * FROM _frame")
+        finally:
+            self.con.unregister("_frame")
+
+    def register_sources(self):
+        """Views sobre os arquivos do processamento; arquivos ausentes são apenas avisados"""
+        sources = {table: (path, f"read_parquet('{path}')") for table, path in PARQUET_FILES.items()}
+        # Pasta particionada por ano/UF: filtros em ano e sg_uf só abrem os arquivos daquela eleição
+        secao_dir = PARQUET_FILES["resultados_secao"]
+        sources["resultados_secao"] = (
+            secao_dir, f"read_parquet('{secao_dir}/*/*/*.parquet', hive_partitioning = true)"
+        )
+        for table in ("geo_mun", "censo_sec"):
+            sources[table] = (PROCESSED_FILES[table], f"read_parquet('{PROCESSED_FILES[table]}')")
+        # RAIS bruta, como a tabela 'rais' criada pelo carregar_banco.py
+        sources["rais"] = (FILES["rais"], f"read_csv_auto('{FILES['rais']}')")
+
+        for table, (path, reader) in sources.items():
+            if not os.path.exists(path):
+                print(f"AVISO: {path} não encontrado; tabela '{table}' indisponível no DuckDB.")
+                continue
+            # nr_partido/nr_candidato da resultados_secao já vêm no Parquet (data_processor.vote_codes)
+            self.con.execute(f"CREATE OR REPLACE VIEW {self.schema}.{table} AS SELECT * FROM {reader}")
+
+        # Uma view por eleição, com o mesmo nome da partição no Postgres (queries.secao_table)
+        if self._has("resultados_secao"):
+            for ano, uf in ELEICOES:
+                self.con.execute(f"""
+                CREATE OR REPLACE VIEW {self.schema}.resultados_secao_{election_suffix(ano, uf)} AS
+                SELECT * FROM {self.schema}.resultados_secao WHERE ano = {ano} AND sg_uf = '{uf}'
+                """)
+
+        if os.path.exists(PROCESSED_FILES["geo_mun"]):
+            self.crs = _geoparquet_crs(PROCESSED_FILES["geo_mun"])
+
+        # Malha do IBGE usada pelo GWR (tabela SHP_MUN_TABLE do load_shapefiles)
+        if os.path.exists(FILES["shp_mun"]):
+            gdf = gpd.read_file(FILES["shp_mun"], engine="pyogrio", use_arrow=True)
+            self._create_from_frame(SHP_MUN_TABLE, pd.DataFrame(gdf.to_wkb()))
+
+    def _has(self, table):
+        return self.scalar(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = %(schema)s AND table_name = %(table)s",
+            {"schema": self.schema, "table": table},
+        ) > 0
+
+    def build_derived_tables(self):
+        """
+        Agregados municipais, regiões e atributos municipais
+        (equivalentes a build_aggregate_tables, build_region_tables e build_atributos_table)
+        """
+        s = self.schema
+        if self._has("resultados_secao"):
+            self.con.execute(f"""
+            CREATE OR REPLACE TABLE {s}.votos_mun AS
+            SELECT cd_municipio, nr_votavel, nm_votavel, nr_partido, SUM(qt_votos)::BIGINT AS qt_votos
+            FROM {s}.resultados_secao_{election_suffix(ANO, UF)}
+            GROUP BY 1, 2, 3, 4;
+            CREATE OR REPLACE TABLE {s}.votos_mun_partido AS
+            SELECT cd_municipio, nr_partido, SUM(qt_votos)::BIGINT AS qt_votos
+            FROM {s}.votos_mun
+            WHERE nr_partido IS NOT NULL
+            GROUP BY 1, 2;
+            CREATE OR REPLACE TABLE {s}.total_votos_mun AS
+            SELECT cd_municipio, SUM(qt_votos)::BIGINT AS total_votos
+            FROM {s}.votos_mun
+            GROUP BY 1;
+            """)
+
+        if not self._has("geo_mun"):
+            return
+        self.con.execute(f"""
+        CREATE OR REPLACE TABLE {s}.mun_regiao AS
+        SELECT DISTINCT
+            CAST(g."CD_MUN_TSE" AS INTEGER) AS cd_mun_tse,
+            CAST(g."CD_MUN_IBG" AS INTEGER) AS cd_mun_ibge,
+            CAST(g."CD_RGI" AS INTEGER) AS cd_rgi,
+            CAST(g."CD_RGINT" AS INTEGER) AS cd_rgint,
+            CAST(g."CD_UF" AS INTEGER) AS cd_uf
+        FROM {s}.geo_mun g
+        WHERE g."CD_MUN_TSE" IS NOT NULL;
+        """)
+        if all(self._has(t) for t in ("censo_mun", "rais_agg", "extra")):
+            self.con.execute(atributos_mun_sql(s, "atributos_mun", mapa="mun_regiao"))
+
+        # Geometrias dissolvidas por nível (união vetorizada do shapely), gravadas de volta em WKB
+        columns = ", ".join(f'"{c}"' for cd_col, nm_col, _, _ in REGION_LEVELS.values() for c in (cd_col, nm_col))
+        gdf = self.read_geo(f"SELECT {columns}, geometry FROM {s}.geo_mun")
+        for table_name, (cd_col, nm_col, cd_name, nm_name) in REGION_LEVELS.items():
+            region = gdf[[cd_col, nm_col, "geometry"]].dissolve(by=cd_col, aggfunc="min").reset_index()
+            region = region.rename(columns={cd_col: cd_name, nm_col: nm_name})
+            region[cd_name] = region[cd_name].astype("int32")
+            self._create_from_frame(table_name, pd.DataFrame(region.to_wkb()))
+
+    def read_sql(self, sql, params=None):
+        """Executa `sql` (parâmetros %(nome)s) e retorna um DataFrame"""
+        sql, params = _named(sql, params)
+        return _execute(self.con, sql, params).df()
+
+    def read_frame(self, sql, params=None):
+        """Como read_sql (o DuckDB já entrega numeric/decimal como float64)"""
+        return self.read_sql(sql, params)
+
+    def read_geo(self, sql, params=None, geom_col="geometry"):
+        """Como read_sql, convertendo a coluna de geometria (WKB) em um GeoDataFrame"""
+        return _to_geo(self.read_sql(sql, params), geom_col, self.crs)
+
+    def scalar(self, sql, params=None):
+        sql, params = _named(sql, params)
+        row = _execute(self.con, sql, params).fetchone()
+        return row[0] if row else None
+
+    def prepare(self, name, sql, arg_types):
+        """Mesma assinatura do DatabaseManager.prepare (o nome e os tipos não são necessários aqui)"""
+        return DuckQuery(self.con, sql)
+
+    def stream_query(self, sql, params=None, fetch_size=STREAM_FETCH_SIZE, geom_col=None, crs=None, arrow=False):
+        """Lê o resultado em blocos de `fetch_size` linhas (RecordBatches do Arrow), como DatabaseManager.stream_query"""
+        sql, params = _named(sql, params)
+        reader = _execute(self.con, sql, params).fetch_record_batch(fetch_size)
+        for batch in reader:
+            batch = _decimals_to_float(batch)
+            if arrow:
+                yield batch
+                continue
+            df = batch.to_pandas()
+            yield _to_geo(df, geom_col, crs or self.crs) if geom_col else df
+
+    def close(self):
+        self.con.close()
+        print("Conexão encerrada.")
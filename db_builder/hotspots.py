@@ -0,0 +1,291 @@
+"""
+Hotspots eleitorais: Gi* de Getis-Ord para todos os candidatos de uma vez.
+
+Os percentuais de votos formam uma matriz Y (unidades x candidatos) e a estatística é
+calculada para todas as colunas com um único produto esparso W @ Y. A inferência por
+permutação condicional segue o esda.G_Local(star=True): o valor da própria unidade fica
+fixo e os vizinhos são sorteados entre as demais. Os mesmos sorteios servem para todas
+as unidades e candidatos (como o crand do esda) e as somas permutadas saem em lotes,
+também como produtos esparsos, limitados a HOTSPOT_BATCH_MB de memória.
+
+A vizinhança vem da tabela vizinhos (Queen persistida na carga) ou do cache em disco de
+spatial_weights.py (KNN/banda de distância, DB_BUILDER_WEIGHTS). O resultado, com a classe
+de cada unidade (hot/cold spot a 90/95/99%), é gravado na tabela hotspots.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.special import erfc
+
+from config import (TRACE_FILE, TRACE_EXPLAIN_SAMPLE, SPATIAL_WEIGHTS, HOTSPOT_PERMUTATIONS,
+                    HOTSPOT_BATCH_MB, HOTSPOT_SEED)
+from instrumentation import tracer
+from spatial_weights import binary_weights, row_standardize
+from transfer import write_frame
+
+# nível -> (tabela de geometria, expressão do código, coluna da mun_regiao); mesmos níveis da tabela vizinhos
+LEVELS = {
+    "mun": ("geo_mun", 'CAST(g."CD_MUN_TSE" AS INTEGER)', "cd_mun_tse"),
+    "rgi": ("geo_rgi", "g.cd_rgi", "cd_rgi"),
+    "rgint": ("geo_rgint", "g.cd_rgint", "cd_rgint"),
+}
+
+# Classe -> rótulo (sinal = hot/cold, módulo = nível de confiança)
+CLASSES = {
+    3: "Hot spot (99%)", 2: "Hot spot (95%)", 1: "Hot spot (90%)",
+    0: "Não significativo",
+    -1: "Cold spot (90%)", -2: "Cold spot (95%)", -3: "Cold spot (99%)",
+}
+
+
+def _permutation_ids(n, kmax, permutations, rng):
+    """`permutations` sorteios sem reposição de kmax posições entre as n - 1 outras unidades"""
+    return np.stack([rng.choice(n - 1, kmax, replace=False) for _ in range(permutations)])
+
+
+def _permuted_sums(Y, units, card, perm_ids):
+    """
+    Somas dos vizinhos sorteados para cada unidade de `units`: array (unidades, permutações, colunas).
+    O sorteio p da unidade i usa as card[i] primeiras posições de perm_ids[p], pulando a própria i.
+    """
+    permutations, kmax = perm_ids.shape
+    k = card[units]
+    take = np.broadcast_to(np.arange(kmax) < k[:, None, None], (len(units), permutations, kmax))
+    cols = np.broadcast_to(perm_ids, take.shape)[take]
+    cols += cols >= np.repeat(units, k * permutations)
+    indptr = np.concatenate([[0], np.cumsum(np.repeat(k, permutations))])
+    selector = sparse.csr_matrix((np.ones(len(cols)), cols, indptr), shape=(len(units) * permutations, len(Y)))
+    return (selector @ Y).reshape(len(units), permutations, Y.shape[1])
+
+
+def gi_star(Y, A, permutations=HOTSPOT_PERMUTATIONS, seed=HOTSPOT_SEED, batch_mb=HOTSPOT_BATCH_MB):
+    """
+    Gi* (Getis-Ord, com a própria unidade) de cada coluna de Y (n x m) sobre a vizinhança binária A (n x n).
+    O z é o de Getis e Ord (1995), o mesmo do Hot Spot Analysis do ArcGIS; p_sim segue o
+    esda.G_Local(star=True, transform='R').
+    Retorna (z, p_sim), ambos n x m; p_sim é None sem permutações e NaN para ilhas
+    (sem vizinhos) e colunas constantes.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    n, m = Y.shape
+    A = sparse.csr_matrix(A, dtype=np.float64)
+    A.setdiag(0)
+    A.eliminate_zeros()
+    A.data[:] = 1.0
+    card = np.diff(A.indptr)
+
+    # z analítico (Getis e Ord, 1995): (Σ w_ij x_j - x̄ W_i) / (s √((n S1_i - W_i²) / (n - 1)))
+    W = row_standardize(A + sparse.identity(n, format="csr"))
+    w_sum = np.asarray(W.sum(axis=1)).ravel()
+    s1 = np.asarray(W.multiply(W).sum(axis=1)).ravel()
+    mean = Y.mean(axis=0)
+    s = np.sqrt(np.maximum((Y ** 2).mean(axis=0) - mean ** 2, 0))
+    scale = np.sqrt((n * s1 - w_sum ** 2) / (n - 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (W @ Y - np.outer(w_sum, mean)) / np.outer(scale, s)
+    z[:, s == 0] = np.nan
+    if not permutations or n < 2:
+        return z, None
+
+    # Com a própria unidade fixa e pesos iguais na linha, Gi* cresce com a soma dos vizinhos:
+    # basta comparar as somas permutadas com a observada
+    observed = A @ Y
+    rng = np.random.default_rng(seed)
+    perm_ids = _permutation_ids(n, max(int(card.max()), 1), permutations, rng)
+    larger = np.zeros((n, m), dtype=np.int64)
+    smaller = np.zeros((n, m), dtype=np.int64)
+    units = np.flatnonzero(card > 0)
+    batch = max(1, int(batch_mb * 2 ** 20 // (permutations * m * 8)))
+    for start in range(0, len(units), batch):
+        chunk = units[start:start + batch]
+        sums = _permuted_sums(Y, chunk, card, perm_ids)
+        obs = observed[chunk][:, None, :]
+        larger[chunk] = (sums >= obs).sum(axis=1)
+        smaller[chunk] = (sums <= obs).sum(axis=1)
+
+    # Cauda menor, como no esda, mas contando os empates nas duas caudas: candidatos sem votos
+    # na vizinhança (soma 0 em quase todos os sorteios) não viram cold spots espúrios
+    p_sim = (np.minimum(larger, smaller) + 1.0) / (permutations + 1.0)
+    p_sim[card == 0] = np.nan
+    p_sim[:, s == 0] = np.nan
+    return z, p_sim
+
+
+def classify(z, p):
+    """Classe de hotspot: ±3/±2/±1 para p <= 0,01/0,05/0,10 (sinal de z), 0 fora disso"""
+    z = np.asarray(z, dtype=np.float64)
+    p = np.asarray(p, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        level = np.select([p <= 0.01, p <= 0.05, p <= 0.10], [3, 2, 1], 0)
+    return (level * np.sign(np.nan_to_num(z))).astype(np.int16)
+
+
+def vote_share_matrix(db, nivel="mun"):
+    """
+    Percentual de votos de cada candidato (nr_votavel >= 1000) em cada unidade do nível.
+    Retorna (ids das unidades, DataFrame dos candidatos (nr_votavel, nm_votavel), matriz n x m).
+    """
+    s = db.schema
+    cd_col = LEVELS[nivel][2]
+    votos = db.read_frame(f"""
+        SELECT r.{cd_col} AS cd, v.nr_votavel, MIN(v.nm_votavel) AS nm_votavel,
+               SUM(v.qt_votos)::float8 AS votos
+        FROM {s}.votos_mun v
+        JOIN {s}.mun_regiao r ON r.cd_mun_tse = v.cd_municipio
+        WHERE v.nr_votavel >= 1000
+        GROUP BY 1, 2
+    """)
+    totais = db.read_frame(f"""
+        SELECT r.{cd_col} AS cd, SUM(t.total_votos)::float8 AS total
+        FROM {s}.total_votos_mun t
+        JOIN {s}.mun_regiao r ON r.cd_mun_tse = t.cd_municipio
+        GROUP BY 1
+    """)
+    totais = totais[totais["total"] > 0].sort_values("cd")
+    ids = totais["cd"].astype(np.int64).to_numpy()
+
+    candidatos = (votos.groupby("nr_votavel", as_index=False)["nm_votavel"].min()
+                  .sort_values("nr_votavel", ignore_index=True))
+    rows = pd.Index(ids).get_indexer(votos["cd"].astype(np.int64))
+    cols = pd.Index(candidatos["nr_votavel"]).get_indexer(votos["nr_votavel"])
+    keep = rows >= 0
+    Y = np.zeros((len(ids), len(candidatos)))
+    Y[rows[keep], cols[keep]] = votos["votos"].to_numpy()[keep]
+    Y *= 100.0 / totais["total"].to_numpy()[:, None]
+    return ids, candidatos, Y
+
+
+def level_adjacency(db, nivel, ids, kind=SPATIAL_WEIGHTS):
+    """
+    Vizinhança binária (CSR) das unidades `ids`, na mesma ordem.
+    Queen no Postgres lê a tabela vizinhos; nos demais casos os pesos saem das geometrias
+    (spatial_weights.binary_weights, com cache em disco para KNN/banda).
+    Unidades sem geometria ou sem vizinhos ficam como ilhas.
+    """
+    s = db.schema
+    table, cd_expr, _ = LEVELS[nivel]
+    n = len(ids)
+    index = pd.Index(ids)
+    if kind == "queen" and db.backend == "postgres":
+        pairs = db.read_frame(
+            f"SELECT cd_origem, cd_vizinho FROM {s}.vizinhos WHERE nivel = %(nivel)s", {"nivel": nivel}
+        )
+        i = index.get_indexer(pairs["cd_origem"].astype(np.int64))
+        j = index.get_indexer(pairs["cd_vizinho"].astype(np.int64))
+    else:
+        gdf = db.read_geo(f"SELECT {cd_expr} AS cd, g.geometry FROM {s}.{table} g")
+        gdf = gdf.dropna(subset=["cd"]).drop_duplicates("cd")
+        gdf = gdf[gdf["cd"].astype(np.int64).isin(ids)].sort_values("cd", ignore_index=True)
+        W = binary_weights(gdf, kind, ids=gdf["cd"].to_numpy()).tocoo()
+        positions = index.get_indexer(gdf["cd"].astype(np.int64))
+        i, j = positions[W.row], positions[W.col]
+    keep = (i >= 0) & (j >= 0)
+    return sparse.csr_matrix((np.ones(keep.sum()), (i[keep], j[keep])), shape=(n, n))
+
+
+def hotspot_frame(nivel, ids, candidatos, Y, z, p_sim):
+    """Resultado em formato longo: uma linha por (unidade, candidato)"""
+    n, m = Y.shape
+    p = p_sim if p_sim is not None else erfc(np.abs(z) / np.sqrt(2))
+    return pd.DataFrame({
+        "nivel": nivel,
+        "cd_unidade": np.repeat(ids, m).astype(np.int32),
+        "nr_votavel": np.tile(candidatos["nr_votavel"].to_numpy(), n).astype(np.int32),
+        "nm_votavel": np.tile(candidatos["nm_votavel"].to_numpy(), n),
+        "pct_votos": Y.ravel(),
+        "gi_z": z.ravel(),
+        "p_sim": p.ravel(),
+        "classe": classify(z, p).ravel(),
+    })
+
+
+def save_hotspots(db, df):
+    """
+    Grava os hotspots em {schema}.hotspots. No Postgres a tabela é montada em staging
+    e publicada por troca atômica (DatabaseManager.publish_tables); no DuckDB fica no banco local.
+    """
+    if db.backend != "postgres":
+        db._create_from_frame("hotspots", df)
+        return
+    s = db.schema
+    table = db.staging_table("hotspots")
+    try:
+        db.cur.execute(f"""
+        DROP TABLE IF EXISTS {s}.{table};
+        CREATE TABLE {s}.{table} (
+            nivel varchar NOT NULL,
+            cd_unidade int NOT NULL,
+            nr_votavel int NOT NULL,
+            nm_votavel varchar,
+            pct_votos float8,
+            gi_z float8,
+            p_sim float8,
+            classe smallint NOT NULL
+        );
+        """)
+        rows = write_frame(db, df, table)
+        db.cur.execute(f"""
+        ALTER TABLE {s}.{table} ADD PRIMARY KEY (nivel, nr_votavel, cd_unidade);
+        CREATE INDEX ON {s}.{table} (nivel, cd_unidade);
+        ANALYZE {s}.{table};
+        """)
+        db.conn.commit()
+        print(f"  - {rows} linhas gravadas em '{s}.hotspots'.")
+    except Exception as e:
+        print(f"Erro ao gravar hotspots: {e}")
+        db.conn.rollback()
+        db.discard_staging("hotspots")
+        return
+    db.publish_tables()
+
+
+def run_hotspots(db, niveis=tuple(LEVELS), permutations=HOTSPOT_PERMUTATIONS, seed=HOTSPOT_SEED):
+    """Gi* de todos os candidatos em cada nível, gravado de uma vez na tabela hotspots"""
+    frames = []
+    for nivel in niveis:
+        with tracer.stage(f"hotspots.{nivel}"):
+            start = time.perf_counter()
+            try:
+                ids, candidatos, Y = vote_share_matrix(db, nivel)
+                if len(ids) < 5 or candidatos.empty:
+                    print(f"Hotspots ({nivel}): dados insuficientes.")
+                    continue
+                A = level_adjacency(db, nivel, ids)
+                z, p_sim = gi_star(Y, A, permutations, seed)
+            except Exception as e:
+                print(f"Erro ao calcular hotspots ({nivel}): {e}")
+                continue
+            df = hotspot_frame(nivel, ids, candidatos, Y, z, p_sim)
+            frames.append(df)
+            counts = df["classe"].value_counts().sort_index(ascending=False)
+            print(f"Hotspots ({nivel}): {len(ids)} unidades x {len(candidatos)} candidatos, "
+                  f"{permutations} permutações ({time.perf_counter() - start:.1f}s)")
+            for classe, total in counts.items():
+                print(f"  {CLASSES[classe]}: {total}")
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    with tracer.stage("hotspots.save"):
+        save_hotspots(db, df)
+    return df
+
+
+def main(db=None):
+    from db_manager import open_analysis_db
+    own = db is None
+    db = db or open_analysis_db()
+    try:
+        return run_hotspots(db)
+    finally:
+        if own:
+            db.close()
+
+
+if __name__ == "__main__":
+    tracer.configure(output=TRACE_FILE, explain_sample=TRACE_EXPLAIN_SAMPLE)
+    try:
+        main()
+    finally:
+        tracer.finish()
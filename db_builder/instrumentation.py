@@ -0,0 +1,371 @@
+"""
+Instrumentação de etapas e consultas SQL do pipeline.
+
+Cada etapa (tracer.stage) registra tempo de parede, tempo de CPU, pico de RSS,
+bytes lidos e linhas de entrada/saída. Cada comando SQL (via TracingCursor no psycopg2
+ou via eventos do SQLAlchemy) registra duração e linhas; uma fração configurável das
+consultas de leitura é reexecutada com EXPLAIN ANALYZE para medir o tempo gasto no banco.
+
+Ao final, tracer.finish() grava o trace (JSON lines se o arquivo terminar em .jsonl,
+senão formato Chrome trace, que abre no chrome://tracing ou no Perfetto) e imprime um resumo.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Só SELECTs simples são reexecutados com EXPLAIN ANALYZE; qualquer coisa que
+# possa escrever (INTO, FOR UPDATE, sequências, CTEs de escrita) fica de fora
+_EXPLAINABLE = ("SELECT",)
+_WRITE_KEYWORDS = ("INSERT", "UPDATE", "DELETE", "CREATE", "DROP", "ALTER", "TRUNCATE",
+                   " INTO ", "FOR SHARE", "NEXTVAL", "SETVAL", "PG_ADVISORY")
+# pq.TransactionStatus (igual em psycopg2 e psycopg 3)
+_TRANS_INTRANS = 2
+
+
+def _rss_bytes():
+    """RSS atual do processo (Linux); nos demais sistemas, o pico desde o início"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _bytes_read():
+    """Bytes lidos pelo processo até agora (/proc/self/io), ou None se indisponível"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class Span:
+    """Uma etapa (kind='stage') ou um comando SQL (kind='sql') medido"""
+
+    def __init__(self, name, kind, depth=0, rows_in=None):
+        self.name = name
+        self.kind = kind
+        self.depth = depth
+        self.tid = threading.get_ident()
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.io_start = _bytes_read() if kind == "stage" else None
+        self.rss_start = _rss_bytes() if kind == "stage" else 0
+        self.peak_rss = self.rss_start
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.bytes_read = None
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.sql_count = 0
+        self.sql_time_s = 0.0
+        self.db_exec_ms = None
+        self.db_plan_ms = None
+        self.error = None
+        self.args = {}
+
+    def close(self):
+        self.wall_s = time.perf_counter() - self.start
+        self.cpu_s = time.process_time() - self.cpu_start
+        if self.kind == "stage":
+            self.peak_rss = max(self.peak_rss, _rss_bytes())
+            io_end = _bytes_read()
+            if io_end is not None and self.io_start is not None:
+                self.bytes_read = io_end - self.io_start
+
+    def to_dict(self):
+        d = {
+            "name": self.name,
+            "kind": self.kind,
+            "depth": self.depth,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+        }
+        if self.kind == "stage":
+            d.update({
+                "peak_rss_mb": round(self.peak_rss / 2**20, 1),
+                "bytes_read": self.bytes_read,
+                "sql_count": self.sql_count,
+                "sql_time_s": round(self.sql_time_s, 6),
+            })
+        if self.db_exec_ms is not None:
+            d["db_exec_ms"] = round(self.db_exec_ms, 3)
+            d["db_plan_ms"] = round(self.db_plan_ms, 3)
+        if self.error:
+            d["error"] = self.error
+        d.update(self.args)
+        return d
+
+
+class Tracer:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.output = None
+        self.explain_sample = 0.0
+        self._local = threading.local()
+        self._open = []
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._engines = set()
+
+    def configure(self, output=None, explain_sample=0.0):
+        """output: caminho do trace (None = só o resumo); explain_sample: fração de 0 a 1"""
+        self.output = output or None
+        self.explain_sample = float(explain_sample or 0.0)
+
+    # --- Etapas ---
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def _start_sampler(self):
+        # Amostra o RSS periodicamente para capturar o pico dentro de cada etapa aberta
+        if self._sampler is not None:
+            return
+
+        def sample():
+            while True:
+                rss = _rss_bytes()
+                with self._lock:
+                    for span in self._open:
+                        if rss > span.peak_rss:
+                            span.peak_rss = rss
+                time.sleep(0.05)
+
+        self._sampler = threading.Thread(target=sample, name="tracer-rss", daemon=True)
+        self._sampler.start()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Mede uma etapa; dentro dela, tracer.add_rows() atribui contagens de linhas"""
+        self._start_sampler()
+        stack = self._stack()
+        span = Span(name, "stage", depth=len(stack), rows_in=rows_in)
+        stack.append(span)
+        with self._lock:
+            self._open.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.close()
+            stack.pop()
+            with self._lock:
+                self._open.remove(span)
+                self.spans.append(span)
+            # Propaga as estatísticas de SQL para a etapa pai
+            if stack:
+                stack[-1].sql_count += span.sql_count
+                stack[-1].sql_time_s += span.sql_time_s
+
+    def add_rows(self, rows_in=None, rows_out=None):
+        span = self.current()
+        if span is None:
+            return
+        if rows_in is not None:
+            span.rows_in = (span.rows_in or 0) + rows_in
+        if rows_out is not None:
+            span.rows_out = (span.rows_out or 0) + rows_out
+
+    # --- SQL ---
+
+    def record_sql(self, statement, duration, rowcount=None, dbapi_conn=None, params=None):
+        if getattr(self._local, "explaining", False):
+            return
+        parent = self.current()
+        sql_text = statement.decode() if isinstance(statement, bytes) else str(statement)
+        span = Span(" ".join(sql_text.split())[:120], "sql", depth=parent.depth + 1 if parent else 0)
+        span.start -= duration
+        span.wall_s = duration
+        span.rows_out = rowcount if rowcount is not None and rowcount >= 0 else None
+        if dbapi_conn is not None and self._should_explain(sql_text):
+            self._explain(span, sql_text, params, dbapi_conn)
+        with self._lock:
+            self.spans.append(span)
+        if parent is not None:
+            parent.sql_count += 1
+            parent.sql_time_s += duration
+
+    def _should_explain(self, sql_text):
+        if self.explain_sample <= 0 or getattr(self._local, "explaining", False):
+            return False
+        head = sql_text.lstrip().upper()
+        if not head.startswith(_EXPLAINABLE):
+            return False
+        if any(k in " ".join(head.split()) for k in _WRITE_KEYWORDS):
+            return False
+        return random.random() < self.explain_sample
+
+    def _explain(self, span, sql_text, params, dbapi_conn):
+        """Reexecuta o comando com EXPLAIN ANALYZE isolado da transação do chamador.
+
+        Dentro de uma transação o EXPLAIN roda sob um SAVEPOINT que é sempre
+        desfeito, de modo que um erro não aborta a transação do chamador e
+        nada do que o comando fizer persiste; em autocommit roda num
+        BEGIN/ROLLBACK próprio. Transações já abortadas não são amostradas.
+        """
+        status = getattr(getattr(dbapi_conn, "info", None), "transaction_status", None)
+        in_tx = status == _TRANS_INTRANS
+        if not in_tx and not getattr(dbapi_conn, "autocommit", False):
+            return
+        self._local.explaining = True
+        try:
+            cur = dbapi_conn.cursor()
+            try:
+                cur.execute("SAVEPOINT trace_explain" if in_tx else "BEGIN")
+                try:
+                    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql_text, params)
+                    plan = cur.fetchone()[0]
+                finally:
+                    if in_tx:
+                        cur.execute("ROLLBACK TO SAVEPOINT trace_explain")
+                        cur.execute("RELEASE SAVEPOINT trace_explain")
+                    else:
+                        cur.execute("ROLLBACK")
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                span.db_exec_ms = plan[0].get("Execution Time", 0.0)
+                span.db_plan_ms = plan[0].get("Planning Time", 0.0)
+            finally:
+                cur.close()
+        except Exception as e:
+            span.args["explain_error"] = str(e)[:200]
+        finally:
+            self._local.explaining = False
+
+    def instrument_engine(self, engine):
+        """Registra a duração de cada comando executado por um Engine do SQLAlchemy"""
+        from sqlalchemy import event
+
+        if id(engine) in self._engines:
+            return
+        self._engines.add(id(engine))
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("trace_start", []).append(time.perf_counter())
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            start = conn.info["trace_start"].pop()
+            self.record_sql(statement, time.perf_counter() - start, cursor.rowcount,
+                            dbapi_conn=cursor.connection, params=parameters)
+
+        def on_error(context):
+            starts = context.connection.info.get("trace_start") if context.connection is not None else None
+            if starts:
+                starts.pop()
+
+        event.listen(engine, "before_cursor_execute", before)
+        event.listen(engine, "after_cursor_execute", after)
+        event.listen(engine, "handle_error", on_error)
+
+    # --- Saída ---
+
+    def write_trace(self, path):
+        spans = sorted(self.spans, key=lambda s: s.start)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                for span in spans:
+                    d = span.to_dict()
+                    d["ts_s"] = round(span.start - self.origin, 6)
+                    f.write(json.dumps(d, ensure_ascii=False) + "\n")
+            else:
+                events = [{
+                    "name": span.name,
+                    "cat": span.kind,
+                    "ph": "X",
+                    "ts": (span.start - self.origin) * 1e6,
+                    "dur": span.wall_s * 1e6,
+                    "pid": os.getpid(),
+                    "tid": span.tid,
+                    "args": span.to_dict(),
+                } for span in spans]
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        print(f"Trace salvo em: {path}")
+
+    def summary(self):
+        stages = sorted((s for s in self.spans if s.kind == "stage"), key=lambda s: s.start)
+        if not stages:
+            return
+        sql = [s for s in self.spans if s.kind == "sql"]
+        print(f"\n{'Etapa':<48} | {'Wall (s)':>9} | {'CPU (s)':>8} | {'RSS pico (MB)':>13} | "
+              f"{'Lido (MB)':>9} | {'Linhas in/out':>17} | {'SQL (n / s)':>13}")
+        print("-" * 135)
+        for s in stages:
+            rows = f"{s.rows_in if s.rows_in is not None else '-'}/{s.rows_out if s.rows_out is not None else '-'}"
+            read = f"{s.bytes_read / 2**20:.1f}" if s.bytes_read is not None else "-"
+            name = ("  " * s.depth + s.name)[:48]
+            print(f"{name:<48} | {s.wall_s:>9.3f} | {s.cpu_s:>8.3f} | {s.peak_rss / 2**20:>13.1f} | "
+                  f"{read:>9} | {rows:>17} | {s.sql_count:>5} / {s.sql_time_s:>5.2f}")
+        explained = [s for s in sql if s.db_exec_ms is not None]
+        if explained:
+            print(f"\nEXPLAIN ANALYZE em {len(explained)} de {len(sql)} comandos SQL "
+                  f"(execução no banco: {sum(s.db_exec_ms for s in explained):.1f} ms, "
+                  f"planejamento: {sum(s.db_plan_ms for s in explained):.1f} ms)")
+            for s in sorted(explained, key=lambda s: -s.db_exec_ms)[:5]:
+                print(f"  {s.db_exec_ms:>10.1f} ms  {s.name}")
+
+    def finish(self):
+        """Grava o trace (se configurado) e imprime o resumo"""
+        if self.output:
+            self.write_trace(self.output)
+        self.summary()
+
+
+# Instância única usada por todo o pipeline
+tracer = Tracer()
+
+
+class TracingCursor(psycopg2.extensions.cursor):
+    """Cursor psycopg2 que registra cada execute/copy no tracer"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            tracer.record_sql(query, time.perf_counter() - start, self.rowcount,
+                              dbapi_conn=self.connection, params=vars)
+
+    def copy_from(self, file, table, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().copy_from(file, table, *args, **kwargs)
+        finally:
+            tracer.record_sql(f"COPY {table} FROM STDIN", time.perf_counter() - start, self.rowcount)
+
+    def copy_expert(self, sql, file, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, *args, **kwargs)
+        finally:
+            tracer.record_sql(sql, time.perf_counter() - start, self.rowcount)
@@ -1,26 +1,59 @@
 from data_processor import run_all_processing
 from db_manager import DatabaseManager
+from instrumentation import tracer
+from config import TRACE_FILE, TRACE_EXPLAIN_SAMPLE
 
-def main():
+def process():
     # 1. Processamento de Dados (Pandas)
     # Lê os arquivos brutos, limpa e salva na pasta 'processed_data'
     print("--- INICIANDO PROCESSAMENTO DE DADOS ---")
-    run_all_processing()
-    
+    with tracer.stage("run_all_processing"):
+        run_all_processing()
+
+def load():
     # 2. Carga no Banco de Dados (Postgres/PostGIS)
     print("\n--- INICIANDO OPERAÇÕES DE BANCO DE DADOS ---")
     db = DatabaseManager()
     
     try:
-        # Cria as tabelas (DROP IF EXISTS + CREATE)
-        db.create_tables()
+        # Cria as tabelas (em staging: as versões publicadas só são trocadas no final)
+        with tracer.stage("create_tables"):
+            db.create_tables()
         
         # Carrega os dados tabulares (CSVs processados)
-        db.load_csv_data()
+        with tracer.stage("load_csv_data"):
+            db.load_csv_data()
         
+        # Limpa a votação por seção em streaming e carrega a resultados_secao
+        with tracer.stage("load_resultados_secao"):
+            db.load_resultados_secao()
+
+        # Perfil de qualidade coletado na mesma passada do processamento e da carga
+        with tracer.stage("save_profiles"):
+            db.save_profiles()
+
         # Carrega as geometrias (Shapefiles)
-        db.load_shapefiles()
-        
+        with tracer.stage("load_shapefiles"):
+            db.load_shapefiles()
+
+        # Malha municipal enriquecida (GeoParquet do processamento) e mapa de códigos TSE <-> IBGE
+        with tracer.stage("load_geo_mun"):
+            db.load_geo_mun()
+
+        # Pré-computa regiões (geometrias dissolvidas) e agregados municipais
+        with tracer.stage("build_region_tables"):
+            db.build_region_tables()
+        with tracer.stage("build_neighbor_tables"):
+            db.build_neighbor_tables()
+        with tracer.stage("build_aggregate_tables"):
+            db.build_aggregate_tables()
+        with tracer.stage("build_atributos_table"):
+            db.build_atributos_table()
+
+        # Troca atômica: todas as tabelas novas entram no lugar das antigas em uma transação
+        with tracer.stage("publish_tables"):
+            db.publish_tables()
+
         print("\nProcesso concluído com sucesso!")
         
     except Exception as e:
@@ -28,5 +61,13 @@ def main():
     finally:
         db.close()
 
+def main():
+    tracer.configure(output=TRACE_FILE, explain_sample=TRACE_EXPLAIN_SAMPLE)
+    try:
+        process()
+        load()
+    finally:
+        tracer.finish()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,27 +1,31 @@
-import pandas as pd
-import geopandas as gpd
-import matplotlib.pyplot as plt
 import seaborn as sns
-import numpy as np
-from sqlalchemy import text
-from libpysal.weights.contiguity import Queen
 from esda.moran import Moran, Moran_BV
-from splot.esda import plot_moran, moran_scatterplot, lisa_cluster
-from db_manager import DatabaseManager
+from db_manager import open_analysis_db
+from queries import votos_candidato_sql, secao_table, atributos_municipais
+from instrumentation import tracer
+from spatial_analysis import moran_global, moran_global_batch
+from spatial_weights import weights_from_frame
+from hotspots import run_hotspots
+import async_db
+from config import (TRACE_FILE, TRACE_EXPLAIN_SAMPLE, MORAN_SERVER_SIDE, MORAN_PERMUTATIONS,
+                    ASYNC_QUERIES, ASYNC_POOL_SIZE, METRICS_HOTSPOTS)
 
 # Configurações visuais
 sns.set_theme(style="whitegrid")
 
 class SpatialMetricsAnalysis:
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.gdf_mun = self.load_geometries()
+    def __init__(self, server_side=MORAN_SERVER_SIDE):
+        self.db = open_analysis_db()
+        # No modo server_side o Moran é calculado no banco (tabela vizinhos) e as geometrias não são carregadas.
+        # Só no Postgres: no backend DuckDB o Moran é sempre calculado em Python
+        self.server_side = server_side and self.db.backend == "postgres"
+        self.gdf_mun = None if self.server_side else self.load_geometries()
         
     def load_geometries(self):
         """Carrega a geometria dos municípios e informações de regiões"""
         print("Carregando geometrias...")
         query = f"""SELECT * FROM {self.db.schema}.geo_mun"""
-        gdf = gpd.read_postgis(query, self.db.engine, geom_col='geometry')
+        gdf = self.db.read_geo(query)
         
         # Garante que as colunas de código sejam inteiros para os joins funcionarem
         # Ajuste os nomes das colunas conforme sua tabela real (maiúsculo/minúsculo)
@@ -32,8 +36,11 @@ class SpatialMetricsAnalysis:
             
         return gdf
 
-    def calculate_moran_i(self, gdf, variable_col, title="Moran's I"):
-        """Calcula o I de Moran Global e exibe o resultado"""
+    def calculate_moran_i(self, gdf, variable_col, title="Moran's I", w=None):
+        """
+        Calcula o I de Moran Global e exibe o resultado.
+        Se `w` for informado, reaproveita a matriz de pesos (deve corresponder às linhas de gdf).
+        """
         # Remove NaNs e geometrias vazias para evitar erros matemáticos
         gdf_clean = gdf.dropna(subset=[variable_col])
         gdf_clean = gdf_clean[~gdf_clean.is_empty]
@@ -44,9 +51,9 @@ class SpatialMetricsAnalysis:
             return None, None
         
         try:
-            # Cria matriz de pesos espaciais (Queen contiguity)
-            w = Queen.from_dataframe(gdf_clean)
-            w.transform = 'r' # Padronização por linha
+            if w is None or w.n != len(gdf_clean):
+                # Matriz de pesos espaciais padronizada por linha (Queen, KNN ou banda: DB_BUILDER_WEIGHTS)
+                w = weights_from_frame(gdf_clean)
             
             # Calcula Moran's I
             y = gdf_clean[variable_col].values
@@ -64,30 +71,59 @@ class SpatialMetricsAnalysis:
             print(f"Erro ao calcular Moran para {title}: {e}")
             return None, None
 
-    def get_votes_by_candidate(self, candidate_name):
-        """Retorna GeoDataFrame com % de votos do candidato por município"""
-        # Usando aspas duplas para garantir Case Sensitivity nos nomes das colunas
-        query = f"""
-        WITH total_mun AS (
-            SELECT cd_municipio, SUM(qt_votos) as total_votos
-            FROM {self.db.schema}.resultados_secao GROUP BY 1
-        ),
-        cand_votos AS (
+    def calculate_moran_i_sql(self, values_sql, params=None, title="Moran's I", nivel="mun"):
+        """
+        Calcula o I de Moran Global dentro do Postgres (ver spatial_analysis.moran_global).
+        values_sql deve retornar (id, valor); imprime no mesmo formato de calculate_moran_i.
+        """
+        try:
+            moran = moran_global(self.db, values_sql, params, nivel=nivel, permutations=MORAN_PERMUTATIONS)
+        except Exception as e:
+            print(f"Erro ao calcular Moran para {title}: {e}")
+            return None
+
+        print(f"--- {title} ---")
+        if moran is None or moran["n"] < 5:
+            print("Dados insuficientes para calcular Moran I.")
+            return None
+
+        print(f"I de Moran: {moran['I']:.4f}")
+        print(f"p-valor: {moran['p_sim']:.4f}")
+        conclusion = "Autocorrelação Espacial Significativa" if moran['p_sim'] < 0.05 else "Aleatório (Sem padrão espacial claro)"
+        print(f"Conclusão: {conclusion}")
+        print("-" * 30)
+        return moran
+
+    def votes_by_candidate_sql(self):
+        """SQL (id, valor) com o % de votos do candidato %(candidato)s por município"""
+        return f"""
+        SELECT 
+            t.cd_municipio as id,
+            (COALESCE(c.votos_cand, 0) * 100.0 / NULLIF(t.total_votos, 0))::float8 as valor
+        FROM {self.db.schema}.total_votos_mun t
+        JOIN {self.db.schema}.mun_regiao m ON m.cd_mun_tse = t.cd_municipio
+        LEFT JOIN (
             SELECT cd_municipio, SUM(qt_votos) as votos_cand
-            FROM {self.db.schema}.resultados_secao
-            WHERE nm_votavel = '{candidate_name}'
+            FROM {self.db.schema}.votos_mun
+            WHERE nm_votavel = %(candidato)s
             GROUP BY 1
-        )
-        SELECT 
-            m."CD_MUN_IBG",
-            m."CD_MUN_TSE",
-            m.geometry,
-            COALESCE(c.votos_cand, 0) * 100.0 / t.total_votos as pct_votos
-        FROM {self.db.schema}.geo_mun m
-        JOIN total_mun t ON CAST(m."CD_MUN_TSE" AS INTEGER) = t.cd_municipio
-        LEFT JOIN cand_votos c ON CAST(m."CD_MUN_TSE" AS INTEGER) = c.cd_municipio
+        ) c ON c.cd_municipio = t.cd_municipio
         """
-        return gpd.read_postgis(query, self.db.engine, geom_col='geometry')
+
+    def get_votes_by_candidate(self, candidate_name):
+        """Retorna GeoDataFrame com % de votos do candidato por município"""
+        # Consulta preparada no servidor: um único plano serve a todos os candidatos,
+        # e o nome vai como parâmetro (nomes com apóstrofo não quebram o SQL)
+        stmt = self.db.prepare("votos_candidato", votos_candidato_sql(self.db.schema), ["varchar"])
+        return self.attach_geometry(stmt.execute(candidate_name))
+
+    def attach_geometry(self, df):
+        """Junta os percentuais por município (cd_municipio, pct_votos) às geometrias em memória"""
+        # As geometrias já estão em memória (self.gdf_mun); só os percentuais trafegam
+        gdf = self.gdf_mun[['CD_MUN_IBG', 'CD_MUN_TSE', 'geometry']].merge(
+            df, left_on='CD_MUN_TSE', right_on='cd_municipio', how='inner'
+        )
+        return gdf.drop(columns='cd_municipio')
 
     def analyze_autocorrelation_candidates(self):
         """
@@ -96,25 +132,77 @@ class SpatialMetricsAnalysis:
         print("\n=== A. ANÁLISE DE AUTOCORRELAÇÃO POR CANDIDATO ===")
         
         # Consultas SQL
-        top1_query = f"SELECT nm_votavel FROM {self.db.schema}.resultados_secao GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT 1"
+        top1_query = f"SELECT nm_votavel FROM {secao_table(self.db.schema)} GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT 1"
         # Pega alguém da posição 100 para ser o 'regional/médio'
-        mid_query = f"SELECT nm_votavel FROM {self.db.schema}.resultados_secao GROUP BY 1 ORDER BY SUM(qt_votos) DESC OFFSET 100 LIMIT 1"
+        mid_query = f"SELECT nm_votavel FROM {secao_table(self.db.schema)} GROUP BY 1 ORDER BY SUM(qt_votos) DESC OFFSET 100 LIMIT 1"
         
-        # CORREÇÃO: Usar engine.connect() para ter acesso ao exec_driver_sql
-        with self.db.engine.connect() as conn:
-            cand_amplo = conn.exec_driver_sql(top1_query).scalar()
-            cand_regional = conn.exec_driver_sql(mid_query).scalar()
+        cand_amplo = self.db.scalar(top1_query)
+        cand_regional = self.db.scalar(mid_query)
         
         candidates = {
             'Votação Ampla / Eleito': cand_amplo,
             'Votação Menor / Regional': cand_regional
         }
         
-        for label, name in candidates.items():
-            if name:
-                print(f"\nProcessando: {name} ({label})")
-                gdf = self.get_votes_by_candidate(name)
-                self.calculate_moran_i(gdf, 'pct_votos', title=f"Moran I - {name}")
+        if self.server_side:
+            for label, name in candidates.items():
+                if name:
+                    print(f"\nProcessando: {name} ({label})")
+                    self.calculate_moran_i_sql(self.votes_by_candidate_sql(), {'candidato': name},
+                                               title=f"Moran I - {name}")
+            return
+
+        self.moran_for_candidates({label: name for label, name in candidates.items() if name})
+
+    def moran_for_candidates(self, candidates):
+        """
+        I de Moran para vários candidatos ({rótulo: nome}).
+        As consultas saem em paralelo (async_db.fan_out) e o Moran de cada candidato
+        é calculado assim que seus percentuais chegam.
+        """
+        def handle(label, df):
+            name = candidates[label]
+            print(f"\nProcessando: {name} ({label})")
+            moran, _ = self.calculate_moran_i(self.attach_geometry(df), 'pct_votos', title=f"Moran I - {name}")
+            return moran
+
+        return async_db.fan_out(
+            self.db, "votos_candidato", votos_candidato_sql(self.db.schema), ["varchar"],
+            {label: (name,) for label, name in candidates.items()}, handle,
+            pool_size=ASYNC_POOL_SIZE, use_async=ASYNC_QUERIES,
+        )
+
+    def analyze_all_candidates_sql(self):
+        """
+        A'. I de Moran de todos os candidatos em uma única consulta no banco (inferência analítica).
+        Disponível apenas no modo server_side.
+        """
+        print("\n=== A'. AUTOCORRELAÇÃO DE TODOS OS CANDIDATOS (NO BANCO) ===")
+
+        # Cada candidato com todos os municípios (ausência de votos = 0%)
+        values_sql = f"""
+        SELECT c.nr_votavel as grupo, t.cd_municipio as id,
+               (COALESCE(v.qt_votos, 0) * 100.0 / NULLIF(t.total_votos, 0))::float8 as valor
+        FROM (SELECT DISTINCT nr_votavel FROM {self.db.schema}.votos_mun WHERE nr_votavel >= 1000) c
+        CROSS JOIN {self.db.schema}.total_votos_mun t
+        JOIN {self.db.schema}.mun_regiao m ON m.cd_mun_tse = t.cd_municipio
+        LEFT JOIN {self.db.schema}.votos_mun v
+               ON v.nr_votavel = c.nr_votavel AND v.cd_municipio = t.cd_municipio
+        """
+        try:
+            df = moran_global_batch(self.db, values_sql)
+        except Exception as e:
+            print(f"Erro no Moran em lote dos candidatos: {e}")
+            return None
+
+        if df.empty:
+            print("AVISO: Nenhum candidato encontrado.")
+            return df
+
+        significativos = (df['p_norm'] < 0.05).sum()
+        print(f"Candidatos analisados: {len(df)} | com autocorrelação significativa (p<0.05): {significativos}")
+        print(df.sort_values('I', ascending=False).head(10).to_string(index=False))
+        return df
 
     def analyze_aggregated_levels(self):
         """
@@ -122,34 +210,54 @@ class SpatialMetricsAnalysis:
         """
         print("\n=== B. ANÁLISE EM NÍVEIS AGREGADOS ===")
         
-        top1_query = f"SELECT nm_votavel FROM {self.db.schema}.resultados_secao GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT 1"
+        # Usa o agregado municipal (votos_mun) em vez de reler as seções
+        top1_query = f"SELECT nm_votavel FROM {self.db.schema}.votos_mun GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT 1"
         
-        # CORREÇÃO: Usar engine.connect()
-        with self.db.engine.connect() as conn:
-            target_cand = conn.exec_driver_sql(top1_query).scalar()
+        target_cand = self.db.scalar(top1_query)
             
         print(f"Candidato de referência: {target_cand}")
         
-        # Níveis de agregação baseados nas colunas da sua tabela geo_mun
+        # Níveis de agregação -> tabelas pré-computadas na carga (ver DatabaseManager.build_region_tables)
         levels = {
-            'Região Imediata': 'NM_RGI',      # Ajuste se o nome da coluna for diferente (ex: nm_rgi)
-            'Região Intermediária': 'NM_RGINT' # Ajuste se o nome da coluna for diferente
+            'Região Imediata': 'rgi',
+            'Região Intermediária': 'rgint'
         }
         
-        for label, col_agregacao in levels.items():
-            # Query para agregar votos e unir geometrias
-            # IMPORTANTE: Usamos aspas duplas em col_agregacao para respeitar o case sensitive da sua tabela
+        for label, nivel in levels.items():
+            if self.server_side:
+                values_sql = f"""
+                SELECT 
+                    m.cd_{nivel} as id,
+                    (SUM(CASE WHEN v.nm_votavel = %(candidato)s THEN v.qt_votos ELSE 0 END) * 100.0
+                        / NULLIF(SUM(v.qt_votos), 0))::float8 as valor
+                FROM {self.db.schema}.votos_mun v
+                JOIN {self.db.schema}.mun_regiao m ON v.cd_municipio = m.cd_mun_tse
+                GROUP BY 1
+                """
+                self.calculate_moran_i_sql(values_sql, {'candidato': target_cand},
+                                           title=f"Moran I Agregado - {label}", nivel=nivel)
+                continue
+
+            # As geometrias já estão dissolvidas em geo_{nivel}; aqui só somamos os agregados municipais
             query = f"""
+            WITH agregado AS (
+                SELECT 
+                    m.cd_{nivel},
+                    SUM(CASE WHEN v.nm_votavel = %(candidato)s THEN v.qt_votos ELSE 0 END) as votos_cand,
+                    SUM(v.qt_votos) as total_votos
+                FROM {self.db.schema}.votos_mun v
+                JOIN {self.db.schema}.mun_regiao m ON v.cd_municipio = m.cd_mun_tse
+                GROUP BY 1
+            )
             SELECT 
-                g."{col_agregacao}" as regiao,
-                ST_Union(g.geometry) as geometry,
-                SUM(CASE WHEN r.nm_votavel = '{target_cand}' THEN r.qt_votos ELSE 0 END) * 100.0 / NULLIF(SUM(r.qt_votos), 0) as pct_votos
-            FROM {self.db.schema}.geo_mun g
-            JOIN {self.db.schema}.resultados_secao r ON CAST(g."CD_MUN_TSE" AS INTEGER) = r.cd_municipio
-            GROUP BY 1
+                g.nm_{nivel} as regiao,
+                g.geometry,
+                a.votos_cand * 100.0 / NULLIF(a.total_votos, 0) as pct_votos
+            FROM {self.db.schema}.geo_{nivel} g
+            JOIN agregado a ON a.cd_{nivel} = g.cd_{nivel}
             """
             try:
-                gdf_agg = gpd.read_postgis(query, self.db.engine, geom_col='geometry')
+                gdf_agg = self.db.read_geo(query, {'candidato': target_cand})
                 self.calculate_moran_i(gdf_agg, 'pct_votos', title=f"Moran I Agregado - {label}")
             except Exception as e:
                 print(f"Erro na agregação {label}: {e}")
@@ -160,44 +268,28 @@ class SpatialMetricsAnalysis:
         """
         print("\n=== C & D. CORRELAÇÃO SOCIOECONÔMICA E CONECTIVIDADE ===")
         
-        top1_query = f"SELECT nm_votavel FROM {self.db.schema}.resultados_secao GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT 1"
+        top1_query = f"SELECT nm_votavel FROM {secao_table(self.db.schema)} GROUP BY 1 ORDER BY SUM(qt_votos) DESC LIMIT 1"
         
-        # CORREÇÃO: Usar engine.connect()
-        with self.db.engine.connect() as conn:
-            cand_name = conn.exec_driver_sql(top1_query).scalar()
+        cand_name = self.db.scalar(top1_query)
         
-        # Montar Dataset Completo
-        # Atenção aos nomes das colunas nas tabelas censo_mun, rais, extra
+        # Votos e geometria por município; os dados socioeconômicos vêm da atributos_mun
         query = f"""
         WITH votos AS (
             SELECT cd_municipio, SUM(qt_votos) as total,
-                   SUM(CASE WHEN nm_votavel = '{cand_name}' THEN qt_votos ELSE 0 END) as votos_cand
-            FROM {self.db.schema}.resultados_secao GROUP BY 1
-        ),
-        rais_agg AS (
-             SELECT id_municipio, AVG(valor_remuneracao_media_sm) as remuneracao_media
-             FROM {self.db.schema}.rais GROUP BY 1
+                   SUM(CASE WHEN nm_votavel = %(candidato)s THEN qt_votos ELSE 0 END) as votos_cand
+            FROM {secao_table(self.db.schema)} GROUP BY 1
         )
         SELECT 
-            g."CD_MUN_IBG",
+            CAST(g."CD_MUN_IBG" AS INTEGER) AS id_municipio,
             g.geometry,
-            (v.votos_cand * 100.0 / NULLIF(v.total, 0)) as pct_votos,
-            -- Dados Censo
-            c.taxa_alfabetizacao,
-            c.indice_envelhecimento,
-            -- Dados RAIS
-            r.remuneracao_media,
-            -- Dados Extra (Conectividade)
-            e.cobertura_pop_4g5g
+            (v.votos_cand * 100.0 / NULLIF(v.total, 0)) as pct_votos
         FROM {self.db.schema}.geo_mun g
         JOIN votos v ON CAST(g."CD_MUN_TSE" AS INTEGER) = v.cd_municipio
-        LEFT JOIN {self.db.schema}.censo_mun c ON CAST(g."CD_MUN_IBG" AS INTEGER) = c.id_municipio
-        LEFT JOIN rais_agg r ON CAST(g."CD_MUN_IBG" AS INTEGER) = r.id_municipio
-        LEFT JOIN {self.db.schema}.extra e ON CAST(g."CD_MUN_IBG" AS INTEGER) = e.id_municipio
         """
         
         try:
-            gdf = gpd.read_postgis(query, self.db.engine, geom_col='geometry')
+            gdf = self.db.read_geo(query, {'candidato': cand_name})
+            gdf = gdf.merge(atributos_municipais(self.db), on='id_municipio', how='left')
             
             # Mapeamento: Nome para exibição -> Coluna no DataFrame
             variables = {
@@ -212,8 +304,7 @@ class SpatialMetricsAnalysis:
             gdf_clean = gdf_clean[~gdf_clean.is_empty]
             
             if len(gdf_clean) > 5:
-                w = Queen.from_dataframe(gdf_clean)
-                w.transform = 'r'
+                w = weights_from_frame(gdf_clean)
                 
                 print(f"Análise para o candidato: {cand_name}")
                 print(f"{'Variável':<35} | {'Corr (Pearson)':<15} | {'Moran Bivariado (I)':<20}")
@@ -235,57 +326,118 @@ class SpatialMetricsAnalysis:
         except Exception as e:
             print(f"Erro na análise de correlação: {e}")
 
+    def get_votes_by_party_all(self):
+        """
+        Retorna, em uma única consulta, o % de votos de todos os partidos em todos os municípios
+        (formato longo: cd_municipio, nr_partido, votos_partido, pct_votos).
+        """
+        query = f"""
+        SELECT 
+            p.cd_municipio,
+            p.nr_partido,
+            p.qt_votos as votos_partido,
+            p.qt_votos * 100.0 / NULLIF(t.total_votos, 0) as pct_votos
+        FROM {self.db.schema}.votos_mun_partido p
+        JOIN {self.db.schema}.total_votos_mun t ON t.cd_municipio = p.cd_municipio
+        """
+        return self.db.read_frame(query)
+
     def analyze_party_autocorrelation(self):
         """
-        E. Autocorrelação espacial por partido
+        E. Autocorrelação espacial por partido (todos os partidos, em uma única passada)
         """
         print("\n=== E. ANÁLISE POR PARTIDO ===")
         
-        # Identificar Top 3 Partidos (usando os 2 primeiros dígitos)
-        top_parties_query = f"""
-        SELECT LEFT(CAST(nr_votavel AS VARCHAR), 2) as partido, SUM(qt_votos)
-        FROM {self.db.schema}.resultados_secao
-        WHERE LENGTH(CAST(nr_votavel AS VARCHAR)) >= 4 
-        GROUP BY 1 ORDER BY 2 DESC LIMIT 3
-        """
-        
+        if self.server_side:
+            return self.analyze_party_autocorrelation_sql()
+
         try:
-            parties = pd.read_sql(top_parties_query, self.db.engine)['partido'].tolist()
-            print(f"Top Partidos identificados: {parties}")
+            df = self.get_votes_by_party_all()
+            if df.empty:
+                print("AVISO: Nenhum voto nominal com partido identificado.")
+                return
+            
+            # Partidos ordenados pelo total de votos no estado
+            parties = df.groupby('nr_partido')['votos_partido'].sum().sort_values(ascending=False).index.tolist()
+            print(f"Partidos identificados: {parties}")
+            
+            # Municípios nas linhas, partidos nas colunas (ausência de votos = 0%)
+            df_pivot = df.pivot(index='cd_municipio', columns='nr_partido', values='pct_votos')
+            
+            gdf = self.gdf_mun[['CD_MUN_TSE', 'geometry']].merge(
+                df_pivot, left_on='CD_MUN_TSE', right_index=True, how='inner'
+            )
+            gdf = gdf[~gdf.is_empty].reset_index(drop=True)
+            gdf[parties] = gdf[parties].fillna(0)
+            
+            if len(gdf) < 5:
+                print("Dados insuficientes para calcular Moran I por partido.")
+                return
+            
+            # Uma única matriz de pesos para todos os partidos
+            w = weights_from_frame(gdf)
             
             for partido in parties:
-                query = f"""
-                WITH total_mun AS (
-                    SELECT cd_municipio, SUM(qt_votos) as total_votos
-                    FROM {self.db.schema}.resultados_secao GROUP BY 1
-                ),
-                partido_votos AS (
-                    SELECT cd_municipio, SUM(qt_votos) as votos_partido
-                    FROM {self.db.schema}.resultados_secao
-                    WHERE LEFT(CAST(nr_votavel AS VARCHAR), 2) = '{partido}'
-                    GROUP BY 1
-                )
-                SELECT 
-                    g.geometry,
-                    COALESCE(p.votos_partido, 0) * 100.0 / NULLIF(t.total_votos, 0) as pct_votos
-                FROM {self.db.schema}.geo_mun g
-                JOIN total_mun t ON CAST(g."CD_MUN_TSE" AS INTEGER) = t.cd_municipio
-                LEFT JOIN partido_votos p ON CAST(g."CD_MUN_TSE" AS INTEGER) = p.cd_municipio
-                """
-                gdf = gpd.read_postgis(query, self.db.engine, geom_col='geometry')
-                self.calculate_moran_i(gdf, 'pct_votos', title=f"Partido {partido}")
+                self.calculate_moran_i(gdf, partido, title=f"Partido {partido}", w=w)
+        except Exception as e:
+            print(f"Erro na análise de partidos: {e}")
+
+    def analyze_party_autocorrelation_sql(self):
+        """
+        E. (no banco) I de Moran de todos os partidos em uma única consulta sobre votos_mun_partido
+        """
+        # Cada partido com todos os municípios (ausência de votos = 0%)
+        values_sql = f"""
+        SELECT p.nr_partido as grupo, t.cd_municipio as id,
+               (COALESCE(v.qt_votos, 0) * 100.0 / NULLIF(t.total_votos, 0))::float8 as valor
+        FROM (SELECT DISTINCT nr_partido FROM {self.db.schema}.votos_mun_partido) p
+        CROSS JOIN {self.db.schema}.total_votos_mun t
+        JOIN {self.db.schema}.mun_regiao m ON m.cd_mun_tse = t.cd_municipio
+        LEFT JOIN {self.db.schema}.votos_mun_partido v
+               ON v.nr_partido = p.nr_partido AND v.cd_municipio = t.cd_municipio
+        """
+        try:
+            df = moran_global_batch(self.db, values_sql)
+            if df.empty:
+                print("AVISO: Nenhum voto nominal com partido identificado.")
+                return
+
+            print(f"Partidos identificados: {df['grupo'].tolist()}")
+            for row in df.itertuples():
+                print(f"--- Partido {row.grupo} ---")
+                print(f"I de Moran: {row.I:.4f}")
+                print(f"p-valor (normal): {row.p_norm:.4f}")
+                conclusion = "Autocorrelação Espacial Significativa" if row.p_norm < 0.05 else "Aleatório (Sem padrão espacial claro)"
+                print(f"Conclusão: {conclusion}")
+                print("-" * 30)
         except Exception as e:
             print(f"Erro na análise de partidos: {e}")
 
+    def analyze_hotspots(self):
+        """Gi* de todos os candidatos (municípios e regiões), gravado na tabela hotspots"""
+        print("\n=== HOTSPOTS (Gi*) DE TODOS OS CANDIDATOS ===")
+        run_hotspots(self.db)
+
     def run_all(self):
+        steps = [self.analyze_autocorrelation_candidates, self.analyze_aggregated_levels,
+                 self.analyze_socioeconomic_correlation, self.analyze_party_autocorrelation]
+        if self.server_side:
+            steps.insert(1, self.analyze_all_candidates_sql)
+        # Gi* com permutações de todos os candidatos em três níveis: só sob demanda
+        if METRICS_HOTSPOTS:
+            steps.append(self.analyze_hotspots)
         try:
-            self.analyze_autocorrelation_candidates()
-            self.analyze_aggregated_levels()
-            self.analyze_socioeconomic_correlation()
-            self.analyze_party_autocorrelation()
+            for step in steps:
+                with tracer.stage(f"metrics.{step.__name__}"):
+                    step()
         finally:
             self.db.close()
 
 if __name__ == "__main__":
-    analysis = SpatialMetricsAnalysis()
-    analysis.run_all()
\ No newline at end of file
+    tracer.configure(output=TRACE_FILE, explain_sample=TRACE_EXPLAIN_SAMPLE)
+    try:
+        with tracer.stage("metrics.load_geometries"):
+            analysis = SpatialMetricsAnalysis()
+        analysis.run_all()
+    finally:
+        tracer.finish()
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+Perfil de qualidade dos dados coletado durante a carga.
+
+Cada TableProfiler recebe os mesmos chunks/DataFrames que já passam pela carga
+(carregar_csv, processadores do data_processor, resultados_secao) e acumula, por coluna:
+nulos, sentinelas do TSE (#NULO/#NE e os códigos -1/-3), mínimo/máximo, número
+aproximado de valores distintos (HyperLogLog) e um histograma em faixas de potência de 2.
+Tudo é mesclável entre chunks, então não há uma segunda varredura dos dados.
+
+O resultado é gravado na tabela perfil_dados (save_profiles), que pode ser consultada
+em novas execuções sem recarregar nada no pandas.
+"""
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+# Marcadores de ausência usados pelo TSE: em textos (#NULO, #NE) e nos códigos numéricos (-1, -3)
+SENTINEL_TEXT = ["#NULO", "#NE"]
+SENTINEL_NUMBERS = [-1, -3]
+
+# Contagem de bits de cada byte, para contar zeros à esquerda sem depender de np.bitwise_count
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _bit_length(x):
+    """Número de bits significativos de cada uint64 (vetorizado)"""
+    x = x.copy()
+    for shift in (1, 2, 4, 8, 16, 32):
+        x |= x >> np.uint64(shift)
+    return _POPCOUNT8[x.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int64)
+
+
+class HyperLogLog:
+    """Contador aproximado de distintos (erro ~1.04/sqrt(2^p)); mesclável entre chunks"""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, values):
+        """Adiciona uma Series (nulos ignorados)"""
+        values = values.dropna()
+        if values.empty:
+            return
+        # Normaliza inteiros de larguras diferentes (os chunks podem ter sido reduzidos a tipos distintos)
+        if pd.api.types.is_integer_dtype(values.dtype):
+            values = values.astype("int64")
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+        # p bits mais altos escolhem o registrador; o restante dá a posição do primeiro bit 1
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Correção para cardinalidades pequenas (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+def _log2_buckets(values):
+    """
+    Faixas de potência de 2 com sinal: 0 para |x| < 1, k para 2^(k-1) <= x < 2^k e -k para negativos.
+    Não dependem do intervalo dos dados, então histogramas de chunks diferentes somam direto.
+    """
+    x = values.to_numpy(dtype=np.float64)
+    magnitude = np.abs(x)
+    k = np.where(magnitude >= 1, np.floor(np.log2(np.maximum(magnitude, 1))) + 1, 0)
+    return pd.Series(np.sign(x) * k).astype(int).value_counts()
+
+
+class ColumnProfile:
+    """Contadores de uma coluna, acumulados chunk a chunk"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.nulls = 0
+        self.sentinels = 0
+        self.minimum = None
+        self.maximum = None
+        self.distinct = HyperLogLog()
+        self.histogram = pd.Series(dtype="int64")
+
+    def update(self, values):
+        self.rows += len(values)
+        self.nulls += int(values.isna().sum())
+        self.distinct.update(values)
+
+        if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            self.sentinels += int(values.isin(SENTINEL_NUMBERS).sum())
+            present = values.dropna()
+            if present.empty:
+                return
+            lo, hi = present.min(), present.max()
+            self.minimum = lo if self.minimum is None else min(self.minimum, lo)
+            self.maximum = hi if self.maximum is None else max(self.maximum, hi)
+            self.histogram = self.histogram.add(_log2_buckets(present), fill_value=0)
+        else:
+            self.sentinels += int(values.isin(SENTINEL_TEXT).sum())
+
+    def merge(self, other):
+        """Soma os contadores de outro perfil da mesma coluna (ex.: vindo de outro processo)"""
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.sentinels += other.sentinels
+        for bound, pick in (("minimum", min), ("maximum", max)):
+            a, b = getattr(self, bound), getattr(other, bound)
+            setattr(self, bound, b if a is None else a if b is None else pick(a, b))
+        self.distinct.merge(other.distinct)
+        self.histogram = self.histogram.add(other.histogram, fill_value=0)
+
+    def to_record(self, table_name):
+        histogram = None
+        if not self.histogram.empty:
+            # Chave = limite inferior da faixa (ex.: "64" -> [64, 128))
+            histogram = {
+                str(int(np.sign(k) * 2 ** (abs(k) - 1)) if k else 0): int(v)
+                for k, v in self.histogram.sort_index().items()
+            }
+        return {
+            "tabela": table_name,
+            "coluna": self.name,
+            "linhas": self.rows,
+            "nulos": self.nulls,
+            "sentinelas": self.sentinels,
+            "minimo": None if self.minimum is None else float(self.minimum),
+            "maximo": None if self.maximum is None else float(self.maximum),
+            "distintos_aprox": self.distinct.count(),
+            "histograma": None if histogram is None else json.dumps(histogram),
+        }
+
+
+class TableProfiler:
+    """Perfil de uma tabela; chame update() com cada chunk/DataFrame carregado"""
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.columns = {}
+
+    def update(self, df):
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnProfile(col)
+            self.columns[col].update(df[col])
+        return df
+
+    def merge(self, other):
+        for col, column in other.columns.items():
+            if col not in self.columns:
+                self.columns[col] = column
+            else:
+                self.columns[col].merge(column)
+        return self
+
+    def to_frame(self):
+        return pd.DataFrame([c.to_record(self.table_name) for c in self.columns.values()])
+
+
+# Perfis coletados nesta execução (os processadores registram aqui; o DatabaseManager grava no banco)
+profiles = {}
+
+
+def profile_dataframe(table_name, df):
+    """Acumula df no perfil da tabela `table_name` (cria o perfil na primeira chamada)"""
+    if table_name not in profiles:
+        profiles[table_name] = TableProfiler(table_name)
+    return profiles[table_name].update(df)
+
+
+def merge_profile(profiler):
+    """Junta ao registro um perfil coletado fora dele (ex.: em um processo de map_elections)"""
+    if profiler is None:
+        return
+    if profiler.table_name not in profiles:
+        profiles[profiler.table_name] = profiler
+    else:
+        profiles[profiler.table_name].merge(profiler)
+
+
+def save_profiles(engine, schema, profilers=None):
+    """Grava os perfis na tabela {schema}.perfil_dados, substituindo as linhas das tabelas perfiladas"""
+    profilers = list(profiles.values() if profilers is None else profilers)
+    if not profilers:
+        return
+    records = [c.to_record(p.table_name) for p in profilers for c in p.columns.values()]
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.perfil_dados (
+            tabela varchar, coluna varchar, linhas bigint, nulos bigint, sentinelas bigint,
+            minimo float8, maximo float8, distintos_aprox bigint, histograma jsonb,
+            atualizado_em timestamptz DEFAULT now(),
+            PRIMARY KEY (tabela, coluna)
+        );
+        """)
+        for p in profilers:
+            conn.exec_driver_sql(f"DELETE FROM {schema}.perfil_dados WHERE tabela = %(tabela)s",
+                                 {"tabela": p.table_name})
+        if records:
+            conn.exec_driver_sql(f"""
+            INSERT INTO {schema}.perfil_dados
+                (tabela, coluna, linhas, nulos, sentinelas, minimo, maximo, distintos_aprox, histograma)
+            VALUES (%(tabela)s, %(coluna)s, %(linhas)s, %(nulos)s, %(sentinelas)s,
+                    %(minimo)s, %(maximo)s, %(distintos_aprox)s, %(histograma)s::jsonb)
+            """, records)
@@ -0,0 +1,155 @@
+import pandas as pd
+from config import ANO, UF, election_suffix
+
+
+def secao_table(schema, eleicao=(ANO, UF)):
+    """resultados_secao de uma eleição: a partição (ano, UF), lida sem tocar nas das demais eleições"""
+    return f"{schema}.resultados_secao_{election_suffix(*eleicao)}"
+
+
+def votos_candidato_sql(schema):
+    """% de votos de um candidato ($1 = nm_votavel) em cada município, a partir dos agregados municipais"""
+    return f"""
+    SELECT 
+        t.cd_municipio,
+        (COALESCE(c.votos_cand, 0) * 100.0 / NULLIF(t.total_votos, 0))::float8 as pct_votos
+    FROM {schema}.total_votos_mun t
+    LEFT JOIN (
+        SELECT cd_municipio, SUM(qt_votos) as votos_cand
+        FROM {schema}.votos_mun
+        WHERE nm_votavel = $1
+        GROUP BY 1
+    ) c ON c.cd_municipio = t.cd_municipio
+    """
+
+
+def read_streamed(db, sql, params=None, geom_col=None):
+    """
+    Resultado de `sql` montado com os blocos de db.stream_query (cursor no servidor): o driver
+    guarda um bloco de STREAM_FETCH_SIZE linhas por vez, não o resultado inteiro mais a cópia
+    no DataFrame. Com `geom_col`, retorna um GeoDataFrame.
+    """
+    chunks = list(db.stream_query(sql, params, geom_col=geom_col))
+    if not chunks:
+        import geopandas as gpd
+        return gpd.GeoDataFrame() if geom_col else pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+
+# Colunas da atributos_mun, com os mesmos tipos no Postgres e no DuckDB
+ATRIBUTOS_MUN_COLUMNS = {
+    "id_municipio": "integer PRIMARY KEY",
+    "cd_mun_tse": "integer",
+    "populacao": "integer",
+    "domicilios": "integer",
+    "area": "integer",
+    "taxa_alfabetizacao": "double precision",
+    "idade_mediana": "integer",
+    "razao_sexo": "double precision",
+    "indice_envelhecimento": "double precision",
+    "remuneracao_media": "double precision",
+    "ibc": "double precision",
+    "cobertura_pop_4g5g": "double precision",
+    "fibra": "integer",
+    "densidade_smp": "double precision",
+    "densidade_scm": "double precision",
+    "adensamento_estacoes": "double precision",
+    "versao": "timestamptz NOT NULL",
+}
+
+
+def atributos_mun_sql(schema, table, censo_mun="censo_mun", rais_agg="rais_agg", extra="extra",
+                      mapa="mapa_municipio"):
+    """
+    Recria `table` com uma linha por município (código IBGE): Censo, RAIS já agregada,
+    conectividade (ano mais recente da extra) e o código TSE de `mapa` (cd_mun_tse, cd_mun_ibge).
+    versao marca a construção; atributos_municipais a usa para invalidar o cache.
+    """
+    columns = ",\n        ".join(f"{name} {type_}" for name, type_ in ATRIBUTOS_MUN_COLUMNS.items())
+    return f"""
+    DROP TABLE IF EXISTS {schema}.{table};
+    CREATE TABLE {schema}.{table} (
+        {columns}
+    );
+    INSERT INTO {schema}.{table} ({", ".join(ATRIBUTOS_MUN_COLUMNS)})
+    SELECT
+        c.id_municipio, m.cd_mun_tse,
+        c.populacao, c.domicilios, c.area, c.taxa_alfabetizacao, c.idade_mediana,
+        c.razao_sexo, c.indice_envelhecimento,
+        r.remuneracao_media,
+        e.ibc, e.cobertura_pop_4g5g, e.fibra, e.densidade_smp, e.densidade_scm, e.adensamento_estacoes,
+        now()
+    FROM {schema}.{censo_mun} c
+    LEFT JOIN (
+        SELECT cd_mun_ibge, MIN(cd_mun_tse) AS cd_mun_tse FROM {schema}.{mapa} GROUP BY 1
+    ) m ON m.cd_mun_ibge = c.id_municipio
+    LEFT JOIN {schema}.{rais_agg} r ON r.id_municipio = c.id_municipio
+    LEFT JOIN (
+        SELECT DISTINCT ON (id_municipio) * FROM {schema}.{extra} ORDER BY id_municipio, ano DESC
+    ) e ON e.id_municipio = c.id_municipio;
+    """
+
+
+# atributos_mun já lida neste processo: (backend, schema) -> (versao, DataFrame)
+_ATRIBUTOS_CACHE = {}
+
+
+def atributos_municipais(db):
+    """
+    atributos_mun como DataFrame, guardado em memória: cada chamada só consulta a versão,
+    e a tabela é relida quando uma nova carga a reconstrói. Retorna uma cópia.
+    """
+    key = (db.backend, db.schema)
+    versao = db.scalar(f"SELECT CAST(MAX(versao) AS varchar) FROM {db.schema}.atributos_mun")
+    cached = _ATRIBUTOS_CACHE.get(key)
+    if cached is None or cached[0] != versao:
+        cached = (versao, db.read_sql(f"SELECT * FROM {db.schema}.atributos_mun"))
+        _ATRIBUTOS_CACHE[key] = cached
+    return cached[1].copy()
+
+
+class PreparedQuery:
+    """
+    Consulta preparada no servidor (PREPARE/EXECUTE) com parâmetros vinculados.
+    O Postgres planeja a consulta uma vez por conexão e reaproveita o plano
+    a cada execução, em vez de replanejar um SQL diferente para cada candidato.
+    """
+
+    def __init__(self, conn, name, sql, arg_types):
+        # sql usa $1, $2, ... como placeholders (sintaxe do PREPARE)
+        self.conn = conn
+        self.name = name
+        self.sql = sql
+        self.arg_types = arg_types
+        self.prepared = False
+
+    def prepare(self):
+        if self.prepared:
+            return
+        with self.conn.cursor() as cur:
+            cur.execute(f"PREPARE {self.name} ({', '.join(self.arg_types)}) AS {self.sql}")
+        self.conn.commit()
+        self.prepared = True
+
+    def execute(self, *args):
+        """Executa a consulta preparada e retorna um DataFrame"""
+        self.prepare()
+        placeholders = ", ".join(["%s"] * len(args))
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"EXECUTE {self.name} ({placeholders})", args)
+                columns = [desc[0] for desc in cur.description]
+                rows = cur.fetchall()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+    def deallocate(self):
+        if not self.prepared:
+            return
+        with self.conn.cursor() as cur:
+            cur.execute(f"DEALLOCATE {self.name}")
+        self.conn.commit()
+        self.prepared = False
@@ -0,0 +1,155 @@
+"""
+Estatísticas espaciais calculadas dentro do Postgres.
+
+Usam a tabela de vizinhança persistida (vizinhos, ver DatabaseManager.build_neighbor_tables)
+com pesos padronizados por linha, como Queen.from_dataframe + w.transform = 'r'.
+Só o resultado (I, p-valor, z) trafega pela rede; as geometrias ficam no banco.
+
+As consultas de valores recebidas aqui devem retornar as colunas (id, valor)
+— ou (grupo, id, valor) no modo em lote — e podem usar parâmetros %(nome)s.
+"""
+import math
+import pandas as pd
+
+
+def _weights_cte(schema):
+    # Pesos w_ij = 1 / grau(i), restritos às unidades presentes nos valores (como o gdf limpo no Python)
+    return f"""
+    w AS (
+        SELECT n.cd_origem AS i, n.cd_vizinho AS j,
+               1.0 / COUNT(*) OVER (PARTITION BY n.cd_origem) AS w
+        FROM {schema}.vizinhos n
+        JOIN ids a ON a.id = n.cd_origem
+        JOIN ids b ON b.id = n.cd_vizinho
+        WHERE n.nivel = %(nivel)s
+    )"""
+
+
+def moran_global(db, values_sql, params=None, nivel="mun", permutations=999, seed=None):
+    """
+    I de Moran global de uma única variável, com teste de permutação feito no banco.
+    Retorna dict com I, EI, p_sim, z_sim e n (mesma semântica do esda.moran.Moran).
+    """
+    params = dict(params or {})
+    params.update({"nivel": nivel, "permutations": int(permutations)})
+
+    query = f"""
+    WITH v AS ({values_sql}),
+    ids AS (SELECT DISTINCT id FROM v WHERE valor IS NOT NULL),
+    z AS (
+        SELECT v.id, v.valor - AVG(v.valor) OVER () AS z
+        FROM v JOIN ids USING (id)
+    ),
+    {_weights_cte(db.schema)},
+    stats AS (
+        SELECT COUNT(*)::float8 AS n, SUM(z * z) AS m2 FROM z
+    ),
+    s0 AS (SELECT COUNT(DISTINCT i)::float8 AS s0 FROM w),
+    observado AS (
+        SELECT SUM(w.w * zi.z * zj.z) AS num
+        FROM w JOIN z zi ON zi.id = w.i JOIN z zj ON zj.id = w.j
+    ),
+    -- Permutações: embaralha os valores entre as unidades, mantendo a vizinhança fixa
+    posicoes AS (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS rn FROM z),
+    embaralhado AS (
+        SELECT p.p, ROW_NUMBER() OVER (PARTITION BY p.p ORDER BY random()) AS rn, z.z
+        FROM generate_series(1, %(permutations)s) AS p(p) CROSS JOIN z
+    ),
+    perm_z AS (
+        SELECT e.p, pos.id, e.z FROM embaralhado e JOIN posicoes pos USING (rn)
+    ),
+    perm AS (
+        SELECT zi.p, SUM(w.w * zi.z * zj.z) AS num
+        FROM w
+        JOIN perm_z zi ON zi.id = w.i
+        JOIN perm_z zj ON zj.id = w.j AND zj.p = zi.p
+        GROUP BY zi.p
+    )
+    SELECT
+        stats.n,
+        stats.n / s0.s0 * observado.num / stats.m2 AS i,
+        (SELECT COUNT(*) FROM perm WHERE stats.n / s0.s0 * perm.num / stats.m2 >= stats.n / s0.s0 * observado.num / stats.m2) AS maiores,
+        (SELECT AVG(stats.n / s0.s0 * perm.num / stats.m2) FROM perm) AS media_sim,
+        (SELECT STDDEV_POP(stats.n / s0.s0 * perm.num / stats.m2) FROM perm) AS desvio_sim
+    FROM stats, s0, observado
+    """
+
+    with db.engine.connect() as conn:
+        if seed is not None:
+            conn.exec_driver_sql("SELECT setseed(%(seed)s)", {"seed": float(seed)})
+        row = conn.exec_driver_sql(query, params).mappings().first()
+
+    n = row["n"] or 0
+    if not n or row["i"] is None:
+        return None
+    I = float(row["i"])
+    result = {"I": I, "EI": -1.0 / (n - 1), "n": int(n), "p_sim": None, "z_sim": None}
+    if permutations:
+        # Mesma regra do esda: usa a cauda menor
+        larger = int(row["maiores"])
+        if permutations - larger < larger:
+            larger = permutations - larger
+        result["p_sim"] = (larger + 1.0) / (permutations + 1.0)
+        if row["desvio_sim"]:
+            result["z_sim"] = (I - float(row["media_sim"])) / float(row["desvio_sim"])
+    return result
+
+
+def moran_global_batch(db, values_sql, params=None, nivel="mun"):
+    """
+    I de Moran global para muitos grupos (ex.: todos os candidatos) em uma única consulta.
+    values_sql deve retornar (grupo, id, valor) com todas as unidades em cada grupo.
+    A inferência é analítica (hipótese de normalidade, como Moran.z_norm/p_norm do esda).
+    """
+    params = dict(params or {})
+    params["nivel"] = nivel
+
+    query = f"""
+    WITH v AS ({values_sql}),
+    ids AS (SELECT DISTINCT id FROM v WHERE valor IS NOT NULL),
+    z AS (
+        SELECT v.grupo, v.id, v.valor - AVG(v.valor) OVER (PARTITION BY v.grupo) AS z
+        FROM v JOIN ids USING (id)
+        WHERE v.valor IS NOT NULL
+    ),
+    {_weights_cte(db.schema)},
+    stats AS (
+        SELECT grupo, COUNT(*)::float8 AS n, SUM(z * z) AS m2 FROM z GROUP BY grupo
+    ),
+    num AS (
+        SELECT zi.grupo, SUM(w.w * zi.z * zj.z) AS num
+        FROM w
+        JOIN z zi ON zi.id = w.i
+        JOIN z zj ON zj.id = w.j AND zj.grupo = zi.grupo
+        GROUP BY zi.grupo
+    ),
+    -- Constantes da matriz de pesos (S0, S1, S2) para a variância sob normalidade
+    wstats AS (
+        SELECT COUNT(DISTINCT w1.i)::float8 AS s0,
+               0.5 * SUM((w1.w + w2.w) ^ 2) AS s1
+        FROM w w1 JOIN w w2 ON w2.i = w1.j AND w2.j = w1.i
+    ),
+    s2 AS (
+        SELECT SUM((COALESCE(r.soma, 0) + COALESCE(c.soma, 0)) ^ 2) AS s2
+        FROM ids
+        LEFT JOIN (SELECT i, SUM(w) AS soma FROM w GROUP BY i) r ON r.i = ids.id
+        LEFT JOIN (SELECT j, SUM(w) AS soma FROM w GROUP BY j) c ON c.j = ids.id
+    )
+    SELECT stats.grupo, stats.n, wstats.s0, wstats.s1, s2.s2,
+           CASE WHEN stats.m2 > 0 THEN stats.n / wstats.s0 * COALESCE(num.num, 0) / stats.m2 END AS i
+    FROM stats
+    LEFT JOIN num ON num.grupo = stats.grupo
+    CROSS JOIN wstats CROSS JOIN s2
+    """
+    df = db.read_frame(query, params)
+    if df.empty:
+        return df
+
+    n = df["n"].astype(float)
+    s0, s1, s2 = df["s0"].astype(float), df["s1"].astype(float), df["s2"].astype(float)
+    df["EI"] = -1.0 / (n - 1)
+    vi = (n * n * s1 - n * s2 + 3 * s0 * s0) / ((n * n - 1) * s0 * s0) - df["EI"] ** 2
+    df["z_norm"] = (df["i"] - df["EI"]) / vi.pow(0.5)
+    # p-valor bicaudal, como em esda (2 * (1 - Φ(|z|)))
+    df["p_norm"] = df["z_norm"].abs().map(lambda z: math.erfc(z / math.sqrt(2)) if pd.notna(z) else None)
+    return df.rename(columns={"i": "I"})[["grupo", "n", "I", "EI", "z_norm", "p_norm"]]
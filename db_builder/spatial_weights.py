@@ -0,0 +1,189 @@
+"""
+Pesos espaciais por distância (KNN e banda de distância) para pontos e centroides.
+
+Queen.from_dataframe só vale para polígonos e compara geometrias par a par; aqui as
+vizinhanças saem de um KD-tree (scipy.spatial.cKDTree) sobre coordenadas projetadas
+em metros (METRIC_CRS). As consultas ao KD-tree são feitas em blocos de pontos, em
+threads (o cKDTree libera o GIL), e o resultado é uma matriz esparsa CSR (n x n).
+
+As matrizes são gravadas em .npz na pasta WEIGHTS_DIR, com nome derivado das
+coordenadas e dos parâmetros: a mesma malha com os mesmos parâmetros não é recalculada.
+weights_from_frame entrega um libpysal W padronizado por linha, usado pelo Moran
+(metrics_analysis.py) e pelo diagnóstico dos resíduos do GWR (extra_analysis.py).
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from config import (WEIGHTS_DIR, SPATIAL_WEIGHTS, WEIGHTS_K, WEIGHTS_THRESHOLD, WEIGHTS_WORKERS,
+                    WEIGHTS_CHUNK, METRIC_CRS)
+
+
+def _chunks(n, size):
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+def _map_chunks(fn, n, workers=WEIGHTS_WORKERS, chunk_size=WEIGHTS_CHUNK):
+    """fn(start, stop) para cada bloco de linhas, em paralelo; resultados na ordem dos blocos"""
+    chunks = _chunks(n, chunk_size)
+    if workers <= 1 or len(chunks) == 1:
+        return [fn(start, stop) for start, stop in chunks]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda c: fn(*c), chunks))
+
+
+def knn_weights(coords, k=WEIGHTS_K, workers=WEIGHTS_WORKERS, chunk_size=WEIGHTS_CHUNK):
+    """Matriz CSR binária dos k vizinhos mais próximos de cada ponto (sem o próprio ponto)"""
+    coords = np.asarray(coords, dtype=np.float64)
+    n = len(coords)
+    k = min(k, n - 1)
+    tree = cKDTree(coords)
+
+    def query(start, stop):
+        # k + 1: o próprio ponto volta na consulta (com pontos coincidentes, não necessariamente em primeiro)
+        _, idx = tree.query(coords[start:stop], k=k + 1)
+        keep = idx != np.arange(start, stop)[:, None]
+        # Se o próprio ponto não voltou (mais de k pontos coincidentes), descarta o mais distante
+        keep[keep.all(axis=1), -1] = False
+        return idx[keep].reshape(-1, k)
+
+    indices = np.concatenate(_map_chunks(query, n, workers, chunk_size)).ravel()
+    indptr = np.arange(0, n * k + 1, k)
+    return sparse.csr_matrix((np.ones(n * k), indices, indptr), shape=(n, n))
+
+
+def distance_band_weights(coords, threshold=WEIGHTS_THRESHOLD, binary=True, alpha=-1.0,
+                          workers=WEIGHTS_WORKERS, chunk_size=WEIGHTS_CHUNK):
+    """
+    Matriz CSR dos pares a até `threshold` (unidades das coordenadas) de distância.
+    binary=False usa pesos distância ** alpha (inverso da distância com alpha=-1).
+    Pontos sem vizinhos na banda ficam como ilhas (linha vazia).
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    n = len(coords)
+    tree = cKDTree(coords)
+
+    def query(start, stop):
+        pairs = cKDTree(coords[start:stop]).sparse_distance_matrix(tree, threshold, output_type="ndarray")
+        rows = pairs["i"] + start
+        other = rows != pairs["j"]
+        return rows[other], pairs["j"][other], pairs["v"][other]
+
+    parts = _map_chunks(query, n, workers, chunk_size)
+    rows, cols, dist = (np.concatenate(p) for p in zip(*parts))
+    if binary:
+        data = np.ones(len(dist))
+    else:
+        # Pontos coincidentes (distância 0) recebem o peso do menor par não nulo
+        positive = dist[dist > 0]
+        data = np.maximum(dist, positive.min() if len(positive) else 1.0) ** alpha
+    return sparse.csr_matrix((data, (rows, cols)), shape=(n, n))
+
+
+def row_standardize(W):
+    """Divide cada linha pela sua soma (ilhas continuam com linha vazia), como w.transform = 'r'"""
+    sums = np.asarray(W.sum(axis=1)).ravel()
+    scale = np.divide(1.0, sums, out=np.zeros_like(sums), where=sums > 0)
+    return sparse.diags(scale) @ W
+
+
+def save_weights(path, W, ids, meta=None):
+    """Grava a matriz CSR, a ordem dos ids e os parâmetros em um .npz"""
+    W = W.tocsr()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(path, data=W.data, indices=W.indices, indptr=W.indptr, shape=np.array(W.shape),
+                        ids=np.asarray(ids), meta=json.dumps(meta or {}))
+
+
+def load_weights(path):
+    """Lê um .npz de save_weights; retorna (matriz CSR, ids, parâmetros)"""
+    with np.load(path, allow_pickle=False) as f:
+        W = sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+        return W, f["ids"], json.loads(str(f["meta"]))
+
+
+def _cache_path(kind, coords, ids, params):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+    digest.update(np.asarray(ids).astype(str).tobytes())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    label = "_".join(f"{k}{v}" for k, v in sorted(params.items()))
+    return os.path.join(WEIGHTS_DIR, f"{kind}_{label}_{digest.hexdigest()[:12]}.npz")
+
+
+def cached_weights(kind, coords, ids, **params):
+    """
+    Matriz CSR de `kind` ("knn" ou "distance") para os pontos `coords`, lida de WEIGHTS_DIR
+    se já foi calculada para as mesmas coordenadas, ids e parâmetros.
+    """
+    builders = {"knn": knn_weights, "distance": distance_band_weights}
+    path = _cache_path(kind, coords, ids, params)
+    if os.path.exists(path):
+        W, _, _ = load_weights(path)
+        return W
+    W = builders[kind](coords, **params)
+    save_weights(path, W, ids, {"kind": kind, **params})
+    return W
+
+
+def to_libpysal(W, ids=None):
+    """Converte a matriz CSR em libpysal W (para esda.Moran, Moran_BV, splot)"""
+    from libpysal.weights import WSP
+    ids = list(range(W.shape[0])) if ids is None else list(ids)
+    return WSP(W.tocsr(), id_order=ids).to_W(silence_warnings=True)
+
+
+def metric_coords(gdf):
+    """Coordenadas (x, y) em metros dos centroides (ou dos próprios pontos) de gdf"""
+    geometry = gdf.geometry
+    if geometry.crs is not None and geometry.crs.is_geographic:
+        geometry = geometry.to_crs(METRIC_CRS)
+    points = geometry if (geometry.geom_type == "Point").all() else geometry.centroid
+    return np.column_stack([points.x.to_numpy(), points.y.to_numpy()])
+
+
+def _check_kind(kind, params):
+    if kind == "knn":
+        params.setdefault("k", WEIGHTS_K)
+    elif kind == "distance":
+        params.setdefault("threshold", WEIGHTS_THRESHOLD)
+    elif kind != "queen":
+        raise ValueError(f"Tipo de pesos desconhecido: {kind} (use queen, knn ou distance)")
+
+
+def _queen(gdf):
+    from libpysal.weights.contiguity import Queen
+    return Queen.from_dataframe(gdf, use_index=False, silence_warnings=True)
+
+
+def binary_weights(gdf, kind=SPATIAL_WEIGHTS, ids=None, **params):
+    """
+    Matriz CSR binária (1 = vizinho) para as linhas de gdf, na mesma ordem, sem padronizar.
+    Mesmos tipos de weights_from_frame; "knn" e "distance" saem do cache em disco.
+    """
+    _check_kind(kind, params)
+    if kind == "queen":
+        W = _queen(gdf).sparse.tocsr()
+        W.data[:] = 1.0
+        return W
+    ids = np.arange(len(gdf)) if ids is None else ids
+    return cached_weights(kind, metric_coords(gdf), ids, **params)
+
+
+def weights_from_frame(gdf, kind=SPATIAL_WEIGHTS, ids=None, **params):
+    """
+    Matriz de pesos padronizada por linha (libpysal W) para as linhas de gdf, na mesma ordem.
+    kind="queen" mantém a contiguidade de polígonos; "knn" e "distance" usam o KD-tree
+    sobre os centroides, com cache em disco.
+    """
+    _check_kind(kind, params)
+    if kind == "queen":
+        w = _queen(gdf)
+        w.transform = 'r'
+        return w
+    return to_libpysal(row_standardize(binary_weights(gdf, kind, ids, **params)))
@@ -0,0 +1,143 @@
+"""
+Troca atômica de tabelas (blue/green).
+
+As cargas constroem cada tabela com o sufixo STAGING_SUFFIX (ex.: votos_mun__novo),
+criam os índices depois dos dados e rodam ANALYZE; swap_tables então põe todas no
+lugar das antigas em uma única transação. Quem lê as tabelas durante a reconstrução
+continua vendo a versão anterior, completa, até o commit da troca.
+
+Sem imports do pacote (como profiling.py), para ser usado também pelo carregar_banco.py.
+"""
+import time
+
+STAGING_SUFFIX = "__novo"
+OLD_SUFFIX = "__antigo"
+
+# SQLSTATE de lock_timeout estourado (lock_not_available)
+_LOCK_NOT_AVAILABLE = "55P03"
+
+
+def staging_name(table):
+    return f"{table}{STAGING_SUFFIX}"
+
+
+def _staged_name(relname, table):
+    """Nome definitivo de uma partição ou índice da versão de staging de `table` (None se não tiver o sufixo)"""
+    if staging_name(table) in relname:
+        return relname.replace(staging_name(table), table, 1)
+    if STAGING_SUFFIX in relname:
+        return relname.replace(STAGING_SUFFIX, "", 1)
+    return None
+
+
+def _relations(cur, schema, table):
+    """
+    Partições (em todos os níveis) e índices de `table` e das partições, pelo catálogo:
+    inclui índices com nomes dados por terceiros (ex.: idx_<tabela>__novo_geometry do GeoAlchemy).
+    """
+    cur.execute("""
+        WITH RECURSIVE arvore AS (
+            SELECT %(table)s::regclass::oid AS oid
+            UNION ALL
+            SELECT i.inhrelid FROM pg_inherits i JOIN arvore a ON i.inhparent = a.oid
+        )
+        SELECT c.relname, 'TABLE' FROM arvore a JOIN pg_class c ON c.oid = a.oid
+        WHERE a.oid <> %(table)s::regclass::oid
+        UNION ALL
+        SELECT c.relname, 'INDEX' FROM arvore a
+        JOIN pg_index x ON x.indrelid = a.oid
+        JOIN pg_class c ON c.oid = x.indexrelid
+    """, {"table": f'"{schema}"."{table}"'})
+    return cur.fetchall()
+
+
+def _swap(cur, schema, tables):
+    for table in tables:
+        cur.execute(f"""
+        DROP TABLE IF EXISTS {schema}.{table}{OLD_SUFFIX};
+        ALTER TABLE IF EXISTS {schema}.{table} RENAME TO {table}{OLD_SUFFIX};
+        ALTER TABLE {schema}.{staging_name(table)} RENAME TO {table};
+        """)
+    # Sai a versão antiga (com partições e índices), liberando os nomes para o passo seguinte
+    for table in tables:
+        cur.execute(f"DROP TABLE IF EXISTS {schema}.{table}{OLD_SUFFIX}")
+
+    # Índices, chaves e partições da versão nova ainda carregam o sufixo no nome
+    for table in tables:
+        for relname, kind in _relations(cur, schema, table):
+            new_name = _staged_name(relname, table)
+            if new_name is not None:
+                cur.execute(f'ALTER {kind} {schema}."{relname}" RENAME TO "{new_name}"')
+
+
+def _geometry_type(geometry):
+    """Tipo da coluna: o único tipo presente, ou GEOMETRY se houver mais de um (ex.: Polygon e MultiPolygon)"""
+    types = geometry.geom_type.dropna().unique()
+    return types[0].upper() if len(types) == 1 else "GEOMETRY"
+
+
+def write_geo_table(gdf, table, engine, schema="public"):
+    """
+    Grava gdf em `table` (substituindo), como GeoDataFrame.to_postgis, mas sem o índice espacial
+    que o GeoAlchemy cria junto com a tabela: o GIST ({table}_<geometria>_gist) é criado depois
+    dos dados. As geometrias vão em EWKB hexadecimal por COPY.
+    """
+    import csv
+    import io
+    import numpy as np
+    import pandas as pd
+    import shapely
+    from geoalchemy2 import Geometry
+
+    geom = gdf.geometry.name
+    srid = (gdf.crs.to_epsg() or 0) if gdf.crs is not None else 0
+    df = pd.DataFrame(gdf)
+    df[geom] = shapely.to_wkb(shapely.set_srid(np.asarray(gdf.geometry.values), srid), hex=True, include_srid=True)
+
+    def copy(sql_table, conn, keys, data_iter):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(data_iter)
+        buffer.seek(0)
+        columns = ", ".join(f'"{k}"' for k in keys)
+        sql = f'COPY {schema}."{table}" ({columns}) FROM STDIN WITH CSV'
+        with conn.connection.cursor() as cur:
+            if hasattr(cur, "copy_expert"):  # psycopg2
+                cur.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with cur.copy(sql) as out:
+                    out.write(buffer.getvalue())
+
+    dtype = {geom: Geometry(_geometry_type(gdf.geometry), srid=srid, spatial_index=False)}
+    df.to_sql(table, engine, schema=schema, if_exists="replace", index=False, dtype=dtype, method=copy)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"""
+        CREATE INDEX "{table}_{geom.lower()}_gist" ON {schema}."{table}" USING GIST ("{geom}");
+        ANALYZE {schema}."{table}";
+        """)
+
+
+def swap_tables(conn, schema, tables, lock_timeout="5s", retries=3):
+    """
+    Substitui cada tabela de `tables` pela sua versão de staging, tudo em uma transação
+    da conexão DB-API `conn`. Com lock_timeout a troca não fica na fila atrás de uma leitura
+    longa (o que bloquearia as leituras seguintes); em caso de timeout, tenta de novo.
+    """
+    tables = list(tables)
+    if not tables:
+        return
+    for attempt in range(retries):
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+            _swap(cur, schema, tables)
+            conn.commit()
+            return
+        except Exception as e:
+            conn.rollback()
+            code = getattr(e, "pgcode", None) or getattr(e, "sqlstate", None)
+            if code != _LOCK_NOT_AVAILABLE or attempt == retries - 1:
+                raise
+            print(f"   Troca de tabelas aguardando leituras em andamento (tentativa {attempt + 1})...")
+            time.sleep(1)
+        finally:
+            cur.close()
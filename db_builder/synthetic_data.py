@@ -0,0 +1,363 @@
+"""
+Gerador de dados sintéticos com os mesmos esquemas dos arquivos reais
+(votacao_secao do TSE, RAIS, censo município/setor, conectividade, malha do IBGE).
+
+Permite rodar o pipeline e os benchmarks sem os extratos reais.
+Com scale=1.0 o volume é da ordem do Paraná em 2022
+(~26 mil seções, ~7 milhões de linhas de votação, ~3,5 milhões de vínculos RAIS).
+"""
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+
+# Extensão aproximada do Paraná (SIRGAS 2000, lon/lat)
+PR_BOUNDS = (-54.6, -26.7, -48.0, -22.5)
+
+# Volumes do Paraná (scale=1.0)
+SECOES_POR_MUNICIPIO = 65
+SETORES_POR_MUNICIPIO = 60
+VINCULOS_RAIS = 3_500_000
+
+# Cargos: (código, descrição, número de candidatos, candidatos com voto por seção, dígitos do número)
+CARGOS = [
+    (1, "PRESIDENTE", 11, 11, 2),
+    (3, "GOVERNADOR", 10, 10, 2),
+    (5, "SENADOR", 10, 10, 3),
+    (6, "DEPUTADO FEDERAL", 600, 100, 4),
+    (7, "DEPUTADO ESTADUAL", 900, 150, 5),
+]
+
+PARTIDOS = [10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 22, 23, 25, 27,
+            28, 29, 30, 33, 35, 36, 40, 43, 44, 45, 50, 55, 65, 70, 77, 80, 90]
+
+VOTACAO_COLUMNS = [
+    "DT_GERACAO", "HH_GERACAO", "ANO_ELEICAO", "CD_TIPO_ELEICAO", "NM_TIPO_ELEICAO",
+    "NR_TURNO", "CD_ELEICAO", "DS_ELEICAO", "DT_ELEICAO", "TP_ABRANGENCIA", "SG_UF",
+    "SG_UE", "NM_UE", "CD_MUNICIPIO", "NM_MUNICIPIO", "NR_ZONA", "NR_SECAO", "CD_CARGO",
+    "DS_CARGO", "NR_VOTAVEL", "NM_VOTAVEL", "QT_VOTOS", "NR_LOCAL_VOTACAO",
+    "SQ_CANDIDATO", "NM_LOCAL_VOTACAO", "DS_LOCAL_VOTACAO_ENDERECO",
+]
+
+
+def _grid(n_municipios):
+    """Divide a extensão do estado em uma grade quase quadrada de células (uma por município)"""
+    minx, miny, maxx, maxy = PR_BOUNDS
+    nx = int(np.ceil(np.sqrt(n_municipios * (maxx - minx) / (maxy - miny))))
+    ny = int(np.ceil(n_municipios / nx))
+    dx, dy = (maxx - minx) / nx, (maxy - miny) / ny
+    idx = np.arange(n_municipios)
+    ix, iy = idx % nx, idx // nx
+    return ix, iy, nx, ny, dx, dy
+
+
+def build_municipios(n_municipios=399, seed=0):
+    """Tabela base de municípios: códigos TSE/IBGE, regiões e centroides"""
+    rng = np.random.default_rng(seed)
+    ix, iy, nx, ny, dx, dy = _grid(n_municipios)
+    minx, miny, _, _ = PR_BOUNDS
+
+    # Regiões contíguas: blocos de 4x4 células (imediatas) e 12x12 (intermediárias)
+    rgi_key = (iy // 4) * ((nx + 3) // 4) + (ix // 4)
+    rgint_key = (iy // 12) * ((nx + 11) // 12) + (ix // 12)
+    _, cd_rgi = np.unique(rgi_key, return_inverse=True)
+    _, cd_rgint = np.unique(rgint_key, return_inverse=True)
+
+    mun = pd.DataFrame({
+        "idx": np.arange(n_municipios),
+        "id_municipio_tse": 70000 + np.arange(n_municipios) * 5,
+        "id_municipio_ibge": 4100000 + np.arange(n_municipios) * 7,
+        "nm_municipio": [f"MUNICIPIO {i:04d}" for i in range(n_municipios)],
+        "cd_rgi": 410001 + cd_rgi,
+        "cd_rgint": 4101 + cd_rgint,
+        "minx": minx + ix * dx,
+        "miny": miny + iy * dy,
+        "dx": dx,
+        "dy": dy,
+        # População com cauda longa, como na distribuição real
+        "populacao": np.maximum(1200, rng.lognormal(9.3, 1.1, n_municipios)).astype(np.int64),
+    })
+    mun["cx"] = mun["minx"] + dx / 2
+    mun["cy"] = mun["miny"] + dy / 2
+    return mun
+
+
+def write_shapefile(mun, path):
+    """Malha municipal no layout do IBGE (PR_Municipios_2022.shp)"""
+    geoms = [box(r.minx, r.miny, r.minx + r.dx, r.miny + r.dy) for r in mun.itertuples()]
+    gdf = gpd.GeoDataFrame({
+        "CD_MUN": mun["id_municipio_ibge"].astype(str),
+        "NM_MUN": mun["nm_municipio"].str.title(),
+        "CD_RGI": mun["cd_rgi"].astype(str),
+        "NM_RGI": "RGI " + mun["cd_rgi"].astype(str),
+        "CD_RGINT": mun["cd_rgint"].astype(str),
+        "NM_RGINT": "RGINT " + mun["cd_rgint"].astype(str),
+        "CD_UF": "41",
+        "NM_UF": "Paraná",
+        "SIGLA_UF": "PR",
+        "CD_REGIA": "4",
+        "NM_REGIA": "Sul",
+        "SIGLA_RG": "S",
+        "AREA_KM2": mun["dx"] * mun["dy"] * 111.0 * 102.0,
+    }, geometry=geoms, crs="EPSG:4674")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    gdf.to_file(path, driver="ESRI Shapefile", encoding="utf-8")
+
+
+def _candidatos(rng, mun, n_cand, digitos):
+    """Candidatos de um cargo: número, nome, sequencial e 'base eleitoral' (coordenadas)"""
+    partidos = rng.choice(PARTIDOS, n_cand)
+    if digitos == 2:
+        numeros = rng.choice(PARTIDOS, n_cand, replace=False)
+    else:
+        sufixo = np.arange(n_cand) % (10 ** (digitos - 2) - 1) + 1
+        numeros = partidos * 10 ** (digitos - 2) + sufixo
+        numeros = pd.unique(numeros)
+    base = rng.integers(0, len(mun), len(numeros))
+    return pd.DataFrame({
+        "nr_votavel": numeros,
+        "nm_votavel": [f"CANDIDATO {digitos}D {n}" for n in numeros],
+        "sq_candidato": 160001600000 + rng.integers(0, 10**6, len(numeros)),
+        "cx": mun["cx"].values[base],
+        "cy": mun["cy"].values[base],
+        # Alcance: poucos candidatos "amplos", a maioria regional
+        "alcance": rng.choice([0.3, 0.8, 3.0], len(numeros), p=[0.6, 0.3, 0.1]),
+        "forca": rng.pareto(1.5, len(numeros)) + 0.1,
+    })
+
+
+def build_secoes(mun, scale=1.0, seed=0):
+    """Seções eleitorais com zona, local de votação e coordenadas"""
+    rng = np.random.default_rng(seed + 1)
+    peso = mun["populacao"] / mun["populacao"].mean()
+    n_secoes = np.maximum(1, np.round(SECOES_POR_MUNICIPIO * scale * peso)).astype(int)
+    mun_idx = np.repeat(mun["idx"].values, n_secoes)
+    sec = pd.DataFrame({"mun_idx": mun_idx})
+    sec["CD_MUNICIPIO"] = mun["id_municipio_tse"].values[mun_idx]
+    sec["NM_MUNICIPIO"] = mun["nm_municipio"].values[mun_idx]
+    sec["NR_ZONA"] = 1 + mun_idx // 2
+    sec["NR_SECAO"] = sec.groupby("NR_ZONA").cumcount() + 1
+    sec["NR_LOCAL_VOTACAO"] = 1000 + sec.groupby("mun_idx").cumcount() // 5 * 10
+    sec["NM_LOCAL_VOTACAO"] = "ESCOLA ESTADUAL " + sec["NR_LOCAL_VOTACAO"].astype(str)
+    sec["DS_LOCAL_VOTACAO_ENDERECO"] = "RUA " + sec["NR_LOCAL_VOTACAO"].astype(str) + ", CENTRO"
+    sec["x"] = mun["minx"].values[mun_idx] + rng.random(len(sec)) * mun["dx"].values[mun_idx]
+    sec["y"] = mun["miny"].values[mun_idx] + rng.random(len(sec)) * mun["dy"].values[mun_idx]
+    return sec
+
+
+def write_votacao(mun, path, scale=1.0, seed=0, chunk_secoes=2000):
+    """votacao_secao_<ano>_<UF>.csv no layout do TSE (latin1, ';', valores entre aspas)"""
+    rng = np.random.default_rng(seed + 2)
+    sec = build_secoes(mun, scale, seed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    fixed = {
+        "DT_GERACAO": "01/12/2022", "HH_GERACAO": "10:00:00", "ANO_ELEICAO": 2022,
+        "CD_TIPO_ELEICAO": 2, "NM_TIPO_ELEICAO": "Eleição Ordinária", "NR_TURNO": 1,
+        "CD_ELEICAO": 546, "DS_ELEICAO": "Eleições Gerais Estaduais 2022",
+        "DT_ELEICAO": "02/10/2022", "TP_ABRANGENCIA": "E", "SG_UF": "PR",
+        "SG_UE": "PR", "NM_UE": "PARANÁ",
+    }
+
+    n_rows = 0
+    first = True
+    for cd_cargo, ds_cargo, n_cand, k, digitos in CARGOS:
+        cand = _candidatos(rng, mun, n_cand, digitos)
+        # Votos de legenda, brancos e nulos entram como "votáveis" com sequencial -1
+        especiais = pd.DataFrame({
+            "nr_votavel": [95, 96] + ([] if digitos == 2 else PARTIDOS[:10]),
+            "nm_votavel": ["VOTO BRANCO", "VOTO NULO"] + ([] if digitos == 2 else [f"PARTIDO {p}" for p in PARTIDOS[:10]]),
+        })
+        k = min(k, len(cand))
+
+        for start in range(0, len(sec), chunk_secoes):
+            s = sec.iloc[start:start + chunk_secoes]
+            # Intensidade do candidato em cada seção: decai com a distância da base eleitoral
+            d = np.hypot(s["x"].values[:, None] - cand["cx"].values[None, :],
+                         s["y"].values[:, None] - cand["cy"].values[None, :])
+            intensidade = cand["forca"].values[None, :] * np.exp(-d / cand["alcance"].values[None, :])
+            # Top-k por seção (truque de Gumbel): candidatos distintos, favorecendo os mais fortes
+            chaves = np.log(intensidade + 1e-12) + rng.gumbel(size=intensidade.shape)
+            escolhidos = np.argpartition(-chaves, k - 1, axis=1)[:, :k]
+            lam = np.take_along_axis(intensidade, escolhidos, axis=1)
+            votos = 1 + rng.poisson(20 * lam / lam.sum(axis=1, keepdims=True) * k / 10)
+
+            rows = pd.DataFrame({
+                "sec": np.repeat(np.arange(len(s)), k),
+                "cand": escolhidos.ravel(),
+                "QT_VOTOS": votos.ravel(),
+            })
+            out = s.iloc[rows["sec"].values].reset_index(drop=True)
+            out["NR_VOTAVEL"] = cand["nr_votavel"].values[rows["cand"].values]
+            out["NM_VOTAVEL"] = cand["nm_votavel"].values[rows["cand"].values]
+            out["SQ_CANDIDATO"] = cand["sq_candidato"].values[rows["cand"].values]
+            out["QT_VOTOS"] = rows["QT_VOTOS"].values
+
+            esp = s.iloc[np.repeat(np.arange(len(s)), len(especiais))].reset_index(drop=True)
+            esp["NR_VOTAVEL"] = np.tile(especiais["nr_votavel"].values, len(s))
+            esp["NM_VOTAVEL"] = np.tile(especiais["nm_votavel"].values, len(s))
+            esp["SQ_CANDIDATO"] = -1
+            esp["QT_VOTOS"] = rng.integers(1, 15, len(esp))
+
+            out = pd.concat([out, esp], ignore_index=True)
+            out["CD_CARGO"] = cd_cargo
+            out["DS_CARGO"] = ds_cargo
+            for col, value in fixed.items():
+                out[col] = value
+
+            out[VOTACAO_COLUMNS].to_csv(
+                path, sep=";", encoding="latin1", index=False, header=first,
+                mode="w" if first else "a", quoting=1
+            )
+            first = False
+            n_rows += len(out)
+    return n_rows
+
+
+def write_censo_mun(mun, path, seed=0):
+    rng = np.random.default_rng(seed + 3)
+    n = len(mun)
+    df = pd.DataFrame({
+        "ano": 2022,
+        "sigla_uf": "PR",
+        "id_municipio": mun["id_municipio_ibge"],
+        "domicilios": (mun["populacao"] / rng.uniform(2.6, 3.2, n)).astype(int),
+        "populacao": mun["populacao"],
+        "area": (mun["dx"] * mun["dy"] * 111 * 102).astype(int),
+        "taxa_alfabetizacao": rng.uniform(88, 99, n).round(2),
+        "idade_mediana": rng.integers(30, 42, n),
+        "razao_sexo": rng.uniform(92, 104, n).round(2),
+        "indice_envelhecimento": rng.uniform(40, 140, n).round(2),
+    })
+    df.to_csv(path, index=False, sep=",", encoding="utf-8")
+
+
+def write_censo_sec(mun, path, scale=1.0, seed=0):
+    """Setores censitários: faixas verticais dentro de cada município, geometria em WKT"""
+    rng = np.random.default_rng(seed + 4)
+    n_set = max(1, int(round(SETORES_POR_MUNICIPIO * scale)))
+    mun_idx = np.repeat(mun["idx"].values, n_set)
+    j = np.tile(np.arange(n_set), len(mun))
+    m = mun.iloc[mun_idx]
+    x0 = m["minx"].values + j * m["dx"].values / n_set
+    x1 = x0 + m["dx"].values / n_set
+    y0 = m["miny"].values
+    y1 = y0 + m["dy"].values
+    # Polígonos com vértices intermediários, para que o WKT tenha um tamanho realista
+    n_vert = 40
+    t = np.linspace(0, 1, n_vert)
+    geometria = []
+    for a, b, c, d in zip(x0, x1, y0, y1):
+        xs = np.concatenate([a + (b - a) * t, np.full(n_vert, b), b - (b - a) * t, np.full(n_vert, a)])
+        ys = np.concatenate([np.full(n_vert, c), c + (d - c) * t, np.full(n_vert, d), d - (d - c) * t])
+        coords = ", ".join(f"{x:.7f} {y:.7f}" for x, y in zip(np.append(xs, xs[0]), np.append(ys, ys[0])))
+        geometria.append(f"MULTIPOLYGON ((({coords})))")
+
+    pessoas = rng.poisson(np.repeat(mun["populacao"].values / n_set, n_set))
+    domicilios = np.maximum(1, (pessoas / rng.uniform(2.5, 3.3, len(pessoas))).astype(int))
+    df = pd.DataFrame({
+        "id_uf": 41,
+        "id_municipio": m["id_municipio_ibge"].values,
+        "id_setor_censitario": m["id_municipio_ibge"].values.astype(np.int64) * 10**8 + j,
+        "area": ((x1 - x0) * (y1 - y0) * 111 * 102).round(4),
+        "geometria": geometria,
+        "pessoas": pessoas,
+        "domicilios": domicilios,
+        "domicilios_particulares": domicilios,
+        "domicilios_coletivos": 0,
+        "domicilios_particulares_ocupados": (domicilios * 0.9).astype(int),
+        "media_moradores_domicilios": (pessoas / domicilios).round(2),
+        "porcentagem_domicilios_imputados": rng.uniform(0, 5, len(pessoas)).round(2),
+    })
+    df.to_csv(path, index=False, sep=",", encoding="utf-8")
+    return len(df)
+
+
+def write_rais(mun, path, scale=1.0, seed=0, chunk=500_000):
+    """Microdados de vínculos RAIS no layout da consulta do Base dos Dados"""
+    rng = np.random.default_rng(seed + 5)
+    n_total = max(1, int(VINCULOS_RAIS * scale))
+    prob = (mun["populacao"] / mun["populacao"].sum()).values
+    written = 0
+    first = True
+    while written < n_total:
+        n = min(chunk, n_total - written)
+        mun_idx = rng.choice(len(mun), n, p=prob)
+        idade = rng.integers(16, 75, n)
+        rem = np.round(rng.lognormal(0.6, 0.6, n), 2)
+        df = pd.DataFrame({
+            "ano": 2022,
+            "sigla_uf": "PR",
+            "id_municipio": mun["id_municipio_ibge"].values[mun_idx],
+            "valor_remuneracao_dezembro_sm": np.round(rem * rng.uniform(0.9, 1.2, n), 2),
+            "valor_remuneracao_media_sm": rem,
+            "cnae_1": rng.integers(1000, 9999, n),
+            "idade": idade,
+            "faixa_etaria": np.clip(idade // 10, 1, 8),
+            "grau_instrucao_apos_2005": rng.integers(1, 12, n),
+            "nacionalidade": 10,
+            "sexo": rng.integers(1, 3, n),
+            "raca_cor": rng.choice([1, 2, 4, 6, 8, 9], n),
+            "indicador_portador_deficiencia": (rng.random(n) < 0.01).astype(int),
+        })
+        df.to_csv(path, index=False, sep=",", encoding="utf-8", header=first, mode="w" if first else "a")
+        first = False
+        written += n
+    return written
+
+
+def write_extra(mun, path, seed=0):
+    """Índice Brasileiro de Conectividade (mesmas colunas da tabela extra)"""
+    rng = np.random.default_rng(seed + 6)
+    n = len(mun)
+    df = pd.DataFrame({
+        "ano": 2022,
+        "sigla_uf": "PR",
+        "id_municipio": mun["id_municipio_ibge"],
+        "ibc": rng.uniform(30, 80, n).round(2),
+        "cobertura_pop_4g5g": rng.uniform(60, 100, n).round(2),
+        "fibra": rng.integers(0, 2, n),
+        "densidade_smp": rng.uniform(50, 130, n).round(2),
+        "hhi_smp": rng.integers(2500, 6000, n),
+        "densidade_scm": rng.uniform(5, 40, n).round(2),
+        "hhi_scm": rng.integers(1000, 8000, n),
+        "adensamento_estacoes": rng.uniform(0, 5, n).round(3),
+    })
+    df.to_csv(path, index=False, sep=",", encoding="utf-8")
+
+
+def write_mapa_cod(mun, path):
+    mun[["id_municipio_tse", "id_municipio_ibge"]].to_csv(path, index=False)
+
+
+def generate(out_dir, scale=1.0, n_municipios=399, seed=0):
+    """
+    Gera todos os arquivos de entrada em out_dir, com a mesma estrutura de pastas do projeto.
+    Retorna o dicionário de caminhos (mesmas chaves de config.FILES) e as contagens de linhas.
+    """
+    files = {
+        "votacao": os.path.join(out_dir, "dados_info", "votacao_secao_2022_PR", "votacao_secao_2022_PR.csv"),
+        "censo_mun": os.path.join(out_dir, "censo-municipio.csv"),
+        "censo_sec": os.path.join(out_dir, "censo-setor-censitario.csv"),
+        "rais": os.path.join(out_dir, "RAIS-PR-2022.csv"),
+        "extra": os.path.join(out_dir, "IndiceBrConectividadePR2022.csv"),
+        "shp_mun": os.path.join(out_dir, "dados_info", "PR_Municipios_2022", "PR_Municipios_2022.shp"),
+        # A mesma malha sintética serve de base para a geo_mun
+        "shp_geo_mun": os.path.join(out_dir, "dados_info", "PR_Municipios_2022", "PR_Municipios_2022.shp"),
+        "mapa_cod": os.path.join(out_dir, "mapa-cod-municipio.csv"),
+    }
+    os.makedirs(out_dir, exist_ok=True)
+
+    print(f"Gerando dados sintéticos (scale={scale}, municípios={n_municipios}) em {out_dir}...")
+    mun = build_municipios(n_municipios, seed)
+    counts = {"municipios": len(mun)}
+    write_shapefile(mun, files["shp_mun"])
+    write_mapa_cod(mun, files["mapa_cod"])
+    write_censo_mun(mun, files["censo_mun"], seed)
+    write_extra(mun, files["extra"], seed)
+    counts["censo_sec"] = write_censo_sec(mun, files["censo_sec"], scale, seed)
+    counts["rais"] = write_rais(mun, files["rais"], scale, seed)
+    counts["votacao"] = write_votacao(mun, files["votacao"], scale, seed)
+    print(f"  - Linhas geradas: {counts}")
+    return files, counts
@@ -0,0 +1,192 @@
+"""
+Transferência binária entre Postgres e pandas/Arrow (sem passar números por texto).
+
+Leitura: com o driver ADBC do Postgres (adbc-driver-postgresql, opcional), o resultado
+vem por COPY binário direto para uma pyarrow.Table; sem ele, cai no pd.read_sql.
+
+Escrita: o DataFrame é codificado aqui no formato binário do COPY (vetorizado com numpy)
+e enviado pela conexão psycopg2 do DatabaseManager, dentro da transação de quem chama.
+Colunas bytea e geometry recebem os bytes como estão (para geometry, WKB/EWKB, que é o formato
+binário do PostGIS). Colunas de tipos sem codificação binária aqui (ex.: numeric) fazem a escrita
+cair no COPY em CSV.
+"""
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import adbc_driver_postgresql.dbapi as adbc
+except ImportError:
+    adbc = None
+
+# Tipos do Postgres com codificação binária de largura fixa (big-endian)
+_FIXED_TYPES = {"int2": ">i2", "int4": ">i4", "int8": ">i8", "float4": ">f4", "float8": ">f8", "bool": ">?"}
+_TEXT_TYPES = {"text", "varchar", "bpchar", "name"}
+# Tipos gravados com os bytes da célula sem conversão (geometry: WKB/EWKB)
+_BYTES_TYPES = {"bytea", "geometry"}
+
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + np.array([0, 0], dtype=">i4").tobytes()
+_COPY_TRAILER = np.array([-1], dtype=">i2").tobytes()
+
+
+def _adbc_connection(db):
+    """Conexão ADBC reaproveitada pelo DatabaseManager (criada na primeira chamada)"""
+    conn = getattr(db, "_adbc_conn", None)
+    if conn is None:
+        c = db.db_config
+        uri = f"postgresql://{c['user']}:{c['password']}@{c['host']}:{c['port']}/{c['dbname']}"
+        # autocommit: leituras não deixam transações abertas segurando locks nas tabelas
+        conn = adbc.connect(uri, autocommit=True)
+        with conn.cursor() as cur:
+            cur.execute(f"SET search_path TO {db.schema}, public")
+        db._adbc_conn = conn
+    return conn
+
+
+def _positional(sql, params):
+    """Converte %(nome)s para $1, $2, ... (sintaxe do ADBC) e devolve os valores na ordem"""
+    if not params:
+        return sql.replace("%%", "%"), None
+    order = []
+
+    def placeholder(match):
+        name = match.group(1)
+        if name not in order:
+            order.append(name)
+        return f"${order.index(name) + 1}"
+
+    sql = re.sub(r"%\((\w+)\)s", placeholder, sql).replace("%%", "%")
+    return sql, tuple(params[name] for name in order)
+
+
+def read_arrow(db, sql, params=None):
+    """Executa `sql` (parâmetros %(nome)s) e retorna uma pyarrow.Table"""
+    import pyarrow as pa
+    if adbc is None or any(isinstance(v, (list, tuple)) for v in (params or {}).values()):
+        # Sem ADBC (ou com parâmetros de lista, que o ADBC não vincula): leitura pelo driver
+        return pa.Table.from_pandas(pd.read_sql(sql, db.engine, params=params), preserve_index=False)
+    sql, args = _positional(sql, params)
+    with _adbc_connection(db).cursor() as cur:
+        cur.execute(sql, args)
+        return cur.fetch_arrow_table()
+
+
+def read_frame(db, sql, params=None):
+    """Como read_arrow, mas retorna um DataFrame (inteiros anuláveis e numeric -> float64, como em stream_query)"""
+    import pyarrow as pa
+    table = read_arrow(db, sql, params)
+    # numeric (SUM, divisões) chega como decimal, ou como texto opaco no ADBC; para análise, float64
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        if isinstance(field.type, pa.BaseExtensionType) and (field.metadata or {}).get(b"ADBC:postgresql:typname") == b"numeric":
+            column = pa.chunked_array([chunk.storage for chunk in column.chunks], type=field.type.storage_type)
+        elif not pa.types.is_decimal(field.type):
+            continue
+        table = table.set_column(i, field.name, column.cast(pa.float64()))
+    nullable_ints = {pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype()}
+    return table.to_pandas(types_mapper=nullable_ints.get)
+
+
+def _column_types(cur, schema, table, columns):
+    cur.execute("""
+        SELECT a.attname, t.typname
+        FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+    """, (f"{schema}.{table}",))
+    types = dict(cur.fetchall())
+    return [types[c] for c in columns]
+
+
+def _check_integers(col, typ, s, dtype):
+    """O COPY em texto recusaria esses valores; a conversão numpy os truncaria/estouraria em silêncio"""
+    if s.empty:
+        return
+    values = s.to_numpy(dtype=np.float64) if not pd.api.types.is_integer_dtype(s.dtype) else s.to_numpy()
+    if values.dtype.kind == "f" and not np.all(np.mod(values, 1) == 0):
+        raise ValueError(f"Valores não inteiros na coluna {col} ({typ})")
+    info = np.iinfo(dtype)
+    if values.min() < info.min or values.max() > info.max:
+        raise ValueError(f"Valores fora da faixa de {typ} na coluna {col}")
+
+
+def encode_binary_copy(df, types):
+    """
+    Codifica df no formato binário do COPY. `types` são os tipos do Postgres
+    (typname) de cada coluna, na ordem de df.columns. Retorna bytes.
+    """
+    n = len(df)
+    ncols = len(df.columns)
+    columns = []  # (comprimento declarado, bytes de dados por linha, bytes concatenados)
+    for col, typ in zip(df.columns, types):
+        s = df[col]
+        null = s.isna().to_numpy()
+        if typ in _FIXED_TYPES:
+            dtype = np.dtype(_FIXED_TYPES[typ])
+            if dtype.kind == "i":
+                _check_integers(col, typ, s[~null], dtype)
+            values = s.fillna(0).to_numpy(dtype=dtype.newbyteorder("=")).astype(dtype)
+            data = values.view(np.uint8).reshape(n, dtype.itemsize)[~null].ravel()
+            size = np.where(null, 0, dtype.itemsize)
+        elif typ in _TEXT_TYPES or typ in _BYTES_TYPES:
+            if typ in _BYTES_TYPES:
+                cells = np.array([bytes(v) for v in s.where(~null, b"").to_numpy(dtype=object)], dtype=object)
+            elif isinstance(s.dtype, pd.CategoricalDtype):
+                # Cada categoria é codificada uma vez; as linhas só indexam os códigos
+                encoded = np.array([str(c).encode("utf-8") for c in s.cat.categories] + [b""], dtype=object)
+                cells = encoded[s.cat.codes.to_numpy()]
+            else:
+                cells = np.array([str(v).encode("utf-8") for v in s.where(~null, "").to_numpy(dtype=object)],
+                                 dtype=object)
+            size = np.fromiter((len(b) for b in cells), dtype=np.int64, count=n)
+            size[null] = 0
+            data = np.frombuffer(b"".join(cells[~null]), dtype=np.uint8)
+        else:
+            raise TypeError(f"Tipo sem codificação binária: {col} ({typ})")
+        columns.append((np.where(null, -1, size).astype(">i4"), size, data))
+
+    # Posição de cada linha e de cada campo dentro do buffer
+    row_size = 2 + sum(4 + size for _, size, _ in columns)
+    row_start = len(_COPY_HEADER) + (np.cumsum(row_size) - row_size).astype(np.int64)
+    total = len(_COPY_HEADER) + int(row_size.sum()) + len(_COPY_TRAILER)
+    buf = np.zeros(total, dtype=np.uint8)
+    buf[:len(_COPY_HEADER)] = np.frombuffer(_COPY_HEADER, dtype=np.uint8)
+    buf[-len(_COPY_TRAILER):] = np.frombuffer(_COPY_TRAILER, dtype=np.uint8)
+
+    buf[row_start[:, None] + np.arange(2)] = np.frombuffer(np.array([ncols], dtype=">i2").tobytes(), dtype=np.uint8)
+    field_start = row_start + 2
+    for declared, size, data in columns:
+        buf[field_start[:, None] + np.arange(4)] = declared.view(np.uint8).reshape(n, 4)
+        if len(data):
+            present = size > 0
+            starts = field_start[present] + 4
+            lengths = size[present]
+            offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            buf[offsets + np.arange(len(data))] = data
+        field_start = field_start + 4 + size
+    return buf.tobytes()
+
+
+def write_frame(db, df, table, cur=None):
+    """
+    Acrescenta df à tabela existente {schema}.{table} por COPY binário (colunas = df.columns).
+    Usa `cur` (ou db.cur) e não faz commit, para participar da transação de quem chama.
+    """
+    cur = cur or db.cur
+    if df.empty:
+        return 0
+    columns = list(df.columns)
+    column_list = ", ".join(columns)
+    try:
+        types = _column_types(cur, db.schema, table, columns)
+        payload = encode_binary_copy(df, types)
+        copy_sql = f"COPY {db.schema}.{table} ({column_list}) FROM STDIN WITH (FORMAT binary)"
+    except TypeError:
+        # Tipos sem codificação binária: mantém o COPY em CSV
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, sep=";")
+        payload = buffer.getvalue().encode("utf-8")
+        copy_sql = f"COPY {db.schema}.{table} ({column_list}) FROM STDIN WITH (FORMAT csv, DELIMITER ';')"
+    cur.copy_expert(sql=copy_sql, file=io.BytesIO(payload))
+    return len(df)
@@ -1,66 +1,58 @@
-import pandas as pd
-import geopandas as gpd
-import matplotlib.pyplot as plt
-from sqlalchemy import create_engine
+import os
+import sys
 import warnings
-from mgwr.gwr import GWR, MGWR
-from mgwr.sel_bw import Sel_BW
-from libpysal.weights import DistanceBand
 import numpy as np
-import importlib
+
+# Módulos do db_builder com imports planos (ex.: spatial_weights), como no cli.py.
+# config e instrumentation também: são os mesmos módulos (e o mesmo tracer) que o db_manager usa
+_DB_BUILDER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db_builder")
+if _DB_BUILDER_DIR not in sys.path:
+    sys.path.insert(0, _DB_BUILDER_DIR)
+
+import config
+from instrumentation import tracer
+
+# geopandas, matplotlib e mgwr são importados dentro das funções que os usam:
+# importar este módulo (ex.: pelo cli.py ou pelo benchmark) não carrega essas bibliotecas
 
 # Ignorar warnings futuros
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-# --- Configurações do Banco de Dados ---
-DB_CONFIG = {
-    "user": "usuario",
-    "password": "senha",
-    "host": "localhost",
-    "port": "5432",
-    "dbname": "geodata",
-    "schema": "public"
-}
-
-# --- Conexão com o Banco de Dados ---
-try:
-    conn_str = f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}"
-    engine = create_engine(conn_str)
-    print("Conexão com o banco de dados estabelecida com sucesso.")
-except Exception as e:
-    print(f"Erro ao conectar ao banco de dados: {e}")
-    exit()
-
-def fetch_data():
+def fetch_data(db=None):
     """
     Busca dados socioeconômicos e de votação para o candidato configurado.
+    `db`: DatabaseManager ou DuckDBManager do db_builder; sem ele, abre (e fecha) o backend das
+    análises (db_manager.open_analysis_db). O resultado é lido em blocos (queries.read_streamed).
     """
+    import geopandas as gpd
+    from db_manager import open_analysis_db
+    from queries import read_streamed
     print("Buscando dados para a análise GWR...")
-    config = importlib.import_module('db_builder.config')
     candidate_slug = getattr(config, 'CANDIDATE_SLUG', 'candidate')
     candidate_name = getattr(config, 'CANDIDATE_NAME', 'CANDIDATE')
 
     vot_table = f"votacao_dep_{candidate_slug}"
 
-    # Use the candidate-specific processed table and a generic column name 'percentual_candidato'
-    query = f"""
-    SELECT
-        g."CD_MUN" AS cd_municipio_ibge,
-        g.geometry,
-        c.taxa_alfabetizacao,
-        c.idade_mediana,
-        r.remuneracao_media,
-        e.cobertura_pop_4g5g,
-            v.percentual_candidato
-    FROM {DB_CONFIG['schema']}.municipios_pr_2022 g
-    LEFT JOIN {DB_CONFIG['schema']}.censo_mun c ON CAST(g."CD_MUN" AS INTEGER) = c.id_municipio
-    LEFT JOIN {DB_CONFIG['schema']}.rais_agg r ON CAST(g."CD_MUN" AS INTEGER) = r.id_municipio
-    LEFT JOIN {DB_CONFIG['schema']}.extra e ON CAST(g."CD_MUN" AS INTEGER) = e.id_municipio
-        LEFT JOIN {DB_CONFIG['schema']}.{vot_table} v ON CAST(g."CD_MUN" AS INTEGER) = v.id_municipio;
-    """
-    
+    own_db = db is None
     try:
-        gdf = gpd.read_postgis(query, engine, geom_col='geometry')
+        if own_db:
+            db = open_analysis_db()
+        # Use the candidate-specific processed table and a generic column name 'percentual_candidato'
+        # Censo, RAIS e conectividade vêm juntos da atributos_mun (uma linha por município)
+        query = f"""
+        SELECT
+            g."CD_MUN" AS cd_municipio_ibge,
+            g.geometry,
+            a.taxa_alfabetizacao,
+            a.idade_mediana,
+            a.remuneracao_media,
+            a.cobertura_pop_4g5g,
+            v.percentual_candidato
+        FROM {db.schema}.{config.SHP_MUN_TABLE} g
+        LEFT JOIN {db.schema}.atributos_mun a ON CAST(g."CD_MUN" AS INTEGER) = a.id_municipio
+        LEFT JOIN {db.schema}.{vot_table} v ON CAST(g."CD_MUN" AS INTEGER) = v.id_municipio
+        """
+        gdf = read_streamed(db, query, geom_col='geometry')
         print(f"Dados carregados. Total de {len(gdf)} municípios.")
         gdf.rename(columns={
             'taxa_alfabetizacao': 'Taxa_Alfabetizacao',
@@ -74,6 +66,9 @@ def fetch_data():
     except Exception as e:
         print(f"Erro ao buscar dados: {e}")
         return gpd.GeoDataFrame()
+    finally:
+        if own_db and db is not None:
+            db.close()
 
 def preprocess_for_gwr(gdf):
     """
@@ -101,17 +96,24 @@ def preprocess_for_gwr(gdf):
     
     return y, X, coords, x_names, gdf
 
-def perform_gwr(y, X, coords):
+def perform_gwr(y, X, coords, bandwidth=None):
     """
     Realiza a análise GWR.
+    Com `bandwidth` (número de vizinhos mais próximos do kernel adaptativo), pula a busca do Sel_BW.
     """
+    from mgwr.gwr import GWR
+    from mgwr.sel_bw import Sel_BW
     print("Iniciando análise GWR...")
     
-    # Encontra a largura de banda (bandwidth) ótima
-    print("  - Encontrando a largura de banda ótima...")
-    gwr_selector = Sel_BW(coords, y, X)
-    gwr_bw = gwr_selector.search()
-    print(f"  - Largura de banda ótima encontrada: {gwr_bw}")
+    if bandwidth is None:
+        # Encontra a largura de banda (bandwidth) ótima
+        print("  - Encontrando a largura de banda ótima...")
+        gwr_selector = Sel_BW(coords, y, X)
+        gwr_bw = gwr_selector.search()
+        print(f"  - Largura de banda ótima encontrada: {gwr_bw}")
+    else:
+        gwr_bw = bandwidth
+        print(f"  - Largura de banda fixa: {gwr_bw} vizinhos mais próximos")
     
     # Executa o modelo GWR
     print("  - Executando o modelo GWR...")
@@ -121,10 +123,26 @@ def perform_gwr(y, X, coords):
     print("  - Análise GWR concluída.")
     return gwr_results
 
+def residual_autocorrelation(gdf, gwr_results):
+    """
+    I de Moran dos resíduos do GWR, com pesos por distância (spatial_weights: KNN, ou a banda
+    de distância se DB_BUILDER_WEIGHTS=distance). Autocorrelação significativa indica
+    estrutura espacial que o modelo não explicou.
+    """
+    from esda.moran import Moran
+    from spatial_weights import weights_from_frame
+    kind = "distance" if config.SPATIAL_WEIGHTS == "distance" else "knn"
+
+    w = weights_from_frame(gdf, kind=kind)
+    moran = Moran(np.asarray(gwr_results.resid_response).ravel(), w)
+    print(f"  - Moran dos resíduos ({kind}): I = {moran.I:.4f}, p-valor = {moran.p_sim:.4f}")
+    return moran
+
 def analyze_and_visualize(gdf, gwr_results, x_names):
     """
     Analisa os resultados e gera visualizações.
     """
+    import matplotlib.pyplot as plt
     print("Gerando mapas de resultados GWR...")
     
     # Adiciona os resultados ao GeoDataFrame
@@ -179,26 +197,39 @@ def analyze_and_visualize(gdf, gwr_results, x_names):
     print("  - Mapas de coeficientes salvos em 'gwr_mapas_coeficientes.png'.")
 
 
-def main():
+def main(db=None):
     """
-    Orquestra a execução da análise GWR.
+    Orquestra a execução da análise GWR (`db`: ver fetch_data).
     """
     print("--- Iniciando Análise Extra: Regressão Geograficamente Ponderada (GWR) ---")
+    tracer.configure(output=config.TRACE_FILE, explain_sample=config.TRACE_EXPLAIN_SAMPLE)
     
-    gdf = fetch_data()
-    
-    if gdf.empty:
-        print("Nenhum dado retornado do banco. A análise não pode continuar.")
-        return
+    try:
+        with tracer.stage("gwr.fetch_data"):
+            gdf = fetch_data(db)
+            tracer.add_rows(rows_out=len(gdf))
         
-    y, X, coords, x_names, gdf_clean = preprocess_for_gwr(gdf)
-    
-    gwr_results = perform_gwr(y, X, coords)
-    
-    analyze_and_visualize(gdf_clean, gwr_results, x_names)
-    
-    print("\n--- Análise GWR concluída com sucesso! ---")
-    print("Arquivos gerados: 'gwr_mapa_r2_local.png', 'gwr_mapas_coeficientes.png'")
+        if gdf.empty:
+            print("Nenhum dado retornado do banco. A análise não pode continuar.")
+            return
+            
+        with tracer.stage("gwr.preprocess", rows_in=len(gdf)):
+            y, X, coords, x_names, gdf_clean = preprocess_for_gwr(gdf)
+            tracer.add_rows(rows_out=len(gdf_clean))
+        
+        with tracer.stage("gwr.fit", rows_in=len(gdf_clean)):
+            gwr_results = perform_gwr(y, X, coords, config.GWR_BANDWIDTH)
+
+        with tracer.stage("gwr.residual_moran"):
+            residual_autocorrelation(gdf_clean, gwr_results)
+        
+        with tracer.stage("gwr.plots"):
+            analyze_and_visualize(gdf_clean, gwr_results, x_names)
+        
+        print("\n--- Análise GWR concluída com sucesso! ---")
+        print("Arquivos gerados: 'gwr_mapa_r2_local.png', 'gwr_mapas_coeficientes.png'")
+    finally:
+        tracer.finish()
 
 if __name__ == "__main__":
     main()
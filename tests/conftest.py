@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do db_builder usam imports planos (from config import ...), como no cli.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db_builder"))
+
+# Schema próprio dos testes no banco do docker-compose.yml (apagado ao final)
+TEST_SCHEMA = "teste_db_builder"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """DatabaseManager em um schema de teste; o teste é pulado se o Postgres não estiver no ar"""
+    import psycopg2
+    import config
+    from db_manager import DatabaseManager
+
+    monkeypatch.setitem(config.DB_CONFIG, "schema", TEST_SCHEMA)
+    try:
+        manager = DatabaseManager()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres indisponível: {e}")
+    manager.create_schema()
+    try:
+        yield manager
+    finally:
+        manager.conn.rollback()
+        manager.cur.execute(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE")
+        manager.conn.commit()
+        manager.close()
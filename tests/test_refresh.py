@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import config
+import synthetic_data
+
+AGGREGATES = {
+    "votos_mun": ["cd_municipio", "nr_votavel"],
+    "votos_mun_partido": ["cd_municipio", "nr_partido"],
+    "total_votos_mun": ["cd_municipio"],
+}
+
+
+def read_aggregates(db):
+    frames = {}
+    for table, key in AGGREGATES.items():
+        df = db.read_sql(f"SELECT * FROM {db.schema}.{table}")
+        frames[table] = df.sort_values(key).reset_index(drop=True)
+    return frames
+
+
+def partial_file(votacao, out_dir):
+    """
+    Arquivo do TSE parcial/corrigido com três municípios: votos alterados, linhas removidas
+    (inclusive todas as de um candidato em um município), uma seção nova e um candidato novo.
+    """
+    raw = pd.read_csv(votacao, sep=";", encoding="latin1")
+    dep = raw[raw["DS_CARGO"] == "DEPUTADO ESTADUAL"]
+    muns = dep["CD_MUNICIPIO"].unique()[:3]
+    part = dep[dep["CD_MUNICIPIO"].isin(muns)].copy()
+    rng = np.random.default_rng(0)
+
+    changed = part.sample(50, random_state=1).index
+    part.loc[changed, "QT_VOTOS"] += rng.integers(1, 20, len(changed))
+    part = part.drop(part.sample(20, random_state=2).index)
+    gone = part.iloc[0]
+    part = part[~((part["CD_MUNICIPIO"] == gone["CD_MUNICIPIO"]) & (part["NR_VOTAVEL"] == gone["NR_VOTAVEL"]))]
+
+    # Uma linha por (seção, votável), como no arquivo do TSE
+    first = part.iloc[0]
+    new_section = part[(part["CD_MUNICIPIO"] == first["CD_MUNICIPIO"]) & (part["NR_ZONA"] == first["NR_ZONA"])
+                       & (part["NR_SECAO"] == first["NR_SECAO"])].copy()
+    new_section["NR_SECAO"] = 999
+    new_candidate = part.drop_duplicates(["CD_MUNICIPIO", "NR_ZONA", "NR_SECAO"]).iloc[:3].copy()
+    new_candidate["NR_VOTAVEL"] = 99999
+    new_candidate["NM_VOTAVEL"] = "CANDIDATO NOVO"
+    part = pd.concat([part, new_section, new_candidate])
+
+    path = os.path.join(out_dir, "parcial.csv")
+    part.to_csv(path, sep=";", encoding="latin1", index=False)
+    return path
+
+
+def test_refresh_matches_full_rebuild(db, tmp_path, monkeypatch):
+    files, _ = synthetic_data.generate(str(tmp_path), scale=0.01, seed=1)
+    for key, path in files.items():
+        monkeypatch.setitem(config.FILES, key, path)
+
+    db.load_resultados_secao()
+    db.build_aggregate_tables()
+    db.publish_tables()
+
+    path = partial_file(files["votacao"], str(tmp_path))
+    counts = db.refresh_resultados_secao(path)
+    assert counts is not None
+    assert counts["inseridas"] > 0 and counts["atualizadas"] > 0 and counts["removidas"] > 0
+    refreshed = read_aggregates(db)
+
+    # Recalcula os agregados do zero sobre a resultados_secao já atualizada
+    db.build_aggregate_tables()
+    db.publish_tables()
+    rebuilt = read_aggregates(db)
+
+    for table in AGGREGATES:
+        pd.testing.assert_frame_equal(refreshed[table], rebuilt[table], check_dtype=False, obj=table)
+
+    # O mesmo arquivo de novo não muda nada
+    assert db.refresh_resultados_secao(path) == {"removidas": 0, "inseridas": 0, "atualizadas": 0}
@@ -0,0 +1,116 @@
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from transfer import encode_binary_copy, write_frame
+
+SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+def decode_binary_copy(payload):
+    """Lê de volta o formato binário do COPY: lista de linhas com os bytes de cada campo (None = NULL)"""
+    assert payload[:11] == SIGNATURE
+    flags, extension = struct.unpack(">ii", payload[11:19])
+    assert (flags, extension) == (0, 0)
+    pos = 19
+    rows = []
+    while True:
+        (nfields,) = struct.unpack(">h", payload[pos:pos + 2])
+        pos += 2
+        if nfields == -1:
+            break
+        row = []
+        for _ in range(nfields):
+            (length,) = struct.unpack(">i", payload[pos:pos + 4])
+            pos += 4
+            if length == -1:
+                row.append(None)
+            else:
+                row.append(payload[pos:pos + length])
+                pos += length
+        rows.append(row)
+    assert pos == len(payload), "bytes depois do trailer"
+    return rows
+
+
+def sample_frame():
+    return pd.DataFrame({
+        "i2": pd.array([1, None, -32768, 32767], dtype="Int16"),
+        "i4": np.array([0, -1, 2**31 - 1, 7], dtype="int32"),
+        "i8": np.array([2**40, 0, -5, 1], dtype="int64"),
+        "f8": [1.5, np.nan, -0.25, 1e300],
+        "f4": np.array([0.5, 2.0, -1.0, 3.25], dtype="float32"),
+        "b": [True, False, True, False],
+        "t": ["JOSÉ", None, "", "a;b\n\"c\""],
+        "cat": pd.Categorical(["SÃO PAULO", None, "CURITIBA", "SÃO PAULO"]),
+        "raw": [b"\x01\x00\xff", None, b"", bytes(range(5))],
+    })
+
+
+TYPES = ["int2", "int4", "int8", "float8", "float4", "bool", "varchar", "text", "bytea"]
+
+
+def test_header_trailer_and_field_lengths():
+    df = sample_frame()
+    payload = encode_binary_copy(df, TYPES)
+    assert payload.endswith(b"\xff\xff")
+    rows = decode_binary_copy(payload)
+    assert len(rows) == len(df)
+    widths = {"int2": 2, "int4": 4, "int8": 8, "float8": 8, "float4": 4, "bool": 1}
+    for row in rows:
+        assert len(row) == len(df.columns)
+        for field, typ in zip(row, TYPES):
+            if field is not None and typ in widths:
+                assert len(field) == widths[typ]
+
+
+def test_values_round_trip():
+    df = sample_frame()
+    rows = decode_binary_copy(encode_binary_copy(df, TYPES))
+    formats = {"int2": ">h", "int4": ">i", "int8": ">q", "float8": ">d", "float4": ">f", "bool": ">?"}
+    for i, row in enumerate(rows):
+        for col, typ, field in zip(df.columns, TYPES, row):
+            expected = df[col].iloc[i]
+            if pd.isna(expected) if not isinstance(expected, bytes) else False:
+                assert field is None, (col, i)
+            elif typ in formats:
+                assert struct.unpack(formats[typ], field)[0] == expected, (col, i)
+            elif typ == "bytea":
+                assert field == expected, (col, i)
+            else:
+                assert field.decode("utf-8") == expected, (col, i)
+
+
+def test_all_null_and_empty_frames():
+    df = pd.DataFrame({"a": pd.array([None, None], dtype="Int32"), "t": [None, None]})
+    assert decode_binary_copy(encode_binary_copy(df, ["int4", "text"])) == [[None, None], [None, None]]
+    empty = encode_binary_copy(df.iloc[:0], ["int4", "text"])
+    assert empty == SIGNATURE + b"\x00" * 8 + b"\xff\xff"
+
+
+def test_rejects_values_the_column_cannot_hold():
+    with pytest.raises(ValueError):
+        encode_binary_copy(pd.DataFrame({"a": [40000]}), ["int2"])
+    with pytest.raises(ValueError):
+        encode_binary_copy(pd.DataFrame({"a": [1.5]}), ["int4"])
+    with pytest.raises(TypeError):
+        encode_binary_copy(pd.DataFrame({"a": [1]}), ["numeric"])
+
+
+def test_write_frame_round_trip(db):
+    db.cur.execute(f"""
+    CREATE TABLE {db.schema}.copia (
+        i2 smallint, i4 int, i8 bigint, f8 float8, f4 float4, b boolean, t varchar, cat text, raw bytea
+    )""")
+    df = sample_frame()
+    assert write_frame(db, df, "copia") == len(df)
+    db.cur.execute(f"SELECT * FROM {db.schema}.copia")
+    back = db.cur.fetchall()
+    db.conn.commit()
+    expected = [
+        tuple(None if (not isinstance(v, bytes) and pd.isna(v)) else v for v in row)
+        for row in df.astype(object).itertuples(index=False)
+    ]
+    assert [tuple(bytes(v) if isinstance(v, memoryview) else v for v in row) for row in back] == expected